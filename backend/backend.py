@@ -1,8 +1,23 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, RedirectResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from spaces_storage import SpacesStorage
+from spaces_storage import storage_from_env
+from render_queue import QueueFullError, render_queue_from_env
+from task_store import task_store_from_env
+from ollama_client import ollama_client_from_env
+from task_events import TaskEventBus
+from renderer import RenderResult, render_limits_from_env, run_manim, warm_pool_from_env
+from code_validator import code_validator_from_env
+from code_repair import manim_exception_name, repair_budget_from_env, summarize_manim_error
+from speculative import Candidate, race_candidates, speculative_config_from_env
+from render_cost import estimate_render_cost
+from hls import HlsPublisher
+from render_cache import render_cache_from_env
+from llm_cache import llm_cache_from_env, normalize_prompt
+from singleflight import SingleFlight
+from metrics import registry
+from tracing import tracer
 
 from pydantic import BaseModel
 import tempfile
@@ -10,14 +25,18 @@ import os
 import uuid
 from pathlib import Path
 import asyncio
-from typing import Optional
+from typing import Awaitable, Callable, Optional
+from contextlib import aclosing
 from enum import Enum
-import httpx
+from dataclasses import dataclass
+from datetime import datetime
 import time
 from collect_data import DataCollector
 from pydantic import BaseModel
 import logging
 import shutil 
+import hashlib
+import json
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,6 +45,32 @@ OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 SYSTEM_PROMPT_PATH = os.getenv('SYSTEM_PROMPT_PATH', 'backend/system_prompt.txt')
 logger.info(f"Starting backend server with SYSTEM_PROMPT_PATH: {SYSTEM_PROMPT_PATH}")
 
+# Shared Ollama client; started and closed with the app
+ollama_client = ollama_client_from_env(OLLAMA_HOST)
+
+# Stream tokens from Ollama and publish partial code while the model is still generating
+LLM_STREAM = os.getenv("LLM_STREAM", "true").lower() in ("1", "true", "yes")
+LLM_PROGRESS_INTERVAL = float(os.getenv("LLM_PROGRESS_INTERVAL", "0.5"))
+RENDER_PROGRESS_INTERVAL = float(os.getenv("RENDER_PROGRESS_INTERVAL", "0.5"))
+# How often status streams re-read the task store to catch updates from other workers
+STATUS_STREAM_REFRESH = float(os.getenv("STATUS_STREAM_REFRESH", "2"))
+# Render a quick preview before the requested quality; the final pass is skipped once
+# nobody has polled the task for PREVIEW_ABANDON_SECONDS or the preview got negative feedback
+PROGRESSIVE_RENDER = os.getenv("PROGRESSIVE_RENDER", "false").lower() in ("1", "true", "yes")
+PREVIEW_QUALITY = os.getenv("PREVIEW_QUALITY", "-ql")
+PREVIEW_ABANDON_SECONDS = float(os.getenv("PREVIEW_ABANDON_SECONDS", "60"))
+PREVIEW_CHECK_INTERVAL = 2.0
+# Clients poll often, so last_seen is written to the task store at most this often
+LAST_SEEN_WRITE_INTERVAL = 5.0
+# Running tasks that no client has polled or streamed for this long are cancelled (0 disables)
+TASK_ABANDON_SECONDS = float(os.getenv("TASK_ABANDON_SECONDS", "120"))
+REAP_INTERVAL = 10.0
+# Publish renders expected to run at least HLS_MIN_ANIMATION_SECONDS as an HLS playlist
+# while manim is still rendering, so playback starts before the final video is uploaded
+HLS_OUTPUT = os.getenv("HLS_OUTPUT", "false").lower() in ("1", "true", "yes")
+HLS_MIN_ANIMATION_SECONDS = float(os.getenv("HLS_MIN_ANIMATION_SECONDS", "20"))
+HLS_TARGET_DURATION = int(os.getenv("HLS_TARGET_DURATION", "10"))
+
 def get_ollama_url() -> str:
     """Get the appropriate Ollama URL based on the environment."""
     # Check if running in Docker
@@ -38,6 +83,9 @@ class TaskStatus(str, Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
+
+FINISHED_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED)
 
 class AnimationRequest(BaseModel):
     prompt: str
@@ -54,6 +102,27 @@ class GenerationStatus(BaseModel):
     code_url: Optional[str] = None 
     error: Optional[str] = None
     used_fallback: Optional[bool] = None 
+    stage: Optional[str] = None
+    partial_code: Optional[str] = None
+    llm_tokens: Optional[int] = None
+    syntax_error: Optional[str] = None
+    validation_error: Optional[dict] = None
+    repair_attempt: Optional[int] = None
+    repair_error: Optional[str] = None
+    render_usage: Optional[dict] = None
+    render_cost: Optional[dict] = None
+    preview_url: Optional[str] = None
+    final_skipped: Optional[str] = None
+    manifest_url: Optional[str] = None
+    stream_url: Optional[str] = None
+    render_progress: Optional[dict] = None
+    render_cache_hit: Optional[bool] = None
+    llm_cache_hit: Optional[bool] = None
+    coalesced_with: Optional[str] = None
+    queue_position: Optional[int] = None
+    queue_depth: Optional[int] = None
+    queue_wait_time: Optional[float] = None
+    estimated_wait_time: Optional[float] = None
 
 
 class FeedbackRequest(BaseModel):
@@ -76,52 +145,89 @@ class {class_name}(Scene):
         self.wait()
 '''
 
+def build_llm_prompt(system_prompt: str, prompt: str) -> str:
+    return f"{system_prompt}\n\nUser request: {prompt}\n\nGenerate Manim code for this request."
+
+def build_repair_prompt(system_prompt: str, prompt: str, code: str, error_summary: str) -> str:
+    return (f"{system_prompt}\n\nUser request: {prompt}\n\n"
+            f"This Manim code was generated for the request but failed:\n```python\n{code}\n```\n\n"
+            f"Error:\n{error_summary}\n\n"
+            f"Fix the error and return the complete corrected Manim code.")
+
+async def complete_manim_code(llm_prompt: str,
+                              on_progress: Optional[Callable[[str, int], None]] = None,
+                              kind: str = "generate", **options) -> str:
+    """Send a prompt to Ollama and extract the code from its answer. Raises if the LLM call fails.
+
+    With LLM_STREAM enabled, tokens are consumed as they arrive and
+    ``on_progress(partial_code, token_count)`` is called periodically.
+    ``kind`` labels the call's latency metric (generate, repair or candidate).
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with tracer.span("llm", kind=kind, model=ollama_client.model, stream=LLM_STREAM) as span:
+            if LLM_STREAM:
+                code = await stream_manim_code(llm_prompt, on_progress, **options)
+            else:
+                code = sanitize_manim_code(await ollama_client.generate(llm_prompt, **options))
+            if span:
+                span.set(code_chars=len(code))
+        outcome = "ok"
+        return code
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        llm_seconds.observe(time.perf_counter() - start, kind=kind, outcome=outcome)
+
+async def request_manim_code(prompt: str, system_prompt: str,
+                             on_progress: Optional[Callable[[str, int], None]] = None) -> str:
+    """Ask Ollama for Manim code. Raises if the LLM call fails."""
+    return await complete_manim_code(build_llm_prompt(system_prompt, prompt), on_progress)
+
+async def request_repaired_code(prompt: str, system_prompt: str, code: str, error_summary: str,
+                                on_progress: Optional[Callable[[str, int], None]] = None) -> str:
+    """Ask Ollama to fix code that failed validation or rendering. Raises if the LLM call fails."""
+    return await complete_manim_code(build_repair_prompt(system_prompt, prompt, code, error_summary), on_progress,
+                                     kind="repair")
+
 # TODO rename prompt here to user request
-async def generate_manim_code_with_llm(prompt: str) -> str:
+async def generate_manim_code_with_llm(prompt: str,
+                                       on_progress: Optional[Callable[[str, int], None]] = None) -> str:
     """Generate Manim code using Ollama. Falls back to template if LLM fails."""
     with open(SYSTEM_PROMPT_PATH, "r") as f:
         system_prompt = f.read()
     
     try:
-        # ollama_url = get_ollama_url()
-        # logger.info(f"Attempting to connect to Ollama at: {ollama_url}")  # Debug log
-        print(f"Attempting to connect to Ollama at: {OLLAMA_HOST}")
-        # async with httpx.AsyncClient() as client:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            try: 
-                version_check = await client.get(f"{OLLAMA_HOST}/api/version")
-                print(f"Version check response: {version_check.status_code}")
-            except Exception as e:
-                print(f"Version check failed: {str(e)}")
-
-            print(f"Making generate request to: {OLLAMA_HOST}/api/generate")
-            response = await client.post(
-                f"{OLLAMA_HOST}/api/generate",
-                json={
-                    "model": "mistral",
-                    "prompt": f"{system_prompt}\n\nUser request: {prompt}\n\nGenerate Manim code for this request.",
-                    "stream": False
-                },
-                timeout=120.0
-            )
-      
-            # Additional logging for debugging
-            if response.status_code != 200:
-                logger.error(f"Ollama API error: {response.status_code} - {response.text}")
-                print(f"Error response from Ollama: {response.status_code}")
-                print(f"Response content: {response.text}")
-                raise Exception(f"Ollama API returned status code {response.status_code}")
-                              
-            response.raise_for_status()
-            result = response.json()
-            return sanitize_manim_code(result['response'])
+        return await request_manim_code(prompt, system_prompt, on_progress)
 
     except Exception as e:
-        print(f"LLM generation failed: {str(e)}, falling back to template")
         # Fall back to template generation if LLM fails
-        print(f"Full error details: {type(e).__name__}: {str(e)}")  # Enhanced error logging
+        logger.warning(f"LLM generation failed, falling back to template: {type(e).__name__}: {e}")
         return generate_manim_code(prompt)
 
+async def stream_manim_code(llm_prompt: str,
+                            on_progress: Optional[Callable[[str, int], None]] = None, **options) -> str:
+    """Consume Ollama's token stream until the code block is complete."""
+    sanitizer = StreamingCodeSanitizer()
+    tokens = 0
+    last_progress = 0.0
+    async with aclosing(ollama_client.generate_stream(llm_prompt, **options)) as stream:
+        async for chunk in stream:
+            sanitizer.feed(chunk.get("response", ""))
+            tokens += 1
+            if on_progress and time.time() - last_progress >= LLM_PROGRESS_INTERVAL:
+                on_progress(sanitizer.code, tokens)
+                last_progress = time.time()
+            # Stop as soon as the closing fence arrives; the model often keeps
+            # going with an explanation we don't use
+            if sanitizer.complete:
+                break
+    if on_progress:
+        on_progress(sanitizer.code, tokens)
+    return sanitizer.code
+
 def sanitize_class_name(prompt: str) -> str:
     """Ensure the class name is a valid Python identifier."""
     sanitized = "".join(x for x in prompt.title() if x.isalnum())
@@ -161,6 +267,79 @@ def sanitize_manim_code(code: str) -> str:
         
     return '\n'.join(lines)
 
+class StreamingCodeSanitizer:
+    """Incremental version of sanitize_manim_code for streamed LLM output.
+
+    Feed it response fragments as they arrive; ``code`` is the cleaned code
+    seen so far and ``complete`` turns true once a fenced code block has
+    been closed.
+    """
+
+    def __init__(self):
+        self.raw = ""
+        self.complete = False
+        self._block_start: Optional[int] = None
+        self._block_end: Optional[int] = None
+        # Where to resume searching for the closing fence
+        self._scan_from = 0
+
+    def feed(self, fragment: str):
+        if self.complete or not fragment:
+            return
+        self.raw += fragment
+        if self._block_start is None:
+            fence = self.raw.find("```")
+            if fence == -1:
+                return
+            newline = self.raw.find("\n", fence)
+            if newline == -1:
+                # Language tag not finished yet
+                return
+            self._block_start = newline + 1
+            self._scan_from = self._block_start
+        closing = self.raw.find("```", self._scan_from)
+        if closing != -1:
+            self._block_end = closing
+            self.complete = True
+        else:
+            # Keep two characters back in case a fence is split across fragments
+            self._scan_from = max(self._block_start, len(self.raw) - 2)
+
+    @property
+    def code(self) -> str:
+        if self._block_start is None:
+            # No fence (yet): treat the whole response as code, as sanitize_manim_code does
+            return sanitize_manim_code(self.raw)
+        block = self.raw[self._block_start:self._block_end]
+        if not self.complete:
+            # Drop the start of a closing fence that hasn't fully arrived
+            block = block.rstrip("`")
+        return sanitize_manim_code(block)
+
+class ManimRenderError(Exception):
+    """manim exited with an error while rendering the generated code."""
+
+    def __init__(self, message: str, stderr: str, reason: Optional[str] = None):
+        super().__init__(message)
+        self.stderr = stderr
+        # Set when a sandbox limit (timeout, cpu_limit, ...) stopped the render
+        self.reason = reason
+
+class CodeValidationError(Exception):
+    """Generated code failed static validation and was not sent to manim."""
+
+    def __init__(self, issue):
+        super().__init__(f"Validation error: {issue}")
+        self.issue = issue
+
+def check_syntax(code: str) -> Optional[str]:
+    """Return a short description of the first syntax error, or None if the code compiles."""
+    try:
+        compile(code, "scene.py", "exec")
+        return None
+    except SyntaxError as e:
+        return f"SyntaxError at line {e.lineno}: {e.msg}"
+
 app = FastAPI(title="Manim Animation Generator",
              description="API for generating mathematical animations using Manim",
              version="1.0.0")
@@ -170,199 +349,782 @@ MEDIA_DIR = Path("./media")
 MEDIA_DIR.mkdir(exist_ok=True)
 (MEDIA_DIR / "videos").mkdir(exist_ok=True)
 app.mount("/videos", StaticFiles(directory=str(MEDIA_DIR / "videos")), name="videos")
-spaces_client = SpacesStorage()
+spaces_client = storage_from_env(MEDIA_DIR / "videos")
 
-async def generate_animation(task_id: str, prompt: str, options: dict):
-    """Background task for animation generation."""
-    # output_dir = MEDIA_DIR / task_id
-    output_dir = Path("./temp") / task_id
-    output_dir.mkdir(parents=True, exist_ok=True)
-    output_file = output_dir / "animation.mp4"
+async def render_scene(code: str, code_file: Path, quality_flag: str, media_dir: Path, output_file: Path,
+                       on_progress: Optional[Callable[[int, int], None]] = None,
+                       disable_caching: bool = False) -> RenderResult:
+    """Render on a warm worker if the pool is up, otherwise with the manim CLI."""
+    start = time.perf_counter()
+    result = None
+    with tracer.span("render", quality=quality_flag) as span:
+        if render_pool is not None:
+            result = await render_pool.render(code, code_file, quality_flag, media_dir, output_file,
+                                              on_progress=on_progress, disable_caching=disable_caching)
+        if span:
+            span.set(backend="warm" if result is not None else "cli")
+        if result is None:
+            result = await run_manim(code_file, quality_flag, media_dir, output_file, on_progress=on_progress,
+                                     limits=render_limits, disable_caching=disable_caching)
+        if span:
+            span.set(returncode=result.returncode, failure_reason=result.failure_reason,
+                     resource_usage=result.resource_usage)
+            if result.returncode != 0:
+                span.status = "error"
+    if result.failure_reason:
+        logger.warning(f"Render of {code_file} stopped: {result.failure_reason} ({result.resource_usage})")
+    outcome = "ok" if result.returncode == 0 else (result.failure_reason or "error")
+    render_seconds.observe(time.perf_counter() - start, quality=quality_flag, outcome=outcome)
+    return result
 
-    generation_start = time.time()
-    llm_start = time.time()
-    used_fallback = False
-    sanitization_changes = []
+def render_qualities(options: dict) -> tuple[Optional[str], str]:
+    """Quality flags for the preview pass (None when there isn't one) and the final pass."""
+    quality_flag = "-ql" if options.get("quality") == "low" else "-qh"
+    if PROGRESSIVE_RENDER and quality_flag != PREVIEW_QUALITY:
+        return PREVIEW_QUALITY, quality_flag
+    return None, quality_flag
+
+def final_pass_skip_reason(task_id: str, since: float) -> Optional[str]:
+    """Why the full-quality render of a task with a preview is no longer worth doing, if it isn't.
+
+    Looks at the task and the requests coalesced with it: any negative
+    feedback on the preview, or none of them polled or streamed since
+    PREVIEW_ABANDON_SECONDS ago (counting from ``since`` at the earliest).
+    """
+    watchers = watching_tasks(task_id)
+    if any(task.get("user_feedback") is False for task in watchers):
+        return "negative_feedback"
+    if time.time() - max([since] + [task.get("last_seen") or 0 for task in watchers]) > PREVIEW_ABANDON_SECONDS:
+        return "viewer_left"
+    return None
+
+async def unless_abandoned(task_id: str, since: float, work: Awaitable):
+    """Await ``work``, cancelling it if final_pass_skip_reason finds a reason meanwhile.
 
+    Returns (result, None), or (None, reason) when the work was cancelled.
+    """
+    job = asyncio.ensure_future(work)
     try:
-        generation_tasks[task_id].update({
-            "status": TaskStatus.PROCESSING,
-        })
-        # Generate code using LLM
+        while True:
+            done, _ = await asyncio.wait([job], timeout=PREVIEW_CHECK_INTERVAL)
+            if done:
+                return job.result(), None
+            reason = final_pass_skip_reason(task_id, since)
+            if reason is not None:
+                job.cancel()
+                await asyncio.gather(job, return_exceptions=True)
+                return None, reason
+    finally:
+        job.cancel()
+
+def error_class(e: Exception) -> str:
+    """Coarse class of a failure for metrics: validation kind, render limit or exception name."""
+    if isinstance(e, CodeValidationError):
+        return f"validation:{e.issue.kind}"
+    if isinstance(e, ManimRenderError):
+        return f"render:{e.reason or manim_exception_name(e.stderr or '') or 'error'}"
+    return type(e).__name__
+
+def render_error_message(result: RenderResult) -> str:
+    if result.failure_reason and render_limits is not None:
+        return f"Render stopped: {render_limits.describe(result.failure_reason)}"
+    return f"Manim error: {result.stderr}"
+
+async def generate_speculatively(task_id: str, prompt: str, system_prompt: str, options: dict,
+                                 output_dir: Path, output_file: Path,
+                                 on_code_progress: Callable[[str, int], None]
+                                 ) -> tuple[str, Optional[RenderResult], dict]:
+    """Race SPECULATIVE_CANDIDATES generations and keep the first that renders.
+
+    Returns (code, render result, summary). The render result is set when the
+    chosen code was already rendered at the first pass's quality
+    (successfully, with the video moved to output_file, or with the error to
+    repair from). The other candidates are logged as rejected halves of
+    preference pairs. Raises if no candidate got code out of the LLM.
+    """
+    # Candidates race at the quality of the first render pass
+    preview_flag, final_flag = render_qualities(options)
+    quality_flag = preview_flag or final_flag
+    llm_prompt = build_llm_prompt(system_prompt, prompt)
+    client = (task_store.get(task_id) or {}).get("client")
+    publish_render_progress = render_progress_publisher(task_id)
+
+    async def generate(candidate: Candidate) -> str:
+        # Only the first candidate streams its partial code to the status endpoint
+        on_progress = on_code_progress if candidate.index == 0 else None
+        return await complete_manim_code(llm_prompt, on_progress, kind="candidate", options=candidate.options)
+
+    def validate(code: str) -> Optional[str]:
+        if code_validator is None:
+            return check_syntax(code)
+        with validation_seconds.time(), tracer.span("validate") as span:
+            issue = code_validator.validate(code)
+            if span:
+                span.set(issue=issue.kind if issue else None)
+        return str(issue) if issue is not None else None
+
+    async def render(candidate: Candidate) -> RenderResult:
+        candidate_dir = output_dir / f"candidate-{candidate.index}"
+        candidate_dir.mkdir(parents=True, exist_ok=True)
+        code_file = candidate_dir / "scene.py"
+        code_file.write_text(candidate.code)
+
+        queued_at = time.time()
+
+        async def run():
+            tracer.record("queue_wait", queued_at, time.time())
+            update_task(task_id, {"stage": "rendering"})
+            result = await render_scene(candidate.code, code_file, quality_flag, candidate_dir,
+                                        candidate_dir / "animation.mp4", on_progress=publish_render_progress)
+            if result.returncode == 0 and not (candidate_dir / "animation.mp4").exists():
+                return RenderResult(returncode=1, stdout=result.stdout, stderr="Video file not generated")
+            return result
+
+        update_task(task_id, {"stage": "queued"})
+        estimate = estimate_render_cost(candidate.code, quality_flag)
+        return await render_queue.submit(f"{task_id}:candidate-{candidate.index}", run,
+                                         cost=estimate.cost if estimate else None, flow=client)
+
+    with tracer.span("speculative_race", candidates=speculative_config.candidates) as span:
+        winner, candidates = await race_candidates(speculative_config, generate, validate, render)
+        if span:
+            span.set(winner=winner.index if winner else None)
+
+    chosen = winner or next((c for c in candidates if c.outcome == "render_failed"), None) \
+        or next((c for c in candidates if c.outcome == "invalid"), None)
+    if chosen is None:
+        raise Exception("; ".join(f"candidate {c.index}: {c.error or c.outcome}" for c in candidates))
+    prerendered = chosen.render_result
+    if winner is not None:
+        shutil.move(str(output_dir / f"candidate-{winner.index}" / "animation.mp4"), str(output_file))
+
+    for candidate in candidates:
+        if candidate is chosen or candidate.code is None:
+            continue
+        result = candidate.render_result
+        await data_collector.log_attempt(
+            id=f"{task_id}-candidate-{candidate.index}",
+            prompt=prompt,
+            code=candidate.code,
+            task_data={"status": candidate.outcome, "error": candidate.error},
+            system_prompt=system_prompt,
+            generation_metadata={
+                "llm_response_time": candidate.llm_time,
+                "used_fallback_template": False,
+                "llm_options": candidate.options,
+                "speculative": {
+                    "task_id": task_id,
+                    "candidate": candidate.index,
+                    "outcome": candidate.outcome,
+                    # The winner is logged under the task id; this candidate is the rejected side
+                    "preferred_attempt_id": task_id if winner is not None else None,
+                },
+            },
+            stdout=result.stdout if result else None,
+            stderr=result.stderr if result else None,
+            render_time=candidate.render_time
+        )
+
+    summary = {
+        "candidates": len(candidates),
+        "chosen": chosen.index,
+        "won": winner is not None,
+        "options": chosen.options,
+        "outcomes": {c.index: c.outcome for c in candidates},
+    }
+    return chosen.code, prerendered, summary
+
+# Tail of manim's output kept in the task manifest
+MANIFEST_LOG_CHARS = 20000
+
+def task_manifest(task_id: str, prompt: str, options: dict, code: str, attempt: int, **fields) -> dict:
+    """Metadata uploaded next to the video as manifest.json."""
+    return {
+        "task_id": task_id,
+        "prompt": prompt,
+        "options": options,
+        "attempt": attempt,
+        "code": code,
+        "updated_at": datetime.now().isoformat(),
+        **fields,
+    }
+
+def render_log(stdout: Optional[str], stderr: Optional[str]) -> Optional[dict]:
+    if stdout is None and stderr is None:
+        return None
+    return {"stdout": (stdout or "")[-MANIFEST_LOG_CHARS:], "stderr": (stderr or "")[-MANIFEST_LOG_CHARS:]}
+
+async def upload_artifacts(task_id: str, manifest: dict, code: Optional[str] = None,
+                           after: Optional[asyncio.Task] = None):
+    """Upload a task's manifest, and its code if given, concurrently from memory.
+
+    Runs once the previous upload (after) is done: repair attempts rewrite the
+    same keys, and waiting keeps an older attempt from overwriting newer ones.
+    """
+    if after is not None:
+        await asyncio.gather(after, return_exceptions=True)
+    uploads = [spaces_client.upload_manifest(manifest, task_id)]
+    if code is not None:
+        uploads.append(spaces_client.upload_code(code, task_id))
+    manifest_url, *code_url = await asyncio.gather(*uploads)
+    if manifest_url is None:
+        logger.warning(f"Failed to upload the manifest for task {task_id}")
+    updates = {"manifest_url": manifest_url}
+    if code is not None:
+        if code_url[0] is None:
+            logger.warning(f"Failed to upload code for task {task_id}, continuing without code URL")
+        updates["code_url"] = code_url[0]
+    update_task(task_id, updates)
+
+def render_progress_publisher(task_id: str) -> Callable[[int, int], None]:
+    """on_progress callback that writes render progress to the task at most every RENDER_PROGRESS_INTERVAL."""
+    last_progress = 0.0
+
+    def publish(animation: int, percent: int):
+        nonlocal last_progress
+        if time.time() - last_progress >= RENDER_PROGRESS_INTERVAL or percent == 100:
+            update_task(task_id, {"render_progress": {"animation": animation, "percent": percent}})
+            last_progress = time.time()
+
+    return publish
+
+class AttemptRender:
+    """Renders and uploads the video for one attempt's code.
+
+    ``run`` serves the render cache or renders the preview and final passes.
+    The last pass's logs, resource usage and cost estimate are kept for the
+    task's manifest, attempt log and repair prompt, also when it fails.
+    """
+
+    def __init__(self, task_id: str, code: str, output_dir: Path, client: Optional[str]):
+        self.task_id = task_id
+        self.code = code
+        self.output_dir = output_dir
+        self.client = client
+        self.code_file: Optional[Path] = None
+        self.video_url: Optional[str] = None
+        self.preview_url: Optional[str] = None
+        self.final_skipped: Optional[str] = None
+        self.cache_hit = False
+        self.stdout: Optional[str] = None
+        self.stderr: Optional[str] = None
+        self.usage: Optional[dict] = None
+        self.cost: Optional[dict] = None
+
+    def cached(self, quality_flag: str) -> Optional[str]:
+        return render_cache.get(render_cache.key(self.code, quality_flag)) if render_cache else None
+
+    async def run(self, preview_flag: Optional[str], quality_flag: str, output_file: Path, preview_file: Path,
+                  prerendered: Optional[RenderResult], since: float, deadline: Optional[float] = None):
+        """Produce the video, and a preview first when preview_flag is set.
+
+        ``prerendered`` is used for the first pass, which has to finish by
+        ``deadline`` (a time.time() value) when one is given. The final pass is
+        skipped (keeping the preview) once final_pass_skip_reason finds a reason.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.code_file = Path(temp_dir) / "scene.py"
+            self.code_file.write_text(self.code)
+            logger.debug(f"Task {self.task_id} scene written to {self.code_file}:\n{self.code}")
+
+            self.video_url = self.cached(quality_flag)
+            self.cache_hit = self.video_url is not None
+            if self.cache_hit:
+                # Identical scene already rendered at this quality: skip manim and the upload
+                logger.info(f"Render cache hit for task {self.task_id}")
+                self.stdout, self.stderr = "Served from render cache", ""
+            elif preview_flag is None:
+                self.video_url = await self.first_pass(quality_flag, output_file, "animation.mp4", prerendered,
+                                                       deadline)
+            else:
+                # Publish a quick preview, then render the requested quality while it's watched
+                self.preview_url = self.cached(preview_flag) \
+                    or await self.first_pass(preview_flag, preview_file, "preview.mp4", prerendered, deadline)
+                update_task(self.task_id, {"preview_url": self.preview_url, "stage": "preview_ready"})
+                self.final_skipped = final_pass_skip_reason(self.task_id, since)
+                if self.final_skipped is None:
+                    try:
+                        self.video_url, self.final_skipped = await unless_abandoned(
+                            self.task_id, since, self.render_pass(quality_flag, output_file, "animation.mp4", None)
+                        )
+                    except Exception as final_error:
+                        # The preview is good, so finish with it rather than repairing at full quality
+                        logger.warning(f"Final render of task {self.task_id} failed, keeping the preview: "
+                                       f"{type(final_error).__name__}: {final_error}")
+                        self.final_skipped = "final_render_failed"
+                if self.final_skipped is not None:
+                    logger.info(f"Skipped the final render of task {self.task_id}: {self.final_skipped}")
+                    self.video_url = self.preview_url
+                    update_task(self.task_id, {"final_skipped": self.final_skipped})
+
+    async def first_pass(self, quality_flag: str, output_file: Path, filename: str,
+                         prerendered: Optional[RenderResult], deadline: Optional[float]) -> str:
+        """render_pass, stopped with a ManimRenderError once ``deadline`` passes."""
+        work = self.render_pass(quality_flag, output_file, filename, prerendered)
+        if deadline is None:
+            return await work
         try:
-            code = await generate_manim_code_with_llm(prompt)
-            used_fallback = False
-        except Exception as e:
-            code = generate_manim_code(prompt)
-            used_fallback = True
+            return await asyncio.wait_for(work, timeout=max(deadline - time.time(), 0))
+        except asyncio.TimeoutError:
+            raise ManimRenderError("Render stopped: the repair deadline passed", self.stderr or "")
+
+    async def render_pass(self, quality_flag: str, output_file: Path, filename: str,
+                          prerendered: Optional[RenderResult]) -> str:
+        """Render and upload the scene at one quality; returns the video URL."""
+        estimate = estimate_render_cost(self.code, quality_flag)
+        self.cost = estimate.to_dict() if estimate else None
+        cache_key = render_cache.key(self.code, quality_flag) if render_cache else None
+
+        # Identical code rendering at the same time is only rendered and uploaded once
+        with tracer.span("render_pass", quality=quality_flag, file=filename) as span:
+            (result, url, error), shared = await render_flight.do(
+                cache_key or (self.code, quality_flag),
+                lambda: self._render_and_upload(quality_flag, output_file, filename, prerendered, cache_key)
+            )
+            if span:
+                span.set(shared=shared, prerendered=prerendered is not None)
+                if error:
+                    span.status = "error"
+                    span.set(error=error[:500])
+        if shared:
+            logger.info(f"Task {self.task_id} reused an in-flight render of the same code")
+        self.stdout, self.stderr = result.stdout, result.stderr
+        self.usage = result.resource_usage
+        if self.usage:
+            update_task(self.task_id, {"render_usage": self.usage})
+        if result.returncode != 0:
+            raise ManimRenderError(error, result.stderr, result.failure_reason)
+        if error:
+            raise Exception(error)
+        return url
+
+    async def _render_and_upload(self, quality_flag: str, output_file: Path, filename: str,
+                                 prerendered: Optional[RenderResult], cache_key: Optional[str]
+                                 ) -> tuple[RenderResult, Optional[str], Optional[str]]:
+        """Returns (render result, video URL, error)."""
+        if prerendered is not None:
+            # Already rendered while racing speculative candidates
+            result = prerendered
+        else:
+            result = await self._render(quality_flag, output_file, filename)
+        if result.returncode != 0:
+            return result, None, render_error_message(result)
+        if not output_file.exists():
+            return result, None, "Video file not generated"
+
+        # Upload to storage bucket
+        update_task(self.task_id, {"stage": "uploading"})
+        url = await spaces_client.upload_video(output_file, self.task_id, filename=filename, quality_flag=quality_flag)
+        if not url:
+            return result, None, "Failed to upload video to storage"
+
+        if render_cache:
+            render_cache.put(cache_key, url, output_file.stat().st_size)
+        return result, url, None
+
+    async def _render(self, quality_flag: str, output_file: Path, filename: str) -> RenderResult:
+        publisher = None
+        if HLS_OUTPUT and (self.cost is None or self.cost["animation_seconds"] >= HLS_MIN_ANIMATION_SECONDS):
+            publisher = HlsPublisher(
+                spaces_client, self.task_id, self.output_dir, quality_flag, prefix=f"hls/{Path(filename).stem}",
+                target_duration=HLS_TARGET_DURATION,
+                on_playlist=lambda url: update_task(self.task_id, {"stream_url": url})
+            )
+        on_progress = render_progress_publisher(self.task_id)
+        queued_at = time.time()
+
+        async def render():
+            tracer.record("queue_wait", queued_at, time.time())
+            update_task(self.task_id, {"stage": "rendering"})
+            # Numbered partial movie files are what the HLS publisher turns into segments
+            return await render_scene(self.code, self.code_file, quality_flag, self.output_dir, output_file,
+                                      on_progress=on_progress, disable_caching=publisher is not None)
+
+        # Wait for a free render worker instead of starting manim right away;
+        # the scheduler uses the cost estimate to run cheap scenes first
+        update_task(self.task_id, {"stage": "queued", "render_cost": self.cost})
+        watcher = asyncio.create_task(publisher.watch()) if publisher else None
+        try:
+            result = await render_queue.submit(
+                self.task_id, render, cost=self.cost["cost"] if self.cost else None, flow=self.client
+            )
         finally:
-            llm_time = time.time() - llm_start
+            if watcher is not None:
+                watcher.cancel()
+                await asyncio.wait([watcher])
+        if publisher is not None and result.returncode == 0:
+            stream_url = await publisher.finish()
+            if stream_url:
+                update_task(self.task_id, {"stream_url": stream_url})
+        return result
 
-        code_url = await spaces_client.upload_code(code, task_id)
-        if code_url is None:
-            logger.warning(f"Failed to upload code for task {task_id}, continuing without code URL")
+@dataclass
+class Generation:
+    """A task's code and how it was produced, updated as repairs replace the code."""
+    code: str
+    llm_time: float
+    used_fallback: bool = False
+    llm_cache_hit: bool = False
+    llm_cache_key: Optional[str] = None
+    # Result of rendering the code during a speculative race, used for its first pass
+    prerendered: Optional[RenderResult] = None
+    speculative_summary: Optional[dict] = None
+    attempt: int = 1
+    previous_attempt_id: Optional[str] = None
+    # Upload of the latest attempt's code and manifest
+    upload: Optional[asyncio.Task] = None
+    # Render of the latest attempt
+    render: Optional[AttemptRender] = None
+
+async def generate_code(task_id: str, prompt: str, system_prompt: str, options: dict, output_dir: Path,
+                        first_output: Path, on_progress: Callable[[str, int], None]) -> Generation:
+    """Code for the prompt from the LLM cache, a speculative race or one LLM call.
 
+    Falls back to the template when the LLM fails. ``first_output`` is where a
+    speculative race leaves the winner's first-pass video.
+    """
+    llm_start = time.time()
+    # Reuse a completion that already rendered successfully for this prompt
+    cached = llm_cache.get(prompt, system_prompt, ollama_client.model) if llm_cache else None
+    if cached is not None:
+        llm_cache_key, code = cached
+        return Generation(code=code, llm_time=time.time() - llm_start, llm_cache_hit=True,
+                          llm_cache_key=llm_cache_key)
 
-        generation_tasks[task_id].update({
-            "code": code,
-            "code_url": code_url,
-            "used_fallback": used_fallback  # Use the existing variable
+    try:
+        if speculative_config is not None:
+            code, prerendered, speculative_summary = await generate_speculatively(
+                task_id, prompt, system_prompt, options, output_dir, first_output, on_progress
+            )
+            return Generation(code=code, llm_time=time.time() - llm_start, prerendered=prerendered,
+                              speculative_summary=speculative_summary)
+        # Identical prompts generating at the same time share one LLM call
+        llm_key = (normalize_prompt(prompt), hash(system_prompt), ollama_client.model)
+        code, llm_shared = await llm_flight.do(
+            llm_key, lambda: request_manim_code(prompt, system_prompt, on_progress=on_progress)
+        )
+        if llm_shared:
+            logger.info(f"Task {task_id} reused an in-flight LLM call for the same prompt")
+        return Generation(code=code, llm_time=time.time() - llm_start)
+    except Exception as e:
+        logger.warning(f"LLM generation for task {task_id} failed, falling back to template: "
+                       f"{type(e).__name__}: {e}")
+        llm_fallbacks.inc()
+        return Generation(code=generate_manim_code(prompt), llm_time=time.time() - llm_start, used_fallback=True)
 
-        })
+def validate_code(task_id: str, code: str):
+    """Reject code that can't render before paying for a manim process. Raises CodeValidationError."""
+    if code_validator is not None:
+        with validation_seconds.time(), tracer.span("validate") as span:
+            issue = code_validator.validate(code)
+            if span:
+                span.set(issue=issue.kind if issue else None)
+        if issue is not None:
+            update_task(task_id, {"validation_error": issue.to_dict()})
+            raise CodeValidationError(issue)
+    update_task(task_id, {"validation_error": None})
 
-         # If this is a fallback, use a static placeholder video instead
-        if used_fallback and os.path.exists("./static/placeholder.mp4"):
-            # Use a pre-generated placeholder
-            static_video_url = f"https://{os.getenv('DOMAIN', 'theshaperotator.com')}/static/placeholder.mp4"
-            
-            generation_tasks[task_id].update({
-                "status": TaskStatus.COMPLETED,
-                "video_url": static_video_url
+def repair_error_summary(e: Exception, code: str) -> str:
+    """What went wrong with an attempt, as given to the model to fix."""
+    if isinstance(e, CodeValidationError):
+        return str(e.issue)
+    if e.reason and render_limits is not None:
+        return render_limits.describe(e.reason)
+    return summarize_manim_error(e.stderr, code)
+
+async def request_repair(task_id: str, prompt: str, system_prompt: str, code: str, error_summary: str,
+                         since: float, on_progress: Callable[[str, int], None]) -> Optional[str]:
+    """Ask the model to fix code within the repair deadline. Returns None if the request failed."""
+    update_task(task_id, {"stage": "repairing", "repair_error": error_summary})
+    try:
+        return await asyncio.wait_for(
+            request_repaired_code(prompt, system_prompt, code, error_summary, on_progress=on_progress),
+            timeout=repair_budget.remaining(since)
+        )
+    except Exception as llm_error:
+        logger.warning(f"Repair request for task {task_id} failed: {type(llm_error).__name__}: {llm_error}")
+        return None
+
+async def serve_placeholder(task_id: str, prompt: str, options: dict, generation: Generation, since: float):
+    """Complete a task whose code came from the fallback template with the static placeholder video."""
+    static_video_url = f"https://{os.getenv('DOMAIN', 'theshaperotator.com')}/static/placeholder.mp4"
+
+    update_task(task_id, {
+        "status": TaskStatus.COMPLETED,
+        "stage": "completed",
+        "video_url": static_video_url
+    })
+
+    # Still log the attempt
+    with open(SYSTEM_PROMPT_PATH, "r") as f:
+        system_prompt = f.read()
+
+    # Log the attempt with all metadata
+    generation_metadata = {
+        "llm_response_time": generation.llm_time,
+        "used_fallback_template": generation.used_fallback,
+        "sanitization_changes": [],
+        "video_type": "static_placeholder",
+        "llm_config": {
+            "model": ollama_client.model,
+            "quality": options.get("quality", "low"),
+            "resolution": options.get("resolution", "720p")
+        }
+    }
+
+    await data_collector.log_attempt(
+        id=task_id,
+        prompt=prompt,
+        code=generation.code,
+        task_data=task_store.get(task_id) or {"status": TaskStatus.COMPLETED},
+        system_prompt=system_prompt,
+        generation_metadata=generation_metadata,
+        stdout="Used static placeholder",
+        stderr="",
+        render_time=time.time() - since
+    )
+
+async def render_with_repairs(task_id: str, prompt: str, system_prompt: str, options: dict,
+                              generation: Generation, output_dir: Path, client: Optional[str], since: float,
+                              on_code_progress: Callable[[str, int], None]) -> bool:
+    """Validate, render and upload the generation's code, asking the model to repair it when that fails.
+
+    Each failed attempt is logged and its error sent back to the model, within
+    the repair budget's attempts and deadline; after that the last error is
+    raised. Returns False when the fallback template's static placeholder
+    video was served instead of a render.
+    """
+    preview_flag, quality_flag = render_qualities(options)
+    while True:
+        code = generation.code
+        generation.render = AttemptRender(task_id, code, output_dir, client)
+        try:
+            # Check syntax right away so a broken completion is reported without waiting on manim
+            update_task(task_id, {"syntax_error": check_syntax(code)})
+
+            # Upload the code and manifest while the code is validated and queued for a render
+            generation.upload = asyncio.create_task(upload_artifacts(
+                task_id, task_manifest(task_id, prompt, options, code, generation.attempt),
+                code=code, after=generation.upload
+            ))
+
+            update_task(task_id, {
+                "code": code,
+                "llm_cache_hit": generation.llm_cache_hit,
+                "used_fallback": generation.used_fallback,
+                "repair_attempt": generation.attempt,
             })
-            
-            # Still log the attempt
-            with open(SYSTEM_PROMPT_PATH, "r") as f:
-                system_prompt = f.read()
-
-            # Calculate total time
-            render_time = time.time() - generation_start
-
-            # Log the attempt with all metadata
-            generation_metadata = {
-                "llm_response_time": llm_time,
-                "used_fallback_template": used_fallback,
-                "sanitization_changes": sanitization_changes,
-                "video_type": "static_placeholder",
-                "llm_config": {
-                    "model": "mistral",
-                    "quality": options.get("quality", "low"),
-                    "resolution": options.get("resolution", "720p")
-                }
-            }
-            
+
+            # If this is a fallback, use a static placeholder video instead. Checked before
+            # validation: the template embeds the raw prompt, which may not even parse
+            if generation.used_fallback and os.path.exists("./static/placeholder.mp4"):
+                await serve_placeholder(task_id, prompt, options, generation, since)
+                return False
+
+            validate_code(task_id, code)
+
+            # A repaired attempt's render counts against the repair deadline, like its LLM call
+            deadline = since + repair_budget.deadline_seconds if generation.attempt > 1 else None
+            await generation.render.run(preview_flag, quality_flag, output_dir / "animation.mp4",
+                                        output_dir / "preview.mp4", generation.prerendered, since, deadline)
+            return True
+
+        except (CodeValidationError, ManimRenderError) as e:
+            attempt_failures.inc(error_class=error_class(e))
+            # Ask the model to fix its own code, within the task's attempt budget and deadline
+            if generation.used_fallback or repair_budget is None \
+                    or not repair_budget.allows(generation.attempt, since):
+                raise
+            error_summary = repair_error_summary(e, code)
+            if llm_cache and generation.llm_cache_hit:
+                llm_cache.invalidate(generation.llm_cache_key)
+
+            attempt_id = f"{task_id}-attempt-{generation.attempt}"
             await data_collector.log_attempt(
-                id=task_id,
+                id=attempt_id,
                 prompt=prompt,
                 code=code,
-                task_data=generation_tasks[task_id],
+                task_data={**(task_store.get(task_id) or {}), "status": TaskStatus.FAILED, "error": str(e)},
                 system_prompt=system_prompt,
-                generation_metadata=generation_metadata,
-                stdout="Used static placeholder",
-                stderr="",
-                render_time=render_time
+                generation_metadata={
+                    "llm_response_time": generation.llm_time,
+                    "used_fallback_template": generation.used_fallback,
+                    "llm_cache_hit": generation.llm_cache_hit,
+                    "repair": {
+                        "task_id": task_id,
+                        "attempt": generation.attempt,
+                        "previous_attempt_id": generation.previous_attempt_id,
+                        "error_summary": error_summary,
+                    },
+                    "validation_error": e.issue.to_dict() if isinstance(e, CodeValidationError) else None,
+                },
+                stdout=generation.render.stdout,
+                stderr=generation.render.stderr,
+                render_time=time.time() - since
             )
-            
+            generation.previous_attempt_id = attempt_id
+            generation.prerendered = None
+
+            logger.info(f"Task {task_id} attempt {generation.attempt} failed, asking the model for a fix: {error_summary}")
+            llm_start = time.time()
+            repaired = await request_repair(task_id, prompt, system_prompt, code, error_summary, since,
+                                            on_code_progress)
+            generation.llm_time = time.time() - llm_start
+            if repaired is None:
+                raise e
+            generation.code = repaired
+            generation.attempt += 1
+            generation.llm_cache_hit = False
+
+async def generate_animation(task_id: str, prompt: str, options: dict):
+    """Background task for animation generation."""
+    # output_dir = MEDIA_DIR / task_id
+    output_dir = Path("./temp") / task_id
+    output_dir.mkdir(parents=True, exist_ok=True)
+    preview_flag, quality_flag = render_qualities(options)
+
+    generation_start = time.time()
+    generation: Optional[Generation] = None
+    client = (task_store.get(task_id) or {}).get("client")
+    trace_root = tracer.start_trace(task_id, "generate_animation", quality=quality_flag, preview=preview_flag,
+                                    client=client)
+
+    try:
+        update_task(task_id, {
+            "status": TaskStatus.PROCESSING,
+            "stage": "generating_code",
+        })
+        def publish_partial_code(partial_code: str, tokens: int):
+            update_task(task_id, {"partial_code": partial_code, "llm_tokens": tokens})
+
+        with open(SYSTEM_PROMPT_PATH, "r") as f:
+            system_prompt = f.read()
+
+        # Generate code using LLM
+        generation = await generate_code(
+            task_id, prompt, system_prompt, options, output_dir,
+            output_dir / ("animation.mp4" if preview_flag is None else "preview.mp4"), publish_partial_code
+        )
+        if not await render_with_repairs(task_id, prompt, system_prompt, options, generation, output_dir, client,
+                                         generation_start, publish_partial_code):
             return  # Exit early, no need for video generation
-        
-        
-        with tempfile.TemporaryDirectory() as temp_dir:
-            code_file = Path(temp_dir) / "scene.py"
-            code_file.write_text(code)
-            print(f"Created temp file at: {code_file}")
-            print(f"Code contents:\n{code}")
-            
-            quality_flag = "-ql" if options.get("quality") == "low" else "-qh"
-            process = await asyncio.create_subprocess_exec(
-                "manim",
-                str(code_file),
-                quality_flag,
-                # "--media_dir", str(MEDIA_DIR.absolute()),
-                # "--output_file", str(output_file.absolute())
-                "--media_dir", str(output_dir.absolute()),
-                "--output_file", str(output_file.absolute()),
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
-            stdout_text = stdout.decode()
-            stderr_text = stderr.decode()
-            
-            if process.returncode != 0:
-                raise Exception(f"Manim error: {stderr_text}")
-            
-            if not output_file.exists():
-                raise Exception("Video file not generated")
-            
-            # Upload to storage bucket
-            video_url = await spaces_client.upload_video(output_file, task_id)
-            if not video_url:
-                raise Exception("Failed to upload video to storage")
-
-            generation_tasks[task_id].update({
-                "status": TaskStatus.COMPLETED,
-                "video_url": video_url  
-            })
+        code, render = generation.code, generation.render
 
-            # Calculate total render time
-            render_time = time.time() - generation_start
+        await generation.upload
+        update_task(task_id, {
+            "status": TaskStatus.COMPLETED,
+            "stage": "completed",
+            "video_url": render.video_url,
+            "render_cache_hit": render.cache_hit
+        })
+        await upload_artifacts(task_id, task_manifest(
+            task_id, prompt, options, code, generation.attempt,
+            status=TaskStatus.COMPLETED, video_url=render.video_url, preview_url=render.preview_url,
+            render_cache_hit=render.cache_hit, render_usage=render.usage,
+            render_log=render_log(render.stdout, render.stderr),
+        ))
 
-            # Read system prompt to log with the attempt
-            with open(SYSTEM_PROMPT_PATH, "r") as f:
-                system_prompt = f.read()
+        if llm_cache and not generation.used_fallback and not generation.llm_cache_hit:
+            llm_cache.put(prompt, system_prompt, ollama_client.model, code)
 
-            # Log the attempt with all metadata
-            generation_metadata = {
-                "llm_response_time": llm_time,
-                "used_fallback_template": used_fallback,
-                "sanitization_changes": sanitization_changes,
-                "llm_config": {
-                    "model": "mistral",
-                    "quality": options.get("quality", "low"),
-                    "resolution": options.get("resolution", "720p")
-                }
+        # Calculate total render time
+        render_time = time.time() - generation_start
+
+        # Read system prompt to log with the attempt
+        with open(SYSTEM_PROMPT_PATH, "r") as f:
+            system_prompt = f.read()
+
+        # Log the attempt with all metadata
+        generation_metadata = {
+            "llm_response_time": generation.llm_time,
+            "used_fallback_template": generation.used_fallback,
+            "sanitization_changes": [],
+            "render_cache_hit": render.cache_hit,
+            "llm_cache_hit": generation.llm_cache_hit,
+            "repair": {"attempt": generation.attempt, "previous_attempt_id": generation.previous_attempt_id},
+            "speculative": generation.speculative_summary,
+            "render_usage": render.usage,
+            "render_cost": render.cost,
+            "preview": {"quality": preview_flag, "url": render.preview_url, "final_skipped": render.final_skipped}
+            if render.preview_url else None,
+            "llm_config": {
+                "model": ollama_client.model,
+                "quality": options.get("quality", "low"),
+                "resolution": options.get("resolution", "720p")
             }
-            
-            await data_collector.log_attempt(
-                id=task_id,  # Add this line
-                prompt=prompt,
-                code=code,
-                task_data=generation_tasks[task_id],
-                system_prompt=system_prompt,
-                generation_metadata=generation_metadata,
-                stdout=stdout_text,
-                stderr=stderr_text,
-                render_time=render_time
-            )
+        }
+        
+        await data_collector.log_attempt(
+            id=task_id,  # Add this line
+            prompt=prompt,
+            code=code,
+            task_data=task_store.get(task_id) or {"status": TaskStatus.COMPLETED, "video_url": render.video_url},
+            system_prompt=system_prompt,
+            generation_metadata=generation_metadata,
+            stdout=render.stdout,
+            stderr=render.stderr,
+            render_time=render_time
+        )
 
-            # Clean up temporary files
-            try:
-                shutil.rmtree(output_dir)
-            except Exception as cleanup_error:
-                print(f"Warning during cleanup: {cleanup_error}")
+        # Clean up temporary files
+        try:
+            shutil.rmtree(output_dir)
+        except Exception as cleanup_error:
+            logger.warning(f"Cleanup of {output_dir} failed: {cleanup_error}")
                 
     except Exception as e:
         error_str = str(e)
-        print(f"Error generating animation: {error_str}")
-        generation_tasks[task_id].update({
+        logger.exception(f"Generating animation for task {task_id} failed: {error_str}")
+        task_failures.inc(error_class=error_class(e))
+        render = generation.render if generation is not None else None
+        stdout_text = render.stdout if render is not None else None
+        stderr_text = render.stderr if render is not None else None
+        if generation is not None and generation.upload is not None:
+            await asyncio.gather(generation.upload, return_exceptions=True)
+            await upload_artifacts(task_id, task_manifest(
+                task_id, prompt, options, generation.code, generation.attempt,
+                status=TaskStatus.FAILED, error=error_str,
+                render_log=render_log(stdout_text, stderr_text),
+            ))
+        update_task(task_id, {
             "status": TaskStatus.FAILED,
+            "stage": "failed",
             "error": error_str
         })
 
+        if llm_cache and generation is not None and generation.llm_cache_hit:
+            # The cached completion no longer renders (e.g. after a manim upgrade)
+            llm_cache.invalidate(generation.llm_cache_key)
+
         # Log failed attempts too
         with open(SYSTEM_PROMPT_PATH, "r") as f:
             system_prompt = f.read()
 
         generation_metadata = {
-            "llm_response_time": time.time() - llm_start,
-            "used_fallback_template": used_fallback,
-            "sanitization_changes": sanitization_changes,
+            "llm_response_time": generation.llm_time if generation is not None else None,
+            "used_fallback_template": generation.used_fallback if generation is not None else False,
+            "sanitization_changes": [],
             "llm_config": {
-                "model": "mistral",
+                "model": ollama_client.model,
                 "quality": options.get("quality", "low"),
                 "resolution": options.get("resolution", "720p")
             }
         }
+        if isinstance(e, CodeValidationError):
+            generation_metadata["validation_error"] = e.issue.to_dict()
+        if generation is not None:
+            generation_metadata["repair"] = {"attempt": generation.attempt,
+                                             "previous_attempt_id": generation.previous_attempt_id}
 
         await data_collector.log_attempt(
             id=task_id,  # Add this line
             prompt=prompt,
-            code=code if 'code' in locals() else "",
-            task_data=generation_tasks[task_id],
+            code=generation.code if generation is not None else "",
+            task_data=task_store.get(task_id) or {"status": TaskStatus.FAILED, "error": error_str},
             system_prompt=system_prompt,
             generation_metadata=generation_metadata,
-            stdout=stdout_text if 'stdout_text' in locals() else None,
-            stderr=stderr_text if 'stderr_text' in locals() else None,
+            stdout=stdout_text,
+            stderr=stderr_text,
             render_time=time.time() - generation_start
         )
 
@@ -370,7 +1132,38 @@ async def generate_animation(task_id: str, prompt: str, options: dict):
             if output_dir.exists():
                 shutil.rmtree(output_dir)
         except Exception as cleanup_error:
-            print(f"Warning during cleanup: {cleanup_error}")
+            logger.warning(f"Cleanup of {output_dir} failed: {cleanup_error}")
+    except asyncio.CancelledError:
+        if generation is not None and generation.upload is not None:
+            generation.upload.cancel()
+        # Without a cancel request this is a shutdown; leave the task for recover_orphaned_tasks
+        reason = (task_store.get(task_id) or {}).get("cancel_requested")
+        if reason is not None:
+            update_task(task_id, {
+                "status": TaskStatus.CANCELLED,
+                "stage": "cancelled",
+                "error": f"Task cancelled ({reason})"
+            })
+            shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+    finally:
+        final_status = (task_store.get(task_id) or {}).get("status")
+        status_label = TaskStatus(final_status).value if final_status in FINISHED_STATUSES else "interrupted"
+        if final_status in FINISHED_STATUSES:
+            tasks_total.inc(status=status_label)
+            generation_seconds.observe(time.time() - generation_start, status=status_label)
+        tracer.end_trace(trace_root, status=status_label)
+        render_queue.release(task_id)
+        pipeline_tasks.pop(task_id, None)
+        last_seen_written.pop(task_id, None)
+        key = coalesce_key(prompt, options)
+        if inflight_leaders.get(key) == task_id:
+            del inflight_leaders[key]
+        try:
+            await complete_followers(task_id)
+        except Exception as e:
+            logger.error(f"Failed to complete coalesced tasks for {task_id}: {e}")
+
 async def cleanup_old_videos():
     """Remove videos older than 24 hours from storage bucket"""
     try:
@@ -402,61 +1195,525 @@ TEMP_DIR.mkdir(exist_ok=True)
 
 data_collector = DataCollector(TRAINING_DIR, TEMP_DIR)
 
-# In-memory task storage
-generation_tasks: dict[str, dict] = {}
+# Task state shared by all uvicorn workers; backend chosen by TASK_STORE (sqlite by default)
+task_store = task_store_from_env()
+
+# Pushes task updates to /status/{task_id}/stream subscribers in this process
+task_events = TaskEventBus()
+
+# Render worker pool; size and admission limit come from RENDER_WORKERS / RENDER_QUEUE_MAX
+render_queue = render_queue_from_env()
+
+# CPU, memory, output size and wall-clock caps for each render (None when RENDER_SANDBOX is off)
+render_limits = render_limits_from_env()
+
+# Pre-imported manim processes that renders run on (None when RENDER_BACKEND=cli)
+render_pool = warm_pool_from_env(render_queue.num_workers, render_limits)
+
+# Static checks on generated code, backed by a cached index of manim's names (None when CODE_VALIDATION is off)
+code_validator = code_validator_from_env()
+
+# Attempt budget and deadline for asking the model to fix code that failed (None when REPAIR_MAX_ATTEMPTS <= 1)
+repair_budget = repair_budget_from_env()
+
+# Race several LLM candidates per task and keep the first that renders (None when SPECULATIVE_CANDIDATES <= 1)
+speculative_config = speculative_config_from_env()
+
+# Content-addressed index of already rendered videos (None when RENDER_CACHE is off)
+render_cache = render_cache_from_env()
+
+# Known-good LLM completions keyed on the normalized prompt (None when LLM_CACHE is off)
+llm_cache = llm_cache_from_env()
+
+# Coalescing of identical in-flight work: whole tasks at /generate, then the LLM and render stages
+llm_flight = SingleFlight("llm")
+render_flight = SingleFlight("render")
+
+# Metrics of this worker process, served by GET /metrics
+llm_seconds = registry.histogram("manim_llm_seconds", "Ollama completion time", ("kind", "outcome"))
+validation_seconds = registry.histogram("manim_validation_seconds", "Static validation time of generated code")
+render_seconds = registry.histogram("manim_render_seconds", "Render time per pass", ("quality", "outcome"))
+generation_seconds = registry.histogram("manim_generation_seconds", "End-to-end task time", ("status",))
+tasks_total = registry.counter("manim_tasks_total", "Finished tasks by status", ("status",))
+task_failures = registry.counter("manim_task_failures_total", "Failed tasks by error class", ("error_class",))
+attempt_failures = registry.counter("manim_attempt_failures_total",
+                                    "Failed generation attempts, including repaired ones, by error class",
+                                    ("error_class",))
+llm_fallbacks = registry.counter("manim_llm_fallbacks_total", "Tasks that fell back to the template after an LLM error")
+coalesced_tasks = registry.counter("manim_coalesced_tasks_total",
+                                   "Requests attached to an identical in-flight task instead of starting their own")
+registry.gauge("manim_tasks_in_progress", "Generation pipelines running", lambda: len(pipeline_tasks))
+registry.gauge("manim_render_queue_depth", "Renders waiting for a worker", lambda: render_queue.stats()["queued"])
+registry.gauge("manim_render_workers_active", "Renders in progress", lambda: render_queue.stats()["active"])
+registry.gauge("manim_render_workers", "Concurrent render slots", lambda: render_queue.num_workers)
+registry.gauge("manim_warm_workers", "Warm render worker processes",
+               lambda: len(render_pool.stats()["workers"]) if render_pool is not None else None)
+registry.gauge("manim_cache_hit_ratio", "Hit ratio of the render and LLM caches", lambda: {
+    ("render",): render_cache.stats()["hit_ratio"] if render_cache else None,
+    ("llm",): llm_cache.stats()["hit_ratio"] if llm_cache else None,
+}, ("cache",))
+# Leader task_id for each in-flight (prompt, options), and the follower tasks attached to it
+inflight_leaders: dict[str, str] = {}
+task_followers: dict[str, set[str]] = {}
+
+# When mark_seen last wrote each unfinished task's last_seen, to throttle store writes
+last_seen_written: dict[str, float] = {}
+
+# Running generation pipelines, keyed by task_id (keeps a reference so tasks aren't garbage collected)
+pipeline_tasks: dict[str, asyncio.Task] = {}
+
+# Long-running housekeeping loops started at startup
+maintenance_tasks: list[asyncio.Task] = []
+
+def _process_start_time(pid: int) -> Optional[float]:
+    """Start time of a process (epoch seconds) from /proc, or None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Field 22 is the start time in clock ticks since boot; skip past the
+            # command name, which may itself contain spaces
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError, StopIteration):
+        return None
+
+# Identifies this process as the owner of the tasks it runs, so orphans can be recovered after a restart
+PROCESS_TOKEN = f"{os.getpid()}:{_process_start_time(os.getpid())}"
+
+def update_task(task_id: str, fields: dict) -> Optional[dict]:
+    """Merge fields into a stored task and notify status stream subscribers.
+
+    Subscribers of coalesced follower tasks get the leader's updates too.
+    """
+    task = task_store.update(task_id, fields)
+    task_events.publish(task_id, task)
+    if task is not None:
+        for follower_id in task_followers.get(task_id, ()):
+            task_events.publish(follower_id, {**task, "coalesced_with": task_id})
+    return task
+
+def resolve_task(task_id: str) -> Optional[dict]:
+    """Load a task, showing the leader's progress for coalesced followers that are still running."""
+    task = task_store.get(task_id)
+    if task is None or not task.get("coalesced_with"):
+        return task
+    if task["status"] in FINISHED_STATUSES:
+        return task
+    leader = task_store.get(task["coalesced_with"])
+    if leader is None:
+        return task
+    return {**leader, "coalesced_with": task["coalesced_with"]}
+
+def mark_seen(task_id: str):
+    """Record that a client is still watching an unfinished task."""
+    now = time.time()
+    if now - last_seen_written.get(task_id, 0) < LAST_SEEN_WRITE_INTERVAL:
+        return
+    last_seen_written[task_id] = now
+    task_store.update(task_id, {"last_seen": now})
+
+def watching_tasks(task_id: str) -> list[dict]:
+    """A task and the unfinished requests coalesced with it."""
+    followers = [task_store.get(follower_id) for follower_id in task_followers.get(task_id, ())]
+    return [task_store.get(task_id) or {}] + [f for f in followers if f and f["status"] not in FINISHED_STATUSES]
+
+def cancel_reason(task_id: str) -> Optional[str]:
+    """Why a running task should be stopped: a cancel request (possibly made through
+    another worker), or nobody having watched it for TASK_ABANDON_SECONDS."""
+    watchers = watching_tasks(task_id)
+    if watchers[0].get("cancel_requested"):
+        return watchers[0]["cancel_requested"]
+    if TASK_ABANDON_SECONDS > 0:
+        last_seen = max(task.get("last_seen") or 0 for task in watchers)
+        if time.time() - last_seen > TASK_ABANDON_SECONDS:
+            return "abandoned"
+    return None
+
+async def cancel_pipeline(task_id: str, reason: str) -> bool:
+    """Cancel a task's pipeline if it runs in this process, and wait for it to unwind.
+
+    Cancellation reaches whatever the pipeline is awaiting: the Ollama
+    request, its place in the render queue, the manim process group (or warm
+    worker) and ffmpeg compression. The task is then marked cancelled.
+    """
+    pipeline = pipeline_tasks.get(task_id)
+    if pipeline is None or pipeline.done():
+        return False
+    logger.info(f"Cancelling task {task_id}: {reason}")
+    task_store.update(task_id, {"cancel_requested": reason})
+    pipeline.cancel()
+    await asyncio.gather(pipeline, return_exceptions=True)
+    return True
+
+def coalesce_key(prompt: str, options: Optional[dict]) -> str:
+    return hashlib.sha256(
+        f"{normalize_prompt(prompt)}\0{json.dumps(options or {}, sort_keys=True)}".encode()
+    ).hexdigest()
+
+async def complete_followers(leader_id: str):
+    """Copy a finished leader's result onto the tasks coalesced with it and log them."""
+    followers = task_followers.pop(leader_id, set())
+    leader = task_store.get(leader_id)
+    if not followers or leader is None:
+        return
+    with open(SYSTEM_PROMPT_PATH, "r") as f:
+        system_prompt = f.read()
+    result_fields = {key: leader.get(key) for key in
+                     ("status", "stage", "code", "code_url", "video_url", "error", "used_fallback",
+                      "render_cache_hit", "llm_cache_hit", "preview_url", "final_skipped", "stream_url")}
+    for follower_id in followers:
+        last_seen_written.pop(follower_id, None)
+        follower = update_task(follower_id, result_fields)
+        if follower is None:
+            continue
+        # Log each coalesced request on its own so feedback on it can be recorded
+        await data_collector.log_attempt(
+            id=follower_id,
+            prompt=follower.get("prompt", ""),
+            code=leader.get("code") or "",
+            task_data=follower,
+            system_prompt=system_prompt,
+            generation_metadata={
+                "coalesced_with": leader_id,
+                "used_fallback_template": bool(leader.get("used_fallback")),
+                "sanitization_changes": [],
+                "llm_response_time": None,
+                "llm_config": {
+                    "model": ollama_client.model,
+                    "quality": (follower.get("options") or {}).get("quality", "low"),
+                    "resolution": (follower.get("options") or {}).get("resolution", "720p")
+                }
+            },
+            stdout="Coalesced with an identical in-flight request",
+            stderr="",
+            render_time=None
+        )
+
+def _process_alive(token: str) -> bool:
+    """Best-effort check whether the process that owns a task is still running."""
+    if token == PROCESS_TOKEN:
+        return True
+    try:
+        pid_str, start_str = token.split(":", 1)
+        pid = int(pid_str)
+        os.kill(pid, 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    # The pid may have been reused after a container restart, so also compare start times
+    started = _process_start_time(pid)
+    if started is None or start_str == "None":
+        return True
+    return abs(started - float(start_str)) < 1.0
+
+@app.on_event("startup")
+async def start_render_queue():
+    await render_queue.start()
+    if render_pool is not None:
+        await render_pool.start()
+
+@app.on_event("startup")
+async def load_manim_symbol_index():
+    if code_validator is not None:
+        # Building the index imports manim in a subprocess; validate without name checks until then
+        maintenance_tasks.append(asyncio.create_task(code_validator.symbol_index.load()))
+
+@app.on_event("startup")
+async def start_ollama_client():
+    await ollama_client.start()
+
+@app.on_event("startup")
+async def recover_orphaned_tasks():
+    """Restart tasks whose owning process died (e.g. during a deploy)."""
+    evicted = task_store.evict_expired()
+    if evicted:
+        logger.info(f"Evicted {evicted} expired tasks")
+
+    for task_id, task in task_store.list_by_status([TaskStatus.PENDING, TaskStatus.PROCESSING]):
+        owner = task.get("owner", "")
+        if _process_alive(owner):
+            continue
+        # Compare-and-set on the owner so only one worker picks the task up
+        claimed = task_store.update(task_id, {"owner": PROCESS_TOKEN, "status": TaskStatus.PENDING,
+                                              "last_seen": time.time()},
+                                    expect={"owner": owner})
+        if claimed is None:
+            continue
+        if claimed.get("prompt") is None:
+            update_task(task_id, {"status": TaskStatus.FAILED, "error": "Task interrupted by a server restart"})
+            continue
+        logger.info(f"Restarting orphaned task {task_id}")
+        render_queue.admit(task_id, force=True)
+        pipeline_tasks[task_id] = asyncio.create_task(
+            generate_animation(task_id, claimed["prompt"], claimed.get("options") or {})
+        )
+
+    maintenance_tasks.append(asyncio.create_task(evict_expired_tasks()))
+    maintenance_tasks.append(asyncio.create_task(reap_abandoned_tasks()))
+
+async def evict_expired_tasks():
+    """Periodically drop tasks older than TASK_TTL_HOURS."""
+    while True:
+        await asyncio.sleep(3600)
+        try:
+            evicted = task_store.evict_expired()
+            if evicted:
+                logger.info(f"Evicted {evicted} expired tasks")
+            tracer.evict_files(task_store.ttl_seconds)
+        except Exception as e:
+            logger.error(f"Task eviction failed: {e}")
+
+async def reap_abandoned_tasks():
+    """Periodically cancel tasks nobody is watching and those cancelled through another worker."""
+    while True:
+        await asyncio.sleep(REAP_INTERVAL)
+        for task_id in list(pipeline_tasks):
+            try:
+                reason = cancel_reason(task_id)
+                if reason is not None:
+                    await cancel_pipeline(task_id, reason)
+            except Exception as e:
+                logger.error(f"Reaping task {task_id} failed: {e}")
+
+@app.on_event("shutdown")
+async def stop_render_queue():
+    await render_queue.stop()
+    if render_pool is not None:
+        await render_pool.stop()
+
+@app.on_event("shutdown")
+async def close_ollama_client():
+    await ollama_client.close()
+
+def client_id(http_request: Request) -> str:
+    """Best guess at who sent a request, for fair queuing: the first X-Forwarded-For hop, else the peer."""
+    forwarded = http_request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return http_request.client.host if http_request.client else "unknown"
 
 @app.post("/generate", response_model=GenerationStatus)
-async def create_animation(request: AnimationRequest, background_tasks: BackgroundTasks):
+async def create_animation(request: AnimationRequest, http_request: Request):
     """Create a new animation generation task."""
     task_id = str(uuid.uuid4())
+
+    # Attach to an identical request that is already being worked on
+    key = coalesce_key(request.prompt, request.options)
+    leader_id = inflight_leaders.get(key)
+    if leader_id is not None:
+        task_store.create(task_id, {
+            "status": TaskStatus.PENDING,
+            "code": None,
+            "prompt": request.prompt,
+            "options": request.options,
+            "owner": PROCESS_TOKEN,
+            "last_seen": time.time(),
+            "coalesced_with": leader_id
+        })
+        task_followers.setdefault(leader_id, set()).add(task_id)
+        coalesced_tasks.inc()
+        logger.info(f"Coalesced task {task_id} with in-flight task {leader_id}")
+        return build_status(task_id, resolve_task(task_id))
+
+    try:
+        render_queue.admit(task_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
     
     try:
-        generation_tasks[task_id] = {
+        task_store.create(task_id, {
             "status": TaskStatus.PENDING,
-            "code": None
-        }
+            "code": None,
+            "prompt": request.prompt,
+            "options": request.options,
+            "owner": PROCESS_TOKEN,
+            "last_seen": time.time(),
+            "client": client_id(http_request)
+        })
         
-        background_tasks.add_task(
-            generate_animation, 
-            task_id, 
-            request.prompt,
-            request.options
+        inflight_leaders[key] = task_id
+        pipeline_tasks[task_id] = asyncio.create_task(
+            generate_animation(task_id, request.prompt, request.options)
         )
         
         return GenerationStatus(
             task_id=task_id,
-            status=TaskStatus.PENDING
+            status=TaskStatus.PENDING,
+            **render_queue.queue_info(task_id)
         )
         
     except Exception as e:
+        render_queue.release(task_id)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/status/{task_id}", response_model=GenerationStatus)
-async def get_status(task_id: str):
-    """Get the status of an animation generation task."""
-    if task_id not in generation_tasks:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    task_data = generation_tasks[task_id]
+def build_status(task_id: str, task_data: dict) -> GenerationStatus:
+    # Coalesced followers report the queue position of the task doing the work
+    queue_task_id = task_data.get("coalesced_with") or task_id
     return GenerationStatus(
         task_id=task_id,
         status=task_data["status"],
+        stage=task_data.get("stage"),
         code=task_data.get("code"),
         video_url=task_data.get("video_url"),
         code_url=task_data.get("code_url"),  # Include the code URL in the response
         error=task_data.get("error"),
-        used_fallback=task_data.get("used_fallback", False)  # Include fallback status
-
+        used_fallback=task_data.get("used_fallback", False),  # Include fallback status
+        partial_code=task_data.get("partial_code"),
+        llm_tokens=task_data.get("llm_tokens"),
+        syntax_error=task_data.get("syntax_error"),
+        validation_error=task_data.get("validation_error"),
+        repair_attempt=task_data.get("repair_attempt"),
+        repair_error=task_data.get("repair_error"),
+        render_usage=task_data.get("render_usage"),
+        render_cost=task_data.get("render_cost"),
+        preview_url=task_data.get("preview_url"),
+        final_skipped=task_data.get("final_skipped"),
+        manifest_url=task_data.get("manifest_url"),
+        stream_url=task_data.get("stream_url"),
+        render_progress=task_data.get("render_progress"),
+        render_cache_hit=task_data.get("render_cache_hit"),
+        llm_cache_hit=task_data.get("llm_cache_hit"),
+        coalesced_with=task_data.get("coalesced_with"),
+        **render_queue.queue_info(queue_task_id)
     )
 
+@app.get("/status/{task_id}", response_model=GenerationStatus)
+async def get_status(task_id: str):
+    """Get the status of an animation generation task."""
+    task_data = resolve_task(task_id)
+    if task_data is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task_data["status"] in (TaskStatus.PENDING, TaskStatus.PROCESSING):
+        mark_seen(task_id)
+    
+    return build_status(task_id, task_data)
+
+@app.get("/status/{task_id}/stream")
+async def stream_status(task_id: str, request: Request):
+    """Server-Sent Events stream of status updates for a task.
+
+    Sends a "status" event whenever the task changes and a final "done"
+    event once it has completed or failed, then closes.
+    """
+    task_data = resolve_task(task_id)
+    if task_data is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def events():
+        queue = task_events.subscribe(task_id)
+        last_sent = None
+        last_write = time.time()
+        current = task_data
+        try:
+            while True:
+                payload = build_status(task_id, current).model_dump_json()
+                if payload != last_sent:
+                    finished = current["status"] in FINISHED_STATUSES
+                    yield f"event: {'done' if finished else 'status'}\ndata: {payload}\n\n"
+                    last_sent = payload
+                    last_write = time.time()
+                    if finished:
+                        return
+                elif time.time() - last_write >= 15:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    last_write = time.time()
+
+                mark_seen(task_id)
+                try:
+                    current = await asyncio.wait_for(queue.get(), timeout=STATUS_STREAM_REFRESH)
+                    # Skip straight to the newest snapshot if several arrived at once
+                    while not queue.empty():
+                        current = queue.get_nowait()
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    # Picks up changes made by other workers and queue position changes
+                    current = resolve_task(task_id)
+                    if current is None:
+                        return
+        finally:
+            task_events.unsubscribe(task_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Tell nginx not to buffer the stream
+        "X-Accel-Buffering": "no",
+    })
+
+@app.delete("/tasks/{task_id}", response_model=GenerationStatus)
+async def cancel_task(task_id: str):
+    """Cancel a pending or running task and stop the work it started."""
+    task = task_store.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task["status"] in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Task already {task['status']}")
+
+    leader_id = task.get("coalesced_with")
+    if leader_id is not None:
+        # Only this request goes away; the shared work carries on for the others
+        task_followers.get(leader_id, set()).discard(task_id)
+        update_task(task_id, {"status": TaskStatus.CANCELLED, "stage": "cancelled",
+                              "error": "Task cancelled (client)"})
+    elif len(watching_tasks(task_id)) > 1:
+        logger.info(f"Task {task_id} cancelled by its client but kept running for coalesced requests")
+    elif not await cancel_pipeline(task_id, "client"):
+        # Running in another worker process; its reaper picks the request up
+        update_task(task_id, {"cancel_requested": "client"})
+    return build_status(task_id, resolve_task(task_id))
+
+@app.get("/tasks/{task_id}/trace")
+async def get_trace(task_id: str):
+    """Pipeline spans of a task in Chrome trace format (open in chrome://tracing or Perfetto)."""
+    task = task_store.get(task_id)
+    # Coalesced requests were served by their leader's pipeline
+    trace = tracer.chrome_trace((task or {}).get("coalesced_with") or task_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return JSONResponse(trace)
+
+@app.get("/queue")
+async def get_queue_stats():
+    """Current load of the render worker pool and how much work was coalesced."""
+    return {
+        **render_queue.stats(),
+        "warm_workers": render_pool.stats() if render_pool is not None else None,
+        "coalesced": {
+            "tasks": int(coalesced_tasks.value()),
+            "llm": llm_flight.stats(),
+            "render": render_flight.stats(),
+        },
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics of this worker process."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache")
+async def get_cache_stats():
+    """Hit/miss counters and size of the render and LLM caches."""
+    return {
+        "render": render_cache.stats() if render_cache else None,
+        "llm": llm_cache.stats() if llm_cache else None,
+    }
+
+@app.get("/health")
+async def get_health():
+    """Ollama health as seen by the background monitor, plus connection pool usage."""
+    return {"ollama": ollama_client.stats()}
+
 @app.get("/videos/{task_id}")
 async def get_video(task_id: str):
     """Retrieve a generated video file."""
     # Check if task exists
-    if task_id not in generation_tasks:
+    task_data = task_store.get(task_id)
+    if task_data is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task_data = generation_tasks[task_id]
     video_url = task_data.get("video_url")
     
     if not video_url:
@@ -476,24 +1733,29 @@ async def get_video(task_id: str):
 @app.post("/feedback")
 async def submit_feedback(feedback: FeedbackRequest):
     """Submit user feedback for a generated animation."""
-    print("Received feedback request:", feedback.dict())  # Debug incoming request
+    logger.debug(f"Received feedback request: {feedback.dict()}")
     try:
-        await data_collector.update_feedback(
-            task_id=feedback.task_id,
-            is_positive=feedback.is_positive,
-            remove=feedback.remove
-        )
+        task = task_store.get(feedback.task_id)
+        # Feedback on a preview arrives before the attempt is logged; it's logged from the task then
+        if task is None or task["status"] not in (TaskStatus.PENDING, TaskStatus.PROCESSING):
+            await data_collector.update_feedback(
+                task_id=feedback.task_id,
+                is_positive=feedback.is_positive,
+                remove=feedback.remove
+            )
+        update_task(feedback.task_id, {
+            "user_feedback": None if feedback.remove else feedback.is_positive,
+            "feedback_timestamp": None if feedback.remove else time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        })
         return {"status": "success",
                 "message": "Feedback removed" if feedback.remove else "Feedback recorded",
                 "feedback_type": "removed" if feedback.remove else ("positive" if feedback.is_positive else "negative")
         }
     except ValueError as e:
-        print(f"ValueError in feedback submission: {str(e)}")
+        logger.warning(f"Feedback for task {feedback.task_id} rejected: {e}")
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        print(f"Unexpected processing feedback submission: {str(e)}")
-        # import traceback
-        # print(traceback.format_exc())
+        logger.exception(f"Processing feedback for task {feedback.task_id} failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+# Rich tracebacks (manim's default) draw boxes and colours around the frames
+_ANSI_RE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+_BOX_CHARS = "│╭╮╰╯─┃━┏┓┗┛"
+_EXCEPTION_RE = re.compile(r"^([A-Za-z_][\w.]*(?:Error|Exception|Exit|Warning))(?::\s*(.*))?$")
+
+
+def manim_exception_name(stderr: str) -> Optional[str]:
+    """Class name of the last exception in a manim traceback, e.g. ``NameError``."""
+    for line in reversed(_ANSI_RE.sub("", stderr).splitlines()):
+        match = _EXCEPTION_RE.match(line.strip(_BOX_CHARS + " \t"))
+        if match:
+            return match.group(1).rsplit(".", 1)[-1]
+    return None
+
+
+def summarize_manim_error(stderr: str, code: str, filename: str = "scene.py", max_chars: int = 800) -> str:
+    """Reduce a manim failure to the exception and the scene line that raised it.
+
+    Full tracebacks run through manim's own frames and are mostly noise to
+    the model; what it needs is the error message and where in its code the
+    error happened.
+    """
+    text = _ANSI_RE.sub("", stderr)
+    lines = [line.strip(_BOX_CHARS + " \t") for line in text.splitlines()]
+    lines = [line for line in lines if line]
+
+    exception = None
+    for line in reversed(lines):
+        match = _EXCEPTION_RE.match(line)
+        if match:
+            exception = line
+            break
+
+    # The innermost frame in the scene file is the line to fix
+    name = re.escape(filename)
+    frame_lines = re.findall(rf'{name}", line (\d+)|{name}:(\d+)', text)
+    lineno = None
+    if frame_lines:
+        lineno = int(next(n for n in frame_lines[-1] if n))
+
+    parts = [exception or "\n".join(lines[-8:])]
+    code_lines = code.splitlines()
+    if lineno is not None and 0 < lineno <= len(code_lines):
+        parts.append(f"at line {lineno}: {code_lines[lineno - 1].strip()}")
+    summary = "\n".join(parts)
+    return summary[:max_chars]
+
+
+@dataclass
+class RepairBudget:
+    """How many times, and for how long, a task may ask the model to fix its own code."""
+    max_attempts: int = 3
+    deadline_seconds: float = 300.0
+
+    def allows(self, attempt: int, started_at: float) -> bool:
+        """Whether another attempt may follow attempt number ``attempt`` (1-based)."""
+        return attempt < self.max_attempts and self.remaining(started_at) > 0
+
+    def remaining(self, started_at: float) -> float:
+        return self.deadline_seconds - (time.time() - started_at)
+
+
+def repair_budget_from_env() -> Optional[RepairBudget]:
+    """Build the repair budget, or None when REPAIR_MAX_ATTEMPTS leaves no room for a retry."""
+    budget = RepairBudget(
+        max_attempts=int(os.getenv("REPAIR_MAX_ATTEMPTS", "3")),
+        deadline_seconds=float(os.getenv("REPAIR_DEADLINE_SECONDS", "300")),
+    )
+    return budget if budget.max_attempts > 1 else None
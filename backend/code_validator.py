@@ -0,0 +1,256 @@
+import ast
+import asyncio
+import builtins
+import json
+import logging
+import os
+import sys
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Optional
+
+from render_cache import installed_manim_version
+
+logger = logging.getLogger(__name__)
+
+# manimlib / pre-CE names the model tends to produce, and what manim CE calls them
+LEGACY_NAMES = {
+    "ShowCreation": "Create",
+    "ShowCreationThenDestruction": "ShowPassingFlash",
+    "OldTex": "MathTex",
+    "OldTexText": "Tex",
+    "TexMobject": "MathTex",
+    "TextMobject": "Tex",
+    "TexText": "Tex",
+    "FadeInFrom": "FadeIn(mobject, shift=...)",
+    "FadeOutAndShift": "FadeOut(mobject, shift=...)",
+    "FadeInFromDown": "FadeIn(mobject, shift=UP)",
+    "InteractiveScene": "Scene",
+    "GraphScene": "Axes inside a regular Scene",
+}
+
+# Script that runs in a separate interpreter so the API process never imports manim
+_INDEX_SCRIPT = """
+import inspect, json, manim
+names = sorted(n for n in dir(manim) if not n.startswith("_"))
+scenes = sorted(n for n in names
+                if inspect.isclass(getattr(manim, n)) and issubclass(getattr(manim, n), manim.Scene))
+print(json.dumps({"manim_version": manim.__version__, "names": names, "scenes": scenes}))
+"""
+
+
+@dataclass
+class ValidationIssue:
+    kind: str
+    message: str
+    line: Optional[int] = None
+    names: Optional[list[str]] = None
+
+    def to_dict(self) -> dict:
+        return {k: v for k, v in asdict(self).items() if v is not None}
+
+    def __str__(self) -> str:
+        location = f" (line {self.line})" if self.line else ""
+        return f"{self.message}{location}"
+
+
+class ManimSymbolIndex:
+    """Names exported by the installed manim, cached on disk per manim version.
+
+    Built by importing manim in a subprocess, since that takes seconds and
+    pulls in cairo/pango, which the API process otherwise never needs.
+    """
+
+    def __init__(self, cache_path: Path):
+        self.cache_path = Path(cache_path)
+        self.manim_version: Optional[str] = None
+        self.names: frozenset[str] = frozenset()
+        self.scenes: frozenset[str] = frozenset({"Scene"})
+        self.loaded = False
+
+    def _apply(self, data: dict):
+        self.manim_version = data["manim_version"]
+        self.names = frozenset(data["names"])
+        self.scenes = frozenset(data["scenes"])
+        self.loaded = True
+
+    async def load(self):
+        """Load the index from the cache file, rebuilding it if manim was upgraded."""
+        version = installed_manim_version()
+        try:
+            data = json.loads(self.cache_path.read_text())
+            if data.get("manim_version") == version:
+                self._apply(data)
+                return
+        except (OSError, ValueError, KeyError):
+            pass
+
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", _INDEX_SCRIPT,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate()
+        try:
+            data = json.loads(stdout) if process.returncode == 0 else None
+        except ValueError:
+            data = None
+        if data is None:
+            last_line = (stderr.decode(errors="replace").strip().splitlines() or [""])[-1]
+            logger.warning(f"Could not build manim symbol index, skipping name checks: {last_line}")
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.cache_path.write_text(json.dumps(data))
+        self._apply(data)
+        logger.info(f"Built manim {self.manim_version} symbol index ({len(self.names)} names)")
+
+
+def _bound_names(tree: ast.Module) -> set[str]:
+    """Every name the code binds anywhere, ignoring scope.
+
+    Flattening scopes can only hide an undefined name, never report a
+    defined one as missing, which is the right trade-off for a fast check.
+    """
+    bound = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                bound.add((alias.asname or alias.name).split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, ast.MatchAs) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchStar) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            bound.add(node.rest)
+    return bound
+
+
+def _base_name(node: ast.expr) -> Optional[str]:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def renderable_scenes(tree: ast.Module, scene_bases: frozenset[str] = frozenset({"Scene"})) -> list[ast.ClassDef]:
+    """Scene subclasses defined in the module that no other scene builds on, in definition order."""
+    classes = {node.name: node for node in tree.body if isinstance(node, ast.ClassDef)}
+
+    # Resolve Scene subclasses defined in the module, including ones built on each other
+    scenes: set[str] = set()
+    changed = True
+    while changed:
+        changed = False
+        for name, node in classes.items():
+            if name in scenes:
+                continue
+            bases = {_base_name(b) for b in node.bases}
+            if bases & (scene_bases | scenes) or any(b.endswith("Scene") for b in bases if b):
+                scenes.add(name)
+                changed = True
+
+    # A scene that another scene subclasses is a helper base, not something to render
+    used_as_base = {_base_name(b) for name in scenes for b in classes[name].bases}
+    return [node for name, node in classes.items() if name in scenes and name not in used_as_base]
+
+
+class CodeValidator:
+    """Static checks on generated scene code, run before it is handed to manim."""
+
+    def __init__(self, symbol_index: Optional[ManimSymbolIndex] = None):
+        self.symbol_index = symbol_index
+
+    def validate(self, code: str) -> Optional[ValidationIssue]:
+        """Return the first problem found, or None if the code looks renderable."""
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            return ValidationIssue("syntax", f"SyntaxError: {e.msg}", line=e.lineno)
+
+        index = self.symbol_index if self.symbol_index is not None and self.symbol_index.loaded else None
+
+        issue = self._check_imports(tree, index)
+        if issue is not None:
+            return issue
+        issue = self._check_scenes(tree, index)
+        if issue is not None:
+            return issue
+        if index is not None:
+            return self._check_names(tree, index)
+        return None
+
+    @staticmethod
+    def _check_imports(tree: ast.Module, index: Optional[ManimSymbolIndex]) -> Optional[ValidationIssue]:
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.name.split(".")[0] in ("manimlib", "manimgl"):
+                        return ValidationIssue("legacy_api", f"Imports {alias.name}; use manim (Community Edition)",
+                                               line=node.lineno)
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                root = node.module.split(".")[0]
+                if root in ("manimlib", "manimgl"):
+                    return ValidationIssue("legacy_api", f"Imports from {node.module}; use manim (Community Edition)",
+                                           line=node.lineno)
+                if node.module == "manim" and index is not None:
+                    missing = [a.name for a in node.names if a.name != "*" and a.name not in index.names]
+                    if missing:
+                        return _unknown_names_issue(missing, node.lineno, index)
+        return None
+
+    @staticmethod
+    def _check_scenes(tree: ast.Module, index: Optional[ManimSymbolIndex]) -> Optional[ValidationIssue]:
+        renderable = renderable_scenes(tree, index.scenes if index is not None else frozenset({"Scene"}))
+        if not renderable:
+            return ValidationIssue("no_scene", "No Scene subclass defined")
+        if len(renderable) > 1:
+            return ValidationIssue("multiple_scenes", f"Expected one Scene subclass, found {len(renderable)}",
+                                   line=renderable[1].lineno, names=[node.name for node in renderable])
+        return None
+
+    @staticmethod
+    def _check_names(tree: ast.Module, index: ManimSymbolIndex) -> Optional[ValidationIssue]:
+        for node in ast.walk(tree):
+            # A star import from anything but manim could define any name
+            if isinstance(node, ast.ImportFrom) and node.module != "manim" \
+                    and any(alias.name == "*" for alias in node.names):
+                return None
+
+        known = _bound_names(tree) | index.names | set(dir(builtins)) | {"__name__", "__file__"}
+        unknown: dict[str, int] = {}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in known:
+                unknown.setdefault(node.id, node.lineno)
+        if not unknown:
+            return None
+        names = sorted(unknown, key=unknown.get)
+        return _unknown_names_issue(names, unknown[names[0]], index)
+
+
+def _unknown_names_issue(names: list[str], line: int, index: ManimSymbolIndex) -> ValidationIssue:
+    legacy = [name for name in names if name in LEGACY_NAMES]
+    if legacy:
+        hints = ", ".join(f"{name} -> {LEGACY_NAMES[name]}" for name in legacy)
+        return ValidationIssue("legacy_api", f"Uses manimlib names not in manim {index.manim_version}: {hints}",
+                               line=line, names=names)
+    return ValidationIssue("unknown_name", f"Undefined names: {', '.join(names)}", line=line, names=names)
+
+
+def code_validator_from_env() -> Optional[CodeValidator]:
+    """Build the validator, or None if CODE_VALIDATION is disabled."""
+    if os.getenv("CODE_VALIDATION", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return CodeValidator(ManimSymbolIndex(
+        Path(os.getenv("MANIM_SYMBOL_INDEX_PATH", "./task_data/manim_symbols.json"))
+    ))
@@ -90,8 +90,9 @@ class DataCollector:
                 "video_metadata": self._get_video_metadata(task_data.get("video_url")) if task_data.get("video_url") else None
             },
             "generation_metadata": generation_metadata,
-            "user_feedback": None,
-            "feedback_timestamp": None
+            # Set when feedback arrived on a preview before the attempt was logged
+            "user_feedback": task_data.get("user_feedback"),
+            "feedback_timestamp": task_data.get("feedback_timestamp")
         }
         
         filename = self.data_dir / f"generation_attempts_{datetime.utcnow():%Y%m}.jsonl"
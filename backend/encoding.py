@@ -0,0 +1,117 @@
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# x264 presets from fastest to slowest
+PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow")
+# Clips with more pixels than this (width * height * frames) drop to the next faster preset
+HEAVY_CLIP_PIXELS = 1920 * 1080 * 60 * 60
+
+
+@dataclass
+class ClipStats:
+    width: int
+    height: int
+    fps: float
+    duration: float
+    size_bytes: int
+
+    @property
+    def frames(self) -> int:
+        return round(self.fps * self.duration)
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    """x264 settings for re-encoding manim output before upload.
+
+    ``tune`` "" sets none; ``keyint_seconds`` None and ``max_height`` None
+    leave ffmpeg's defaults and the source resolution alone.
+    """
+    name: str
+    preset: str = "medium"
+    crf: int = 23
+    # Flat colours and sharp edges on black. No profile switches to stillimage for quiet clips:
+    # that was never measured, and benchmarks/encoding_profiles.py (SSIM and size per profile on
+    # the scene corpus) is where another tune would first have to beat this one
+    tune: str = "animation"
+    keyint_seconds: Optional[float] = 4
+    max_height: Optional[int] = None
+
+    def ffmpeg_args(self, stats: Optional[ClipStats] = None) -> list[str]:
+        preset = self.preset
+        if stats is not None and stats.width * stats.height * stats.frames > HEAVY_CLIP_PIXELS:
+            preset = PRESETS[max(0, PRESETS.index(preset) - 1)]
+        args = ["-c:v", "libx264", "-preset", preset, "-crf", str(self.crf), "-pix_fmt", "yuv420p"]
+        if self.tune:
+            args += ["-tune", self.tune]
+        if self.keyint_seconds and stats is not None and stats.fps:
+            # A short clip is a single GOP; longer ones get a keyframe every keyint_seconds for seeking
+            keyint = max(1, min(round(self.keyint_seconds * stats.fps), stats.frames))
+            args += ["-g", str(keyint), "-keyint_min", str(keyint)]
+        if self.max_height and stats is not None and stats.height > self.max_height:
+            args += ["-vf", f"scale=-2:{self.max_height}"]
+        return args
+
+
+PROFILES = {
+    # What compress_video always used; kept for comparison
+    "legacy": EncodingProfile("legacy", preset="medium", crf=23, tune="", keyint_seconds=None),
+    "preview": EncodingProfile("preview", preset="veryfast", crf=28, keyint_seconds=2, max_height=480),
+    "standard": EncodingProfile("standard", preset="medium", crf=23, keyint_seconds=4, max_height=1080),
+    "archive": EncodingProfile("archive", preset="slow", crf=20, keyint_seconds=8, max_height=2160),
+}
+
+# manim quality flag -> profile used when ENCODING_PROFILE is auto
+QUALITY_PROFILES = {"-ql": "preview", "-qm": "standard", "-qh": "standard", "-qp": "archive", "-qk": "archive"}
+
+
+def choose_profile(quality_flag: Optional[str], profile: str = "auto") -> EncodingProfile:
+    """The profile named by ``profile``, or for "auto" the one for the requested quality."""
+    if profile != "auto":
+        return PROFILES[profile]
+    return PROFILES[QUALITY_PROFILES.get(quality_flag, "standard")]
+
+
+async def probe_clip(path: Path) -> Optional[ClipStats]:
+    """Resolution, frame rate, duration and size of a video, from ffprobe."""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "stream=width,height,r_frame_rate:format=duration,size", "-of", "json", str(path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, _ = await process.communicate()
+        info = json.loads(stdout)
+        stream, media = info["streams"][0], info["format"]
+        numerator, denominator = stream["r_frame_rate"].split("/")
+        return ClipStats(
+            width=int(stream["width"]),
+            height=int(stream["height"]),
+            fps=int(numerator) / int(denominator) if int(denominator) else 0.0,
+            duration=float(media["duration"]),
+            size_bytes=int(media["size"]),
+        )
+    except (OSError, ValueError, KeyError, IndexError, ZeroDivisionError) as e:
+        logger.warning(f"Could not probe {path}: {type(e).__name__}: {e}")
+        return None
+
+
+async def encoding_args(path: Path, quality_flag: Optional[str], profile: str = "auto") -> tuple[str, list[str]]:
+    """The profile name and ffmpeg output arguments for re-encoding the video at path."""
+    chosen = choose_profile(quality_flag, profile)
+    return chosen.name, chosen.ffmpeg_args(await probe_clip(path))
+
+
+def encoding_profile_from_env() -> str:
+    profile = os.getenv("ENCODING_PROFILE", "auto")
+    if profile != "auto" and profile not in PROFILES:
+        raise ValueError(f"Unknown ENCODING_PROFILE {profile!r}, expected auto or one of {', '.join(PROFILES)}")
+    return profile
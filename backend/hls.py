@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import math
+import shutil
+from pathlib import Path
+from typing import Callable, Optional
+
+from encoding import probe_clip
+
+logger = logging.getLogger(__name__)
+
+# Where manim writes each quality's partial movie files under the media dir
+QUALITY_DIRS = {"-ql": "480p15", "-qm": "720p30", "-qh": "1080p60", "-qp": "1440p60", "-qk": "2160p60"}
+
+
+class HlsPublisher:
+    """Publishes a render as an HLS playlist while manim is still rendering it.
+
+    manim writes every play/wait of a scene to its own partial movie file
+    before concatenating them into the final video. With caching disabled
+    they are numbered (uncached_00000.mp4, ...), and one is finished once the
+    next one appears. Each finished file is remuxed (no re-encode) into an
+    MPEG-TS segment, offset to follow the previous one, and uploaded with the
+    playlist, so playback can start after the first animation. ``finish``
+    adds the last segment and ends the playlist.
+    """
+
+    def __init__(self, storage, task_id: str, media_dir: Path, quality_flag: str, prefix: str,
+                 target_duration: int = 10, on_playlist: Optional[Callable[[str], None]] = None):
+        self.storage = storage
+        self.task_id = task_id
+        self.media_dir = media_dir
+        self.partial_glob = f"videos/*/{QUALITY_DIRS.get(quality_flag, '*')}/partial_movie_files/*/uncached_*.mp4"
+        self.prefix = prefix
+        self.target_duration = target_duration
+        self.on_playlist = on_playlist
+        self.work_dir = media_dir / "hls" / prefix.replace("/", "_")
+        self.segments: list[tuple[str, float]] = []
+        self.published: set[Path] = set()
+        self.playlist_url: Optional[str] = None
+        self.failed = False
+
+    def _partials(self) -> list[Path]:
+        return sorted(self.media_dir.glob(self.partial_glob))
+
+    def playlist(self, final: bool) -> str:
+        # Segments longer than the configured target raise it; players only use it as a hint
+        target = max([self.target_duration] + [math.ceil(duration) for _, duration in self.segments])
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{target}",
+                 "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:EVENT"]
+        for name, duration in self.segments:
+            lines += [f"#EXTINF:{duration:.3f},", name]
+        if final:
+            lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    async def _publish_playlist(self, final: bool):
+        url = await self.storage.upload_bytes(self.playlist(final).encode(), self.task_id,
+                                              f"{self.prefix}/playlist.m3u8", "application/vnd.apple.mpegurl",
+                                              kind="hls_playlist", cache_control="no-cache")
+        if url is None:
+            raise RuntimeError("playlist upload failed")
+        if self.playlist_url is None:
+            self.playlist_url = url
+            if self.on_playlist is not None:
+                self.on_playlist(url)
+
+    async def _publish_segment(self, partial: Path):
+        stats = await probe_clip(partial)
+        if stats is None:
+            raise RuntimeError(f"could not probe {partial.name}")
+        offset = sum(duration for _, duration in self.segments)
+        name = f"segment_{len(self.segments):05d}.ts"
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        segment = self.work_dir / name
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-v", "error", "-i", str(partial), "-c", "copy", "-bsf:v", "h264_mp4toannexb",
+            "-output_ts_offset", f"{offset:.6f}", "-f", "mpegts", "-y", str(segment),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"remuxing {partial.name} failed: {stderr.decode(errors='replace')[-500:]}")
+        url = await self.storage.upload_bytes(segment.read_bytes(), self.task_id, f"{self.prefix}/{name}",
+                                              "video/mp2t", kind="hls_segment")
+        segment.unlink()
+        if url is None:
+            raise RuntimeError(f"uploading {name} failed")
+        self.segments.append((name, stats.duration))
+        self.published.add(partial)
+
+    async def _publish_ready(self, final: bool):
+        partials = self._partials()
+        # Until the render is done, the newest partial file may still be being written
+        ready = [p for p in (partials if final else partials[:-1]) if p not in self.published]
+        for partial in ready:
+            await self._publish_segment(partial)
+        if self.segments and (ready or final):
+            await self._publish_playlist(final)
+
+    async def watch(self, interval: float = 1.0):
+        """Publish partial movie files as they are finished, until cancelled."""
+        try:
+            while True:
+                await self._publish_ready(final=False)
+                await asyncio.sleep(interval)
+        except Exception as e:
+            self.failed = True
+            logger.warning(f"HLS output for task {self.task_id} stopped: {type(e).__name__}: {e}")
+
+    async def finish(self) -> Optional[str]:
+        """Publish the remaining segments and end the playlist. Returns its URL, or None on failure."""
+        if self.failed:
+            return None
+        try:
+            await self._publish_ready(final=True)
+            return self.playlist_url if self.segments else None
+        except Exception as e:
+            logger.warning(f"Failed to finish HLS output for task {self.task_id}: {type(e).__name__}: {e}")
+            return None
+        finally:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
@@ -0,0 +1,187 @@
+import hashlib
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Mersenne prime used for the MinHash permutations
+_PRIME = (1 << 61) - 1
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", prompt).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def shingles(normalized: str, size: int = 2) -> set[str]:
+    """Word n-gram shingles; short prompts fall back to single words."""
+    words = normalized.split()
+    if len(words) < size:
+        return set(words)
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """MinHash signatures for estimating Jaccard similarity between shingle sets."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        # Deterministic (a, b) pairs for the universal hash family h(x) = (a*x + b) mod p
+        self._perms = []
+        for i in range(num_perm):
+            digest = hashlib.sha256(f"{seed}:{i}".encode()).digest()
+            a = int.from_bytes(digest[:8], "big") % (_PRIME - 1) + 1
+            b = int.from_bytes(digest[8:16], "big") % _PRIME
+            self._perms.append((a, b))
+
+    def signature(self, items: set[str]) -> tuple[int, ...]:
+        if not items:
+            return tuple(_PRIME for _ in self._perms)
+        hashes = [int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), "big")
+                  for item in items]
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self._perms)
+
+    @staticmethod
+    def similarity(sig1: tuple[int, ...], sig2: tuple[int, ...]) -> float:
+        return sum(1 for x, y in zip(sig1, sig2) if x == y) / len(sig1)
+
+
+@dataclass
+class CachedCompletion:
+    code: str
+    context: str
+    normalized_prompt: str
+    created_at: float
+    signature: Optional[tuple[int, ...]] = None
+    hits: int = 0
+
+
+class LLMResponseCache:
+    """LRU cache of known-good LLM completions keyed on the normalized prompt.
+
+    Entries are scoped to a context (system prompt hash + model name) so a
+    prompt change invalidates them, and expire after ``ttl_seconds``. With
+    ``near_duplicates`` enabled, a miss falls back to the most similar cached
+    prompt in the same context if its MinHash similarity reaches
+    ``near_duplicate_threshold``.
+    """
+
+    def __init__(self, max_entries: int = 500, ttl_seconds: float = 24 * 3600,
+                 near_duplicates: bool = False, near_duplicate_threshold: float = 0.8):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.near_duplicates = near_duplicates
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self._entries: "OrderedDict[str, CachedCompletion]" = OrderedDict()
+        self._minhasher = MinHasher() if near_duplicates else None
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def context(system_prompt: str, model: str) -> str:
+        return hashlib.sha256(system_prompt.encode()).hexdigest()[:16] + ":" + model
+
+    @staticmethod
+    def _key(normalized_prompt: str, context: str) -> str:
+        return hashlib.sha256(f"{context}\0{normalized_prompt}".encode()).hexdigest()
+
+    def _expired(self, entry: CachedCompletion) -> bool:
+        return time.time() - entry.created_at > self.ttl_seconds
+
+    def get(self, prompt: str, system_prompt: str, model: str) -> Optional[tuple[str, str]]:
+        """Return ``(key, code)`` for a cached completion, or None on a miss.
+
+        The key is that of the entry served, which for a near-duplicate hit is
+        another prompt's; pass it to ``invalidate`` if the code turns out bad.
+        """
+        context = self.context(system_prompt, model)
+        normalized = normalize_prompt(prompt)
+        key = self._key(normalized, context)
+
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry):
+            del self._entries[key]
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self.hits += 1
+            return key, entry.code
+
+        if self.near_duplicates:
+            match = self._nearest(normalized, context)
+            if match is not None:
+                match_key, similarity = match
+                logger.info(f"LLM cache near-duplicate hit (similarity {similarity:.2f})")
+                self._entries.move_to_end(match_key)
+                self._entries[match_key].hits += 1
+                self.near_hits += 1
+                return match_key, self._entries[match_key].code
+
+        self.misses += 1
+        return None
+
+    def _nearest(self, normalized: str, context: str) -> Optional[tuple[str, float]]:
+        signature = self._minhasher.signature(shingles(normalized))
+        best_key, best_similarity = None, 0.0
+        for key, entry in self._entries.items():
+            if entry.context != context or entry.signature is None or self._expired(entry):
+                continue
+            similarity = MinHasher.similarity(signature, entry.signature)
+            if similarity > best_similarity:
+                best_key, best_similarity = key, similarity
+        if best_key is not None and best_similarity >= self.near_duplicate_threshold:
+            return best_key, best_similarity
+        return None
+
+    def put(self, prompt: str, system_prompt: str, model: str, code: str):
+        """Store a completion that rendered successfully."""
+        context = self.context(system_prompt, model)
+        normalized = normalize_prompt(prompt)
+        key = self._key(normalized, context)
+        self._entries[key] = CachedCompletion(
+            code=code,
+            context=context,
+            normalized_prompt=normalized,
+            created_at=time.time(),
+            signature=self._minhasher.signature(shingles(normalized)) if self._minhasher else None,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        """Drop the entry returned by ``get`` under ``key``."""
+        self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_duplicate_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.near_hits) / lookups, 3) if lookups else None,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "near_duplicates": self.near_duplicates,
+        }
+
+
+def llm_cache_from_env() -> Optional[LLMResponseCache]:
+    """Build the LLM response cache, or None if LLM_CACHE is disabled."""
+    if os.getenv("LLM_CACHE", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return LLMResponseCache(
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "500")),
+        ttl_seconds=float(os.getenv("LLM_CACHE_TTL_HOURS", "24")) * 3600,
+        near_duplicates=os.getenv("LLM_CACHE_NEAR_DUPLICATES", "false").lower() in ("1", "true", "yes"),
+        near_duplicate_threshold=float(os.getenv("LLM_CACHE_NEAR_DUPLICATE_THRESHOLD", "0.8")),
+    )
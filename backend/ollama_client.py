@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaUnavailableError(Exception):
+    """Raised when the health monitor has marked Ollama as down."""
+
+
+class OllamaClient:
+    """App-lifetime HTTP client for Ollama.
+
+    Holds a single pooled httpx.AsyncClient so generations reuse keep-alive
+    connections, and runs a background health monitor instead of probing
+    /api/version before every request. Ollama is only marked down after
+    ``health_failure_threshold`` consecutive failed probes, so one slow or
+    dropped probe doesn't send every generation to the fallback template.
+    """
+
+    def __init__(self, host: str, model: str = "mistral",
+                 max_connections: int = 10, max_keepalive: int = 5,
+                 keepalive_expiry: float = 60.0, timeout: float = 120.0,
+                 health_interval: float = 15.0, health_failure_threshold: int = 3):
+        self.host = host.rstrip("/")
+        self.model = model
+        self.max_connections = max_connections
+        self.health_interval = health_interval
+        self.health_failure_threshold = max(1, health_failure_threshold)
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._timeout = httpx.Timeout(timeout, connect=5.0)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._monitor: Optional[asyncio.Task] = None
+
+        # None until the first health check completes
+        self.healthy: Optional[bool] = None
+        self.version: Optional[str] = None
+        self.last_health_check: Optional[float] = None
+        self.last_health_error: Optional[str] = None
+        self.consecutive_health_failures = 0
+
+        # Pool usage counters
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._requests_total = 0
+        self._errors_total = 0
+        self._saturated_total = 0
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.host, limits=self._limits, timeout=self._timeout)
+        if self._monitor is None:
+            self._monitor = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+            self._monitor = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def check_health(self) -> bool:
+        """Probe /api/version once and record the result."""
+        try:
+            response = await self._client.get("/api/version", timeout=5.0)
+            response.raise_for_status()
+            self.version = response.json().get("version")
+            if not self.healthy:
+                logger.info(f"Ollama at {self.host} is up (version {self.version})")
+            self.healthy = True
+            self.last_health_error = None
+            self.consecutive_health_failures = 0
+        except Exception as e:
+            self.consecutive_health_failures += 1
+            self.last_health_error = f"{type(e).__name__}: {e}"
+            if self.consecutive_health_failures >= self.health_failure_threshold:
+                if self.healthy is not False:
+                    logger.warning(
+                        f"Ollama marked down after {self.consecutive_health_failures} failed health checks: "
+                        f"{self.last_health_error}"
+                    )
+                self.healthy = False
+            else:
+                logger.info(
+                    f"Ollama health check failed ({self.consecutive_health_failures}/"
+                    f"{self.health_failure_threshold}): {self.last_health_error}"
+                )
+        self.last_health_check = time.time()
+        return self.healthy
+
+    async def _health_loop(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.health_interval)
+
+    def _ensure_available(self):
+        if self._client is None:
+            raise RuntimeError("OllamaClient has not been started")
+        if self.healthy is False:
+            raise OllamaUnavailableError(f"Ollama is unavailable: {self.last_health_error}")
+
+    def _acquire(self):
+        self._requests_total += 1
+        if self._in_flight >= self.max_connections:
+            # Request will wait in httpx for a free connection
+            self._saturated_total += 1
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+    def _release(self, failed: bool):
+        self._in_flight -= 1
+        if failed:
+            self._errors_total += 1
+        else:
+            # A completed generation is a better signal than the last probe
+            self.consecutive_health_failures = 0
+
+    async def generate(self, prompt: str, **options) -> str:
+        """Run a non-streaming generation and return the response text."""
+        self._ensure_available()
+        self._acquire()
+        failed = True
+        try:
+            response = await self._client.post(
+                "/api/generate",
+                json={"model": self.model, "prompt": prompt, "stream": False, **options},
+            )
+            if response.status_code != 200:
+                logger.error(f"Ollama API error: {response.status_code} - {response.text}")
+                raise Exception(f"Ollama API returned status code {response.status_code}")
+            result = response.json()
+            failed = False
+            return result["response"]
+        finally:
+            self._release(failed)
+
+    async def generate_stream(self, prompt: str, **options) -> AsyncIterator[dict]:
+        """Stream a generation, yielding each NDJSON chunk from Ollama as a dict.
+
+        Each chunk has a "response" fragment; the last one has "done": true
+        plus timing stats. Closing the generator early (e.g. once the code
+        block is complete) closes the connection, which stops the generation
+        on the Ollama side.
+        """
+        self._ensure_available()
+        self._acquire()
+        failed = True
+        try:
+            async with self._client.stream(
+                "POST",
+                "/api/generate",
+                json={"model": self.model, "prompt": prompt, "stream": True, **options},
+            ) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    logger.error(f"Ollama API error: {response.status_code} - {body.decode(errors='replace')}")
+                    raise Exception(f"Ollama API returned status code {response.status_code}")
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise Exception(f"Ollama stream error: {chunk['error']}")
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+            failed = False
+        except GeneratorExit:
+            # Consumer stopped early; that's not an error
+            failed = False
+            raise
+        finally:
+            self._release(failed)
+
+    def stats(self) -> dict:
+        """Connection pool and health metrics."""
+        return {
+            "host": self.host,
+            "model": self.model,
+            "healthy": self.healthy,
+            "version": self.version,
+            "last_health_check": self.last_health_check,
+            "last_health_error": self.last_health_error,
+            "consecutive_health_failures": self.consecutive_health_failures,
+            "in_flight": self._in_flight,
+            "peak_in_flight": self._peak_in_flight,
+            "max_connections": self.max_connections,
+            "pool_saturation": round(self._in_flight / self.max_connections, 3),
+            "requests_total": self._requests_total,
+            "errors_total": self._errors_total,
+            "saturated_total": self._saturated_total,
+        }
+
+
+def ollama_client_from_env(host: str) -> OllamaClient:
+    return OllamaClient(
+        host=host,
+        model=os.getenv("OLLAMA_MODEL", "mistral"),
+        max_connections=int(os.getenv("OLLAMA_MAX_CONNECTIONS", "10")),
+        max_keepalive=int(os.getenv("OLLAMA_MAX_KEEPALIVE", "5")),
+        keepalive_expiry=float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60")),
+        timeout=float(os.getenv("OLLAMA_TIMEOUT", "120")),
+        health_interval=float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15")),
+        health_failure_threshold=int(os.getenv("OLLAMA_HEALTH_FAILURES", "3")),
+    )
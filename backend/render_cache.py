@@ -0,0 +1,161 @@
+import ast
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from importlib import metadata
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_code(code: str) -> str:
+    """Canonical form of scene code, ignoring comments, whitespace and docstrings.
+
+    Falls back to the stripped source if the code doesn't parse.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code.strip()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            body = node.body
+            if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                    and isinstance(body[0].value.value, str):
+                node.body = body[1:] or [ast.Pass()]
+    return ast.dump(tree, annotate_fields=False)
+
+
+def installed_manim_version() -> str:
+    try:
+        return metadata.version("manim")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+class RenderCache:
+    """Content-addressed index of rendered videos.
+
+    Maps a hash of (normalized code, quality flag, manim version) to the URL
+    of a video that was already rendered and uploaded. The index lives in an
+    SQLite file and is bounded by entry count and total video size, evicting
+    the least recently used entries first.
+    """
+
+    def __init__(self, db_path: Path, max_entries: int = 1000, max_bytes: int = 5 * 1024 ** 3,
+                 max_age_seconds: Optional[float] = None, manim_version: Optional[str] = None):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.manim_version = manim_version or installed_manim_version()
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS render_cache (
+                key TEXT PRIMARY KEY,
+                video_url TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_render_cache_last_access ON render_cache (last_access)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=10.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def key(self, code: str, quality_flag: str) -> str:
+        digest = hashlib.sha256()
+        for part in (normalize_code(code), quality_flag, self.manim_version):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached video URL for a key, or None on a miss."""
+        conn = self._conn()
+        row = conn.execute("SELECT video_url, created_at FROM render_cache WHERE key = ?", (key,)).fetchone()
+        if row is not None and self.max_age_seconds and time.time() - row[1] > self.max_age_seconds:
+            # The uploaded video may have been cleaned up by now
+            conn.execute("DELETE FROM render_cache WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        conn.execute(
+            "UPDATE render_cache SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?",
+            (time.time(), key)
+        )
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, video_url: str, size_bytes: int):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO render_cache (key, video_url, size_bytes, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, video_url, size_bytes, now, now)
+        )
+        self._evict()
+
+    def _evict(self):
+        conn = self._conn()
+        count, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM render_cache"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size_bytes in conn.execute(
+                "SELECT key, size_bytes FROM render_cache ORDER BY last_access ASC").fetchall():
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM render_cache WHERE key = ?", (key,))
+            count -= 1
+            total_bytes -= size_bytes
+            evicted += 1
+        logger.info(f"Evicted {evicted} render cache entries")
+
+    def stats(self) -> dict:
+        count, total_bytes = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM render_cache"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "entries": count,
+            "bytes": total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "manim_version": self.manim_version,
+        }
+
+
+def render_cache_from_env() -> Optional[RenderCache]:
+    """Build the render cache, or None if RENDER_CACHE is disabled."""
+    if os.getenv("RENDER_CACHE", "true").lower() not in ("1", "true", "yes"):
+        return None
+    max_age_hours = float(os.getenv("RENDER_CACHE_MAX_AGE_HOURS", "0"))
+    return RenderCache(
+        Path(os.getenv("RENDER_CACHE_DB", "./task_data/render_cache.db")),
+        max_entries=int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "1000")),
+        max_bytes=int(float(os.getenv("RENDER_CACHE_MAX_MB", "5120")) * 1024 * 1024),
+        max_age_seconds=max_age_hours * 3600 if max_age_hours else None,
+    )
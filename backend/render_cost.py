@@ -0,0 +1,191 @@
+import ast
+import math
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+# Relative cost of a second of animation at each quality (frames x pixels, roughly)
+QUALITY_COST = {"-ql": 1.0, "-qm": 3.0, "-qh": 8.0, "-qp": 12.0, "-qk": 30.0}
+
+# Seconds of fixed cost: interpreter and scene setup, and one LaTeX compile per Tex/MathTex
+BASE_COST = 2.0
+TEX_COST = 1.5
+TEXT_COST = 0.2
+
+TEX_CLASSES = {"Tex", "MathTex", "SingleStringMathTex", "BulletedList", "Title", "Matrix",
+               "DecimalMatrix", "IntegerMatrix", "Integer", "DecimalNumber", "Variable"}
+TEXT_CLASSES = {"Text", "MarkupText", "Paragraph", "Code"}
+THREE_D_SCENES = {"ThreeDScene", "SpecialThreeDScene"}
+# manim's default Surface resolution is 32 x 32 patches
+DEFAULT_SURFACE_PATCHES = 32 * 32
+
+DEFAULT_RUN_TIME = 1.0
+DEFAULT_WAIT = 1.0
+# Loops whose bounds can't be read are assumed to run this many times
+UNKNOWN_LOOP_COUNT = 3
+MAX_LOOP_COUNT = 1000
+
+
+@dataclass
+class RenderCostEstimate:
+    animation_seconds: float
+    play_calls: int
+    wait_calls: int
+    tex_count: int
+    text_count: int
+    three_d: bool
+    surface_patches: int
+    # Relative render cost, in approximate seconds of -ql render time
+    cost: float
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _number(node: Optional[ast.expr]) -> Optional[float]:
+    """Value of a numeric literal (including negated ones and simple products), else None."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return float(node.value)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = _number(node.operand)
+        return -value if value is not None else None
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Mult, ast.Add, ast.Div)):
+        left, right = _number(node.left), _number(node.right)
+        if left is None or right is None:
+            return None
+        if isinstance(node.op, ast.Mult):
+            return left * right
+        if isinstance(node.op, ast.Add):
+            return left + right
+        return left / right if right else None
+    return None
+
+
+def _call_name(node: ast.Call) -> Optional[str]:
+    if isinstance(node.func, ast.Name):
+        return node.func.id
+    if isinstance(node.func, ast.Attribute):
+        return node.func.attr
+    return None
+
+
+def _keyword(node: ast.Call, name: str) -> Optional[ast.expr]:
+    return next((kw.value for kw in node.keywords if kw.arg == name), None)
+
+
+def _loop_count(node: ast.For) -> int:
+    """Iterations of ``for _ in range(...)`` or over a literal sequence, else a guess."""
+    it = node.iter
+    if isinstance(it, (ast.List, ast.Tuple, ast.Set)):
+        return len(it.elts)
+    if isinstance(it, ast.Call) and _call_name(it) == "range" and it.args:
+        bounds = [_number(arg) for arg in it.args]
+        if all(b is not None for b in bounds):
+            start, stop, step = (0.0, bounds[0], 1.0) if len(bounds) == 1 else (bounds + [1.0])[:3]
+            if step:
+                return max(0, min(MAX_LOOP_COUNT, math.ceil((stop - start) / step)))
+    return UNKNOWN_LOOP_COUNT
+
+
+def _surface_patches(node: ast.Call) -> int:
+    resolution = _keyword(node, "resolution")
+    if isinstance(resolution, (ast.Tuple, ast.List)) and len(resolution.elts) == 2:
+        u, v = (_number(e) for e in resolution.elts)
+        if u is not None and v is not None:
+            return int(u * v)
+    value = _number(resolution)
+    if value is not None:
+        return int(value * value)
+    return DEFAULT_SURFACE_PATCHES
+
+
+class _CostVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.multiplier = 1
+        self.animation_seconds = 0.0
+        self.play_calls = 0
+        self.wait_calls = 0
+        self.tex_count = 0
+        self.text_count = 0
+        self.three_d = False
+        self.surface_patches = 0
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        if any(isinstance(b, ast.Name) and b.id in THREE_D_SCENES for b in node.bases):
+            self.three_d = True
+        self.generic_visit(node)
+
+    def _visit_loop(self, node, count: int):
+        previous = self.multiplier
+        self.multiplier = min(MAX_LOOP_COUNT, self.multiplier * count)
+        self.generic_visit(node)
+        self.multiplier = previous
+
+    def visit_For(self, node: ast.For):
+        self._visit_loop(node, _loop_count(node))
+
+    def visit_While(self, node: ast.While):
+        self._visit_loop(node, UNKNOWN_LOOP_COUNT)
+
+    def visit_ListComp(self, node: ast.ListComp):
+        count = 1
+        for generator in node.generators:
+            count *= _loop_count(ast.For(target=generator.target, iter=generator.iter, body=[], orelse=[]))
+        self._visit_loop(node, count)
+
+    visit_GeneratorExp = visit_SetComp = visit_ListComp
+
+    def visit_Call(self, node: ast.Call):
+        name = _call_name(node)
+        if name == "play":
+            run_time = _number(_keyword(node, "run_time"))
+            self.play_calls += self.multiplier
+            self.animation_seconds += self.multiplier * (run_time if run_time is not None and run_time > 0
+                                                         else DEFAULT_RUN_TIME)
+        elif name == "wait":
+            duration = _number(node.args[0]) if node.args else _number(_keyword(node, "duration"))
+            self.wait_calls += self.multiplier
+            self.animation_seconds += self.multiplier * (duration if duration is not None and duration > 0
+                                                         else DEFAULT_WAIT)
+        elif name in TEX_CLASSES:
+            self.tex_count += self.multiplier
+        elif name in TEXT_CLASSES:
+            self.text_count += self.multiplier
+        elif name in ("Surface", "ParametricSurface"):
+            self.surface_patches += self.multiplier * _surface_patches(node)
+        self.generic_visit(node)
+
+
+def estimate_render_cost(code: str, quality_flag: str = "-ql") -> Optional[RenderCostEstimate]:
+    """Rough relative cost of rendering a scene, from its source alone. None if it doesn't parse.
+
+    Adds up play() run_times and wait() durations (multiplied through loops
+    with readable bounds), then scales by quality and by how heavy each frame
+    is: 3D scenes and Surface patch counts. LaTeX objects add a fixed compile
+    cost each.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    visitor = _CostVisitor()
+    visitor.visit(tree)
+
+    frame_cost = 1.0
+    if visitor.three_d:
+        frame_cost *= 3.0
+    if visitor.surface_patches:
+        frame_cost *= 1.0 + visitor.surface_patches / DEFAULT_SURFACE_PATCHES
+    cost = (BASE_COST
+            + visitor.animation_seconds * frame_cost * QUALITY_COST.get(quality_flag, 1.0)
+            + visitor.tex_count * TEX_COST
+            + visitor.text_count * TEXT_COST)
+    return RenderCostEstimate(
+        animation_seconds=round(visitor.animation_seconds, 2),
+        play_calls=visitor.play_calls,
+        wait_calls=visitor.wait_calls,
+        tex_count=visitor.tex_count,
+        text_count=visitor.text_count,
+        three_d=visitor.three_d,
+        surface_patches=visitor.surface_patches,
+        cost=round(cost, 2),
+    )
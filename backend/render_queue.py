@@ -0,0 +1,261 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the render queue cannot admit another task."""
+
+
+SCHEDULING_POLICIES = ("fifo", "sjf", "wfq")
+
+
+@dataclass
+class RenderJob:
+    task_id: str
+    run: Callable[[], Awaitable]
+    future: asyncio.Future
+    seq: int = 0
+    # Estimated render cost (see render_cost.py); None when unknown
+    cost: Optional[float] = None
+    # Jobs from the same flow (e.g. client) share a fair-queuing budget
+    flow: Optional[str] = None
+    finish_tag: float = 0.0
+    enqueued_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    # The submitter's context variables (e.g. the current trace span), for running the job in
+    context: contextvars.Context = field(default_factory=contextvars.copy_context)
+
+
+class RenderQueue:
+    """Bounded pool of render workers fed from a scheduled job queue.
+
+    Admission is checked once per task when /generate is called: a task holds
+    its slot from admission until it is released, so the LLM stage counts
+    towards the limit too. Only the render step itself is run by the workers.
+
+    Waiting jobs are picked by ``policy``:
+
+    - ``fifo``: arrival order.
+    - ``sjf``: lowest estimated cost first, with the cost reduced by
+      ``aging`` per second waited so heavy jobs still run eventually.
+    - ``wfq``: self-clocked fair queuing across flows (clients), so a client
+      submitting heavy scenes only delays its own later jobs.
+    """
+
+    def __init__(self, num_workers: int = 2, max_pending: int = 20, policy: str = "fifo", aging: float = 1.0):
+        if policy not in SCHEDULING_POLICIES:
+            raise ValueError(f"Unknown render scheduling policy {policy!r}, expected one of {SCHEDULING_POLICIES}")
+        self.num_workers = max(1, num_workers)
+        self.max_pending = max(1, max_pending)
+        self.policy = policy
+        self.aging = aging
+        self._jobs: list[RenderJob] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._flow_finish: dict[str, float] = {}
+        # Observed render seconds per unit of estimated cost, for wait estimates
+        self._seconds_per_cost: Optional[float] = None
+        self._active: dict[str, RenderJob] = {}
+        self._admitted: set[str] = set()
+        self._wakeup: Optional[asyncio.Condition] = None
+        self._workers: list[asyncio.Task] = []
+        # Recent render durations, used to estimate wait for queued jobs
+        self._recent_durations: list[float] = []
+
+    async def start(self):
+        """Start the worker coroutines. Must be called from the running loop."""
+        if self._workers:
+            return
+        self._wakeup = asyncio.Condition()
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.num_workers)
+        ]
+        logger.info(f"Started {self.num_workers} render workers (max pending: {self.max_pending})")
+
+    async def stop(self):
+        """Cancel the workers and fail any job still waiting in the queue."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for job in self._jobs:
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Render queue shut down"))
+        self._jobs.clear()
+
+    def admit(self, task_id: str, force: bool = False):
+        """Reserve a slot for a new task or raise QueueFullError.
+
+        ``force`` skips the limit check, for tasks that were already admitted
+        before a restart.
+        """
+        if not force and len(self._admitted) >= self.max_pending:
+            raise QueueFullError(
+                f"Server is busy ({len(self._admitted)} tasks in progress), please retry shortly"
+            )
+        self._admitted.add(task_id)
+
+    def release(self, task_id: str):
+        """Give back the slot reserved by admit()."""
+        self._admitted.discard(task_id)
+
+    async def submit(self, task_id: str, run: Callable[[], Awaitable],
+                     cost: Optional[float] = None, flow: Optional[str] = None):
+        """Queue a render job and wait for a worker to run it.
+
+        ``cost`` is the job's estimated render cost and ``flow`` groups jobs
+        for fair queuing; both only matter to the sjf and wfq policies.
+        Returns whatever ``run`` returns; exceptions raised by ``run`` are
+        re-raised here.
+        """
+        if self._wakeup is None:
+            raise RuntimeError("Render queue has not been started")
+        job = RenderJob(task_id=task_id, run=run, future=asyncio.get_running_loop().create_future(),
+                        seq=next(self._seq), cost=cost, flow=flow or task_id)
+        # Fair-queuing finish tag: the flow's previous tag (or now), plus this job's cost
+        start_tag = max(self._virtual_time, self._flow_finish.get(job.flow, 0.0))
+        job.finish_tag = start_tag + self._job_cost(job)
+        self._flow_finish[job.flow] = job.finish_tag
+        async with self._wakeup:
+            self._jobs.append(job)
+            self._wakeup.notify()
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            # Caller gave up before a worker picked the job up
+            if job in self._jobs:
+                self._jobs.remove(job)
+            raise
+
+    async def _worker(self, index: int):
+        while True:
+            async with self._wakeup:
+                while not self._jobs:
+                    await self._wakeup.wait()
+                job = self._jobs.pop(self._next_index())
+                self._virtual_time = max(self._virtual_time, job.finish_tag)
+                self._forget_idle_flows()
+            if job.future.done():
+                continue
+
+            job.started_at = time.time()
+            self._active[job.task_id] = job
+            run = job.context.run(asyncio.ensure_future, job.run())
+            # A caller that gives up mid-render stops the render too
+            job.future.add_done_callback(lambda future, run=run: run.cancel() if future.cancelled() else None)
+            try:
+                await asyncio.wait([run])
+                if run.cancelled():
+                    continue
+                if not job.future.done():
+                    if run.exception() is not None:
+                        job.future.set_exception(run.exception())
+                    else:
+                        job.future.set_result(run.result())
+            except asyncio.CancelledError:
+                run.cancel()
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            finally:
+                self._active.pop(job.task_id, None)
+                self._record_duration(job, time.time() - job.started_at)
+
+    def _job_cost(self, job: RenderJob) -> float:
+        if job.cost is not None:
+            return job.cost
+        # Unknown cost: assume a typical job
+        known = [j.cost for j in self._jobs if j.cost is not None]
+        return sum(known) / len(known) if known else 1.0
+
+    def _priority(self, job: RenderJob, now: float) -> tuple:
+        if self.policy == "sjf":
+            return self._job_cost(job) - self.aging * (now - job.enqueued_at), job.seq
+        if self.policy == "wfq":
+            return job.finish_tag, job.seq
+        return (job.seq,)
+
+    def _next_index(self) -> int:
+        now = time.time()
+        return min(range(len(self._jobs)), key=lambda i: self._priority(self._jobs[i], now))
+
+    def _ordered(self) -> list[RenderJob]:
+        """Waiting jobs in the order the scheduler would start them."""
+        now = time.time()
+        return sorted(self._jobs, key=lambda job: self._priority(job, now))
+
+    def _forget_idle_flows(self):
+        # Flows whose last tag is behind the virtual clock have nothing queued; drop them
+        if len(self._flow_finish) > 1000:
+            self._flow_finish = {flow: tag for flow, tag in self._flow_finish.items() if tag > self._virtual_time}
+
+    def _record_duration(self, job: RenderJob, duration: float):
+        self._recent_durations.append(duration)
+        if len(self._recent_durations) > 50:
+            self._recent_durations.pop(0)
+        if job.cost:
+            ratio = duration / job.cost
+            self._seconds_per_cost = ratio if self._seconds_per_cost is None \
+                else 0.8 * self._seconds_per_cost + 0.2 * ratio
+
+    def position(self, task_id: str) -> Optional[int]:
+        """1-based position of a task in the queue, 0 if rendering, None if unknown."""
+        if task_id in self._active:
+            return 0
+        for i, job in enumerate(self._ordered()):
+            if job.task_id == task_id:
+                return i + 1
+        return None
+
+    def queue_info(self, task_id: str) -> dict:
+        """Queue details for the status endpoint."""
+        info = {
+            "queue_position": self.position(task_id),
+            "queue_depth": len(self._jobs),
+            "queue_wait_time": None,
+            "estimated_wait_time": None,
+        }
+        job = self._active.get(task_id) or next(
+            (j for j in self._jobs if j.task_id == task_id), None
+        )
+        if job is not None:
+            waited_until = job.started_at or time.time()
+            info["queue_wait_time"] = round(waited_until - job.enqueued_at, 2)
+        if info["queue_position"] and self._seconds_per_cost is not None:
+            # Work scheduled ahead of this job, spread over the workers
+            ahead = self._ordered()[:info["queue_position"] - 1]
+            work = sum(self._job_cost(j) for j in ahead) * self._seconds_per_cost
+            info["estimated_wait_time"] = round(work / self.num_workers, 2)
+        elif info["queue_position"] and self._recent_durations:
+            avg_duration = sum(self._recent_durations) / len(self._recent_durations)
+            rounds = math.ceil(info["queue_position"] / self.num_workers)
+            info["estimated_wait_time"] = round(avg_duration * rounds, 2)
+        return info
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.num_workers,
+            "policy": self.policy,
+            "active": len(self._active),
+            "queued": len(self._jobs),
+            "admitted": len(self._admitted),
+            "max_pending": self.max_pending,
+        }
+
+
+def render_queue_from_env() -> RenderQueue:
+    return RenderQueue(
+        num_workers=int(os.getenv("RENDER_WORKERS", "2")),
+        max_pending=int(os.getenv("RENDER_QUEUE_MAX", "20")),
+        policy=os.getenv("RENDER_SCHEDULER", "sjf"),
+        aging=float(os.getenv("RENDER_SJF_AGING", "1.0")),
+    )
@@ -0,0 +1,73 @@
+"""Resource-limited launcher for render commands.
+
+    python render_sandbox.py --cpu-seconds 300 --memory-bytes 2147483648 \
+        --file-size-bytes 524288000 --usage-file usage.json -- manim scene.py -ql ...
+
+Applies the rlimits to itself so the command and everything it starts
+inherits them, runs the command, and once it exits writes the resource usage
+of the whole process tree to --usage-file as JSON. Exits with the command's
+exit code, or 128 + signal number if it was killed by a signal (e.g. SIGXCPU
+when the CPU limit is hit).
+
+The limits are per process and per file, not totals: --file-size-bytes
+(RLIMIT_FSIZE) caps the size of any single file the render writes, not the
+media directory as a whole, and each process in the tree gets its own
+--cpu-seconds and --memory-bytes.
+"""
+import argparse
+import json
+import resource
+import signal
+import subprocess
+import sys
+import time
+
+
+def apply_limits(cpu_seconds: int = 0, memory_bytes: int = 0, file_size_bytes: int = 0):
+    """Lower the soft and hard rlimits of the current process. 0 leaves a limit unchanged."""
+    if cpu_seconds:
+        # SIGXCPU at the soft limit, SIGKILL a few seconds later if it is ignored
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 5))
+    if memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    if file_size_bytes:
+        resource.setrlimit(resource.RLIMIT_FSIZE, (file_size_bytes, file_size_bytes))
+
+
+def usage_since(before: resource.struct_rusage, after: resource.struct_rusage) -> dict:
+    return {
+        "cpu_user_seconds": round(after.ru_utime - before.ru_utime, 3),
+        "cpu_system_seconds": round(after.ru_stime - before.ru_stime, 3),
+        # ru_maxrss is in kilobytes on Linux, and is a high-water mark rather than a delta
+        "max_rss_bytes": after.ru_maxrss * 1024,
+        "fs_writes": after.ru_oublock - before.ru_oublock,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cpu-seconds", type=int, default=0)
+    parser.add_argument("--memory-bytes", type=int, default=0)
+    parser.add_argument("--file-size-bytes", type=int, default=0)
+    parser.add_argument("--usage-file", required=True)
+    parser.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+
+    apply_limits(args.cpu_seconds, args.memory_bytes, args.file_size_bytes)
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.time()
+    returncode = subprocess.call(command)
+    usage = usage_since(before, resource.getrusage(resource.RUSAGE_CHILDREN))
+    usage["wall_seconds"] = round(time.time() - start, 3)
+    if returncode < 0:
+        usage["signal"] = signal.Signals(-returncode).name
+        returncode = 128 - returncode
+
+    with open(args.usage_file, "w") as f:
+        json.dump(usage, f)
+    sys.exit(returncode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Long-lived manim render worker.
+
+Started by WarmRenderPool in renderer.py. Imports manim once, then reads one
+JSON job per line on stdin and writes one JSON result per line on stdout:
+
+    job:    {"code": str, "code_file": str, "quality_flag": "-ql" | "-qh",
+             "media_dir": str, "output_file": str, "log_file": str, "cpu_seconds": int,
+             "disable_caching": bool}
+    result: {"returncode": int, "stdout": str, "rss_bytes": int, "duration": float,
+             "resource_usage": dict}
+
+Everything manim prints during a job (including the progress bars) goes to
+the job's log_file, which the pool tails for progress and returns as stderr.
+A job that runs past its cpu_seconds gets SIGXCPU, which ends the worker.
+"""
+import ast
+import json
+import os
+import resource
+import sys
+import time
+import traceback
+import types
+
+from code_validator import renderable_scenes
+from render_sandbox import usage_since
+
+QUALITY_FLAGS = {
+    "-ql": "low_quality",
+    "-qm": "medium_quality",
+    "-qh": "high_quality",
+    "-qp": "production_quality",
+    "-qk": "fourk_quality",
+}
+
+
+def current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def render_job(job: dict) -> int:
+    """Render the job's Scene. Returns a process-style exit code.
+
+    The scene is the first Scene subclass that no other scene in the code
+    builds on, as code_validator sees it. The code runs inside tempconfig,
+    so module-level ``config`` changes apply to this job only.
+    """
+    from manim import Scene, tempconfig
+
+    overrides = {
+        "quality": QUALITY_FLAGS.get(job["quality_flag"], "low_quality"),
+        "media_dir": job["media_dir"],
+        "output_file": job["output_file"],
+        "input_file": job["code_file"],
+        "disable_caching": job.get("disable_caching", False),
+    }
+    module = types.ModuleType("scene")
+    module.__file__ = job["code_file"]
+    with tempconfig(overrides):
+        try:
+            tree = compile(job["code"], job["code_file"], "exec", flags=ast.PyCF_ONLY_AST)
+            exec(compile(tree, job["code_file"], "exec"), module.__dict__)
+        except Exception:
+            traceback.print_exc()
+            return 1
+
+        scenes = [module.__dict__.get(node.name) for node in renderable_scenes(tree)]
+        scenes = [obj for obj in scenes if isinstance(obj, type) and issubclass(obj, Scene)]
+        if not scenes:
+            print("No scenes inside that module", file=sys.stderr)
+            return 1
+
+        try:
+            scenes[0]().render()
+        except Exception:
+            traceback.print_exc()
+            return 1
+    return 0
+
+
+def job_usage() -> resource.struct_rusage:
+    """CPU usage of this worker plus any processes it started (ffmpeg)."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return resource.struct_rusage((
+        own.ru_utime + children.ru_utime, own.ru_stime + children.ru_stime, max(own.ru_maxrss, children.ru_maxrss),
+        *(a + b for a, b in zip(tuple(own)[3:], tuple(children)[3:])),
+    ))
+
+
+def limit_cpu(seconds: int):
+    """Allow this job ``seconds`` more CPU time than the worker has used so far."""
+    if not seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    # Only the soft limit moves; an unprivileged process can't raise the hard limit again later
+    soft = int(usage.ru_utime + usage.ru_stime) + seconds
+    resource.setrlimit(resource.RLIMIT_CPU, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+
+
+def main():
+    # Keep the real stdout for the protocol and send anything else printed to stderr
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    os.dup2(2, 1)
+    original_stderr = os.dup(2)
+
+    # Pay the import cost once, before any job arrives
+    import manim
+    protocol.write(json.dumps({"ready": True, "pid": os.getpid(), "manim_version": manim.__version__}) + "\n")
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        start = time.time()
+        before = job_usage()
+        limit_cpu(job.get("cpu_seconds", 0))
+        log = os.open(job["log_file"], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(log, 1)
+        os.dup2(log, 2)
+        try:
+            returncode = render_job(job)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(original_stderr, 1)
+            os.dup2(original_stderr, 2)
+            os.close(log)
+        protocol.write(json.dumps({
+            "returncode": returncode,
+            "stdout": "",
+            "rss_bytes": current_rss_bytes(),
+            "duration": time.time() - start,
+            "resource_usage": {**usage_since(before, job_usage()), "wall_seconds": round(time.time() - start, 3)},
+        }) + "\n")
+
+
+if __name__ == "__main__":
+    main()
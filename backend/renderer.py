@@ -0,0 +1,425 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import signal
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from render_sandbox import apply_limits
+
+logger = logging.getLogger(__name__)
+
+# Matches manim's tqdm progress bars, e.g. "Animation 3: Create(Circle):  45%|####  | 27/60"
+PROGRESS_RE = re.compile(r"Animation (\d+)\b.*?(\d+)%\|")
+
+
+@dataclass
+class RenderResult:
+    returncode: int
+    stdout: str
+    stderr: str
+    # timeout, cpu_limit, memory_limit or output_limit when a sandbox limit stopped the render
+    failure_reason: Optional[str] = None
+    resource_usage: Optional[dict] = None
+
+
+@dataclass
+class RenderLimits:
+    """Per-render resource caps. 0 disables a limit."""
+    timeout_seconds: float = 600
+    cpu_seconds: int = 300
+    memory_bytes: int = 4 * 1024 ** 3
+    # Size of each written file (RLIMIT_FSIZE), not the render's total output
+    output_bytes: int = 512 * 1024 ** 2
+
+    def describe(self, reason: str) -> str:
+        return {
+            "timeout": f"Render exceeded the {self.timeout_seconds:g}s time limit and was stopped. "
+                       f"Avoid long waits and unbounded loops",
+            "cpu_limit": f"Render used more than {self.cpu_seconds}s of CPU time and was stopped. "
+                         f"Use fewer or simpler animations",
+            "memory_limit": f"Render ran out of memory (limit {self.memory_bytes // 1024 ** 2} MB). "
+                            f"Use fewer mobjects",
+            "output_limit": f"Render wrote a file larger than {self.output_bytes // 1024 ** 2} MB and was stopped. "
+                            f"Make the animation shorter",
+        }[reason]
+
+
+def classify_failure(returncode: int, stderr: str, usage: Optional[dict] = None) -> Optional[str]:
+    """Name the sandbox limit that ended a failed render, if any."""
+    if returncode == 0:
+        return None
+    signal_name = (usage or {}).get("signal")
+    if signal_name == "SIGXCPU" or returncode in (-signal.SIGXCPU, 128 + signal.SIGXCPU):
+        return "cpu_limit"
+    if signal_name == "SIGXFSZ" or "File too large" in stderr:
+        return "output_limit"
+    if "MemoryError" in stderr or "Cannot allocate memory" in stderr or "bad_alloc" in stderr:
+        return "memory_limit"
+    return None
+
+
+def parse_progress(line: str) -> Optional[tuple[int, int]]:
+    """Return (animation index, percent) from a manim progress bar line."""
+    match = PROGRESS_RE.search(line)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+async def _read_stream(stream: asyncio.StreamReader, on_line: Optional[Callable[[str], None]] = None) -> str:
+    """Read a pipe to EOF, calling on_line for each line or progress-bar redraw."""
+    chunks = []
+    pending = ""
+    while True:
+        data = await stream.read(4096)
+        if not data:
+            break
+        text = data.decode(errors="replace")
+        chunks.append(text)
+        if on_line is None:
+            continue
+        # tqdm redraws with carriage returns rather than newlines
+        pending += text
+        *lines, pending = re.split(r"[\r\n]", pending)
+        for line in lines:
+            on_line(line)
+    if on_line is not None and pending:
+        on_line(pending)
+    return "".join(chunks)
+
+
+async def kill_process_group(process: asyncio.subprocess.Process):
+    """SIGKILL a process started with start_new_session and everything it spawned."""
+    if process.returncode is None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+async def run_manim(code_file: Path, quality_flag: str, media_dir: Path, output_file: Path,
+                    on_progress: Optional[Callable[[int, int], None]] = None,
+                    limits: Optional[RenderLimits] = None, scene_name: Optional[str] = None,
+                    disable_caching: bool = False) -> RenderResult:
+    """Render a scene file with the manim CLI.
+
+    ``on_progress(animation_index, percent)`` is called as manim reports
+    progress on stderr. With ``limits``, manim runs under render_sandbox.py
+    and the whole process group is killed once the wall-clock limit passes.
+    ``scene_name`` picks one scene from a file that defines several.
+    ``disable_caching`` makes manim number its partial movie files in order
+    (for hls.py) instead of naming them by content hash.
+    """
+    command = [
+        "manim",
+        str(code_file),
+        quality_flag,
+        "--media_dir", str(media_dir.absolute()),
+        "--output_file", str(output_file.absolute()),
+    ]
+    if disable_caching:
+        command.append("--disable_caching")
+    if scene_name is not None:
+        command.append(scene_name)
+    usage_file = media_dir / "usage.json"
+    if limits is not None:
+        media_dir.mkdir(parents=True, exist_ok=True)
+        usage_file.unlink(missing_ok=True)
+        command = [
+            sys.executable, str(Path(__file__).parent / "render_sandbox.py"),
+            "--cpu-seconds", str(limits.cpu_seconds),
+            "--memory-bytes", str(limits.memory_bytes),
+            "--file-size-bytes", str(limits.output_bytes),
+            "--usage-file", str(usage_file.absolute()),
+            "--", *command,
+        ]
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        # Own process group so cancelling also stops the ffmpeg processes manim starts
+        start_new_session=True,
+    )
+
+    def handle_stderr_line(line: str):
+        progress = parse_progress(line)
+        if progress is not None and on_progress is not None:
+            on_progress(*progress)
+
+    readers = asyncio.gather(
+        _read_stream(process.stdout),
+        _read_stream(process.stderr, handle_stderr_line),
+    )
+    timed_out = False
+    try:
+        try:
+            await asyncio.wait_for(asyncio.shield(readers),
+                                   timeout=limits.timeout_seconds if limits and limits.timeout_seconds else None)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await kill_process_group(process)
+        # Killing the group closes the pipes, so this returns whatever was printed so far
+        stdout, stderr = await readers
+        await process.wait()
+    except asyncio.CancelledError:
+        readers.cancel()
+        await kill_process_group(process)
+        # Retrieve the readers' cancellation so it isn't reported as never retrieved
+        await asyncio.gather(readers, return_exceptions=True)
+        raise
+
+    usage = None
+    if limits is not None:
+        try:
+            usage = json.loads(usage_file.read_text())
+        except (OSError, ValueError):
+            pass
+    reason = "timeout" if timed_out else classify_failure(process.returncode, stderr, usage)
+    return RenderResult(returncode=process.returncode, stdout=stdout, stderr=stderr,
+                        failure_reason=reason, resource_usage=usage)
+
+
+class RenderWorker:
+    """One long-lived render_worker.py process with manim already imported."""
+
+    def __init__(self, process: asyncio.subprocess.Process, manim_version: Optional[str]):
+        self.process = process
+        self.manim_version = manim_version
+        self.jobs_done = 0
+        self.rss_bytes = 0
+        self.started_at = time.time()
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    @classmethod
+    async def spawn(cls, limits: Optional[RenderLimits] = None, startup_timeout: float = 120.0) -> "RenderWorker":
+        # Memory and output caps hold for the worker's lifetime; the CPU cap is set per job by the worker
+        preexec_fn = (lambda: apply_limits(0, limits.memory_bytes, limits.output_bytes)) if limits else None
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, str(Path(__file__).parent / "render_worker.py"),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            # Own process group so the whole render can be killed together
+            start_new_session=True,
+            preexec_fn=preexec_fn,
+        )
+        try:
+            line = await asyncio.wait_for(process.stdout.readline(), timeout=startup_timeout)
+            hello = json.loads(line) if line else {}
+        except (asyncio.TimeoutError, json.JSONDecodeError):
+            hello = {}
+        if not hello.get("ready"):
+            process.kill()
+            await process.wait()
+            raise RuntimeError("Render worker failed to start (is manim installed?)")
+        return cls(process, hello.get("manim_version"))
+
+    async def run(self, job: dict) -> dict:
+        self.process.stdin.write((json.dumps(job) + "\n").encode())
+        await self.process.stdin.drain()
+        line = await self.process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"Render worker {self.pid} exited unexpectedly")
+        result = json.loads(line)
+        self.jobs_done += 1
+        self.rss_bytes = result.get("rss_bytes", 0)
+        return result
+
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def stop(self):
+        if self.alive():
+            try:
+                self.process.stdin.close()
+                await asyncio.wait_for(self.process.wait(), timeout=5)
+            except (asyncio.TimeoutError, ConnectionError):
+                self.process.kill()
+                await self.process.wait()
+
+
+async def _tail_progress(log_file: Path, on_progress: Callable[[int, int], None], interval: float = 0.5):
+    """Follow a worker's job log and report manim progress bars until cancelled."""
+    position = 0
+    pending = ""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            with open(log_file, "r", errors="replace") as f:
+                f.seek(position)
+                data = f.read()
+                position = f.tell()
+        except FileNotFoundError:
+            continue
+        pending += data
+        *lines, pending = re.split(r"[\r\n]", pending)
+        for line in lines:
+            progress = parse_progress(line)
+            if progress is not None:
+                on_progress(*progress)
+
+
+class WarmRenderPool:
+    """Pool of pre-imported manim worker processes.
+
+    Each worker renders scenes from code strings sent over a pipe, so jobs
+    skip the Python, manim and cairo/pango import cost of a fresh ``manim``
+    process. Workers are recycled after ``max_jobs`` renders or once their
+    RSS grows past ``max_rss_bytes``, and replaced if they crash.
+    """
+
+    def __init__(self, size: int = 2, max_jobs: int = 20, max_rss_bytes: int = 1024 ** 3,
+                 limits: Optional[RenderLimits] = None):
+        self.size = max(1, size)
+        self.max_jobs = max_jobs
+        self.max_rss_bytes = max_rss_bytes
+        self.limits = limits
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: set[RenderWorker] = set()
+        self.recycled = 0
+        self.crashed = 0
+        self.failed_spawns = 0
+
+    async def start(self):
+        """Spawn the workers in the background so app startup isn't blocked on manim imports."""
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            asyncio.create_task(self._add_worker())
+
+    async def _add_worker(self):
+        try:
+            worker = await RenderWorker.spawn(self.limits)
+        except Exception as e:
+            self.failed_spawns += 1
+            logger.error(f"Could not start warm render worker: {e}")
+            # Hand out a placeholder so a waiting render falls back to the CLI
+            await self._idle.put(None)
+            return
+        self._workers.add(worker)
+        logger.info(f"Warm render worker {worker.pid} ready (manim {worker.manim_version})")
+        await self._idle.put(worker)
+
+    async def _retire(self, worker: RenderWorker, kill: bool = False):
+        self._workers.discard(worker)
+        if kill:
+            await kill_process_group(worker.process)
+        else:
+            await worker.stop()
+        asyncio.create_task(self._add_worker())
+
+    async def stop(self):
+        await asyncio.gather(*(worker.stop() for worker in list(self._workers)), return_exceptions=True)
+        self._workers.clear()
+
+    async def render(self, code: str, code_file: Path, quality_flag: str, media_dir: Path,
+                     output_file: Path, on_progress: Optional[Callable[[int, int], None]] = None,
+                     disable_caching: bool = False) -> Optional[RenderResult]:
+        """Render on a warm worker. Returns None if no worker could be started."""
+        worker = await self._idle.get()
+        if worker is None:
+            # Spawning failed; try again for the next job
+            asyncio.create_task(self._add_worker())
+            return None
+
+        log_file = media_dir / "render.log"
+        media_dir.mkdir(parents=True, exist_ok=True)
+        job = {
+            "code": code,
+            "code_file": str(code_file.absolute()),
+            "quality_flag": quality_flag,
+            "media_dir": str(media_dir.absolute()),
+            "output_file": str(output_file.absolute()),
+            "log_file": str(log_file.absolute()),
+            "cpu_seconds": self.limits.cpu_seconds if self.limits else 0,
+            "disable_caching": disable_caching,
+        }
+        timeout = self.limits.timeout_seconds if self.limits and self.limits.timeout_seconds else None
+        tail = asyncio.create_task(_tail_progress(log_file, on_progress)) if on_progress else None
+        try:
+            result = await asyncio.wait_for(worker.run(job), timeout=timeout)
+        except asyncio.TimeoutError:
+            await self._retire(worker, kill=True)
+            stderr = log_file.read_text(errors="replace") if log_file.exists() else ""
+            return RenderResult(returncode=-signal.SIGKILL, stdout="", stderr=stderr, failure_reason="timeout")
+        except BaseException as e:
+            # Crashed or cancelled mid-job: the worker's state is unknown, replace it
+            if isinstance(e, asyncio.CancelledError):
+                # Abandoned render: kill it rather than wait for it to finish
+                await asyncio.shield(self._retire(worker, kill=True))
+                raise
+            self.crashed += 1
+            await self._retire(worker)
+            stderr = log_file.read_text(errors="replace") if log_file.exists() else ""
+            # A worker killed by SIGXCPU has a negative exit code naming the signal
+            returncode = worker.process.returncode if worker.process.returncode is not None else -1
+            return RenderResult(returncode=returncode, stdout="", stderr=f"{stderr}\n{e}",
+                                failure_reason=classify_failure(returncode, stderr))
+        finally:
+            if tail is not None:
+                tail.cancel()
+
+        if worker.jobs_done >= self.max_jobs or worker.rss_bytes > self.max_rss_bytes:
+            self.recycled += 1
+            logger.info(f"Recycling render worker {worker.pid} after {worker.jobs_done} jobs "
+                        f"({worker.rss_bytes / 1024 / 1024:.0f} MB RSS)")
+            asyncio.create_task(self._retire(worker))
+        else:
+            await self._idle.put(worker)
+
+        stderr = log_file.read_text(errors="replace") if log_file.exists() else ""
+        if on_progress is not None:
+            for line in re.split(r"[\r\n]", stderr)[-5:]:
+                progress = parse_progress(line)
+                if progress is not None:
+                    on_progress(*progress)
+        return RenderResult(returncode=result["returncode"], stdout=result.get("stdout", ""), stderr=stderr,
+                            failure_reason=classify_failure(result["returncode"], stderr),
+                            resource_usage=result.get("resource_usage"))
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "workers": [
+                {"pid": w.pid, "jobs_done": w.jobs_done, "rss_bytes": w.rss_bytes,
+                 "uptime": round(time.time() - w.started_at, 1)}
+                for w in self._workers
+            ],
+            "idle": self._idle.qsize() if self._idle else 0,
+            "recycled": self.recycled,
+            "crashed": self.crashed,
+            "failed_spawns": self.failed_spawns,
+        }
+
+
+def render_limits_from_env() -> Optional[RenderLimits]:
+    """Build the render sandbox limits, or None if RENDER_SANDBOX is disabled."""
+    if os.getenv("RENDER_SANDBOX", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return RenderLimits(
+        timeout_seconds=float(os.getenv("RENDER_TIMEOUT_SECONDS", "600")),
+        cpu_seconds=int(os.getenv("RENDER_CPU_SECONDS", "300")),
+        memory_bytes=int(float(os.getenv("RENDER_MEMORY_MB", "4096")) * 1024 * 1024),
+        output_bytes=int(float(os.getenv("RENDER_MAX_OUTPUT_MB", "512")) * 1024 * 1024),
+    )
+
+
+def warm_pool_from_env(size: int, limits: Optional[RenderLimits] = None) -> Optional[WarmRenderPool]:
+    """Build the warm worker pool, or None when RENDER_BACKEND is "cli"."""
+    if os.getenv("RENDER_BACKEND", "warm") != "warm":
+        return None
+    return WarmRenderPool(
+        size=size,
+        max_jobs=int(os.getenv("RENDER_WORKER_MAX_JOBS", "20")),
+        max_rss_bytes=int(float(os.getenv("RENDER_WORKER_MAX_RSS_MB", "1024")) * 1024 * 1024),
+        limits=limits,
+    )
@@ -1,18 +1,94 @@
 from pathlib import Path
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import os
 from typing import Optional
 import logging
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import functools
+import json
+import shutil
 import subprocess
-import tempfile
+import time
+from encoding import encoding_args, encoding_profile_from_env
+from metrics import registry
+from renderer import kill_process_group
+from tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+compression_seconds = registry.histogram("manim_compression_seconds", "ffmpeg compression time before upload")
+upload_seconds = registry.histogram("manim_upload_seconds", "Time to upload an object to Spaces", ("kind",))
+uploaded_bytes = registry.counter("manim_uploaded_bytes_total", "Bytes uploaded to Spaces", ("kind",))
+stream_fallbacks = registry.counter("manim_stream_upload_fallbacks_total",
+                                    "Streamed transcode-and-upload attempts that fell back to a file", ("reason",))
+
+# Fragmented MP4 needs no seeking back to write the index, so ffmpeg can write it to a pipe
+FRAGMENTED_MP4_ARGS = ['-movflags', 'frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4']
+# S3 rejects multipart parts below 5 MiB, except the last one
+MIN_PART_BYTES = 5 * 1024 ** 2
+
+
+async def compress_for_upload(input_path: Path, encode_args: list[str]) -> Optional[Path]:
+    """Compress video using ffmpeg with encode_args (see encoding.py).
+
+    Returns the smaller file, or None to upload the original.
+    """
+    try:
+        output_path = input_path.with_suffix('.compressed.mp4')
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg', '-i', str(input_path),
+            *encode_args,
+            '-y',  # Overwrite output file if it exists
+            str(output_path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            # The task was cancelled: don't leave ffmpeg running
+            process.kill()
+            await process.wait()
+            raise
+        
+        if process.returncode != 0:
+            logger.warning(f"Video compression failed: {stderr.decode()}")
+            return None
+            
+        if output_path.exists() and output_path.stat().st_size < input_path.stat().st_size:
+            return output_path
+        return None
+        
+    except Exception as e:
+        logger.warning(f"Error during video compression: {str(e)}")
+        return None
+
+
 class SpacesStorage:
-    def __init__(self):
+    """Videos and code in a DigitalOcean Spaces bucket.
+
+    boto3 is synchronous, so every call runs on a dedicated thread pool of
+    ``io_threads`` and the event loop keeps serving requests during uploads.
+    The client's connection pool is shared by those threads and by the
+    parallel part uploads of large files (``multipart_concurrency`` parts of
+    ``multipart_chunk_bytes`` at a time).
+
+    With ``stream_uploads``, videos are transcoded to fragmented MP4 on
+    ffmpeg's stdout and uploaded part by part while ffmpeg is still encoding,
+    instead of compressing to a file and uploading that afterwards.
+    ``encoding_profile`` names the encoding.py profile, or "auto" to pick
+    one from the quality each video was rendered at.
+    """
+
+    def __init__(self, io_threads: int = 8, multipart_threshold_bytes: int = 8 * 1024 ** 2,
+                 multipart_chunk_bytes: int = 8 * 1024 ** 2, multipart_concurrency: int = 4,
+                 stream_uploads: bool = False, encoding_profile: str = "auto"):
         self.session = boto3.session.Session()
         
         # Validate environment variables
@@ -25,9 +101,26 @@ class SpacesStorage:
             region_name="sfo3",
             endpoint_url="https://sfo3.digitaloceanspaces.com",
             aws_access_key_id=os.getenv("DO_BUCKET_ID"),
-            aws_secret_access_key=os.getenv("DO_BUCKET_SECRET")
+            aws_secret_access_key=os.getenv("DO_BUCKET_SECRET"),
+            config=Config(
+                # Every I/O thread can run a full multipart upload without waiting for a connection
+                max_pool_connections=io_threads * multipart_concurrency,
+                retries={"max_attempts": 5, "mode": "adaptive"},
+                tcp_keepalive=True,
+            )
         )
         self.bucket = os.getenv("DO_BUCKET_NAME")
+        self.executor = ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix="spaces-io")
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold_bytes,
+            multipart_chunksize=multipart_chunk_bytes,
+            max_concurrency=multipart_concurrency,
+            use_threads=multipart_concurrency > 1,
+        )
+        self.multipart_concurrency = multipart_concurrency
+        self.part_bytes = max(multipart_chunk_bytes, MIN_PART_BYTES)
+        self.stream_uploads = stream_uploads
+        self.encoding_profile = encoding_profile
         
         # Validate bucket access on startup
         try:
@@ -36,57 +129,171 @@ class SpacesStorage:
         except ClientError as e:
             raise ValueError(f"Failed to access Spaces bucket {self.bucket}: {str(e)}")
 
-    async def compress_video(self, input_path: Path) -> Optional[Path]:
+    async def _run(self, function, *args, **kwargs):
+        """Run a blocking boto3 call on the I/O pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    async def compress_video(self, input_path: Path, encode_args: list[str]) -> Optional[Path]:
         """Compress video using ffmpeg before upload."""
+        return await compress_for_upload(input_path, encode_args)
+
+    async def stream_video(self, video_path: Path, key: str,
+                           encode_args: list[str]) -> tuple[Optional[int], Optional[str]]:
+        """Transcode with ffmpeg and upload its output as it is produced.
+
+        Parts of ``part_bytes`` are uploaded as soon as ffmpeg has written
+        them, ``multipart_concurrency`` at a time, and ffmpeg's output stops
+        being read while that many are in flight. Output smaller than one part
+        goes up with a single put_object. Returns the bytes uploaded, or None
+        and the reason the caller should upload the file instead: the
+        transcode failed (ffmpeg_missing, ffmpeg_failed), came out bigger than
+        the original (not_smaller) or could not be uploaded (upload_failed).
+        """
         try:
-            output_path = input_path.with_suffix('.compressed.mp4')
             process = await asyncio.create_subprocess_exec(
-                'ffmpeg', '-i', str(input_path),
-                '-c:v', 'libx264', '-crf', '23',
-                '-preset', 'medium',
-                '-y',  # Overwrite output file if it exists
-                str(output_path),
+                'ffmpeg', '-i', str(video_path), *encode_args, *FRAGMENTED_MP4_ARGS, 'pipe:1',
                 stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True
             )
-            
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode != 0:
-                logger.warning(f"Video compression failed: {stderr.decode()}")
-                return None
-                
-            if output_path.exists() and output_path.stat().st_size < input_path.stat().st_size:
-                return output_path
-            return None
-            
-        except Exception as e:
-            logger.warning(f"Error during video compression: {str(e)}")
-            return None
+        except OSError as e:
+            logger.warning(f"Could not start ffmpeg for a streamed upload: {e}")
+            stream_fallbacks.inc(reason="ffmpeg_missing")
+            return None, "ffmpeg_missing"
+
+        extra_args = {'ACL': 'public-read', 'ContentType': 'video/mp4', 'CacheControl': 'max-age=31536000'}
+        upload_id = None
+        parts: list[asyncio.Task] = []
+        slots = asyncio.Semaphore(self.multipart_concurrency)
+        # Drain stderr alongside stdout so a chatty ffmpeg can't block on a full pipe
+        stderr_reader = asyncio.ensure_future(process.stderr.read())
+
+        async def upload_part(number: int, data: bytes) -> dict:
+            try:
+                response = await self._run(self.client.upload_part, Bucket=self.bucket, Key=key,
+                                           UploadId=upload_id, PartNumber=number, Body=data)
+            finally:
+                slots.release()
+            return {'PartNumber': number, 'ETag': response['ETag']}
+
+        try:
+            input_bytes = video_path.stat().st_size
+            buffer = bytearray()
+            total = 0
+            while True:
+                chunk = await process.stdout.read(1024 ** 2)
+                if chunk:
+                    buffer += chunk
+                    total += len(chunk)
+                    if total >= input_bytes:
+                        # Already bigger than the original, which will be uploaded instead
+                        await kill_process_group(process)
+                        break
+                if len(buffer) >= self.part_bytes or (not chunk and upload_id is not None and buffer):
+                    if upload_id is None:
+                        upload_id = (await self._run(self.client.create_multipart_upload, Bucket=self.bucket,
+                                                     Key=key, **extra_args))['UploadId']
+                    data, buffer = bytes(buffer[:self.part_bytes]), buffer[self.part_bytes:]
+                    # Backpressure: at most multipart_concurrency parts are held in memory
+                    await slots.acquire()
+                    parts.append(asyncio.ensure_future(upload_part(len(parts) + 1, data)))
+                    continue
+                if not chunk:
+                    break
+            await process.wait()
+
+            reason = None
+            if total >= input_bytes:
+                reason = "not_smaller"
+                stderr_reader.cancel()
+            elif process.returncode != 0:
+                logger.warning(f"Streamed video compression failed: "
+                               f"{(await stderr_reader).decode(errors='replace')[-2000:]}")
+                reason = "ffmpeg_failed"
+            else:
+                await stderr_reader
+            if reason is not None:
+                stream_fallbacks.inc(reason=reason)
+                await asyncio.gather(*parts, return_exceptions=True)
+                if upload_id is not None:
+                    await self._run(self.client.abort_multipart_upload, Bucket=self.bucket, Key=key,
+                                    UploadId=upload_id)
+                return None, reason
 
-    async def upload_video(self, video_path: Path, task_id: str) -> Optional[str]:
+            if upload_id is None:
+                await self._run(self.client.put_object, Bucket=self.bucket, Key=key, Body=bytes(buffer),
+                                **extra_args)
+            else:
+                completed = await asyncio.gather(*parts)
+                await self._run(self.client.complete_multipart_upload, Bucket=self.bucket, Key=key,
+                                UploadId=upload_id, MultipartUpload={'Parts': completed})
+            return total, None
+        except BaseException as e:
+            await kill_process_group(process)
+            stderr_reader.cancel()
+            for part in parts:
+                part.cancel()
+            await asyncio.gather(stderr_reader, *parts, return_exceptions=True)
+            if upload_id is not None:
+                try:
+                    await self._run(self.client.abort_multipart_upload, Bucket=self.bucket, Key=key,
+                                    UploadId=upload_id)
+                except Exception as abort_error:
+                    logger.warning(f"Failed to abort multipart upload of {key}: {abort_error}")
+            if isinstance(e, Exception):
+                logger.warning(f"Streamed upload of {key} failed, falling back to a file: {e}")
+                stream_fallbacks.inc(reason="upload_failed")
+                return None, "upload_failed"
+            raise
+
+    async def upload_video(self, video_path: Path, task_id: str, filename: str = "animation.mp4",
+                           quality_flag: Optional[str] = None) -> Optional[str]:
         """Upload a video file to DigitalOcean Spaces with compression."""
+        profile, encode_args = await encoding_args(video_path, quality_flag, self.encoding_profile)
+        fallback_reason = None
+        if self.stream_uploads:
+            key = f"videos/{task_id}/{filename}"
+            with upload_seconds.time(kind="video_stream"), tracer.span("stream_upload", profile=profile) as span:
+                streamed_bytes, fallback_reason = await self.stream_video(video_path, key, encode_args)
+                if span:
+                    span.set(input_bytes=video_path.stat().st_size, output_bytes=streamed_bytes,
+                             fallback=fallback_reason)
+            if streamed_bytes is not None:
+                uploaded_bytes.inc(streamed_bytes, kind="video")
+                logger.info(f"Streamed {streamed_bytes} bytes of video for task {task_id}")
+                return f"https://{self.bucket}.sfo3.digitaloceanspaces.com/{key}"
         try:
-            # Try to compress the video first
-            compressed_path = await self.compress_video(video_path)
+            compressed_path = None
+            # Compressing again would only repeat a failed or unhelpful transcode
+            if fallback_reason not in ("ffmpeg_missing", "ffmpeg_failed", "not_smaller"):
+                with compression_seconds.time(), tracer.span("compress", profile=profile) as span:
+                    compressed_path = await self.compress_video(video_path, encode_args)
+                    if span:
+                        span.set(input_bytes=video_path.stat().st_size,
+                                 output_bytes=compressed_path.stat().st_size if compressed_path else None)
             upload_path = compressed_path if compressed_path else video_path
             
-            key = f"videos/{task_id}/animation.mp4"
+            key = f"videos/{task_id}/{filename}"
             
             # Upload with progress logging
             file_size = upload_path.stat().st_size
             logger.info(f"Starting upload of {file_size} bytes for task {task_id}")
             
-            self.client.upload_file(
-                str(upload_path),
-                self.bucket,
-                key,
-                ExtraArgs={
-                    'ACL': 'public-read',
-                    'ContentType': 'video/mp4',
-                    'CacheControl': 'max-age=31536000'  # Cache for 1 year
-                }
-            )
+            with upload_seconds.time(kind="video"), tracer.span("upload", kind="video", bytes=file_size):
+                await self._run(
+                    self.client.upload_file,
+                    str(upload_path),
+                    self.bucket,
+                    key,
+                    ExtraArgs={
+                        'ACL': 'public-read',
+                        'ContentType': 'video/mp4',
+                        'CacheControl': 'max-age=31536000'  # Cache for 1 year
+                    },
+                    Config=self.transfer_config
+                )
+            uploaded_bytes.inc(file_size, kind="video")
             
             logger.info(f"Successfully uploaded video for task {task_id}")
             
@@ -114,13 +321,15 @@ class SpacesStorage:
             count = 0
             total_size = 0
             
-            for page in paginator.paginate(Bucket=self.bucket, Prefix='videos/'):
+            pages = await self._run(lambda: list(paginator.paginate(Bucket=self.bucket, Prefix='videos/')))
+            for page in pages:
                 if 'Contents' not in page:
                     continue
                     
                 for obj in page['Contents']:
                     if obj['LastModified'].replace(tzinfo=None) < cutoff_time:
-                        self.client.delete_object(
+                        await self._run(
+                            self.client.delete_object,
                             Bucket=self.bucket,
                             Key=obj['Key']
                         )
@@ -137,61 +346,148 @@ class SpacesStorage:
         """Get the URL for a video stored in Spaces."""
         try:
             key = f"videos/{task_id}/animation.mp4"
-            self.client.head_object(Bucket=self.bucket, Key=key)
+            await self._run(self.client.head_object, Bucket=self.bucket, Key=key)
             return f"https://{self.bucket}.sfo3.digitaloceanspaces.com/{key}"
         except ClientError:
             return None
         
-    async def upload_code(self, code: str, task_id: str) -> Optional[str]:
-        """Upload a code string to DigitalOcean Spaces."""
+    async def upload_bytes(self, data: bytes, task_id: str, filename: str, content_type: str,
+                           kind: str, cache_control: str = "max-age=31536000") -> Optional[str]:
+        """Upload a small in-memory object with a single put_object, no temp file."""
+        key = f"videos/{task_id}/{filename}"
         try:
-            key = f"videos/{task_id}/code.py"
-            
-            # Create a temporary file to upload
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as temp_file:
-                temp_file.write(code)
-                temp_path = temp_file.name
-            logger.info(f"Created temporary file at {temp_path}")
-                        
-            # Log the upload
-            logger.info(f"Uploading code for task {task_id}")
-            
-            try:
-                self.client.upload_file(
-                    temp_path,
-                    self.bucket,
-                    key,
-                    ExtraArgs={
-                        'ACL': 'public-read',
-                        'ContentType': 'text/plain',
-                        'CacheControl': 'max-age=31536000'  # Cache for 1 year
-                    }
+            with upload_seconds.time(kind=kind), tracer.span("upload", kind=kind, bytes=len(data)):
+                await self._run(
+                    self.client.put_object,
+                    Bucket=self.bucket,
+                    Key=key,
+                    Body=data,
+                    ACL='public-read',
+                    ContentType=content_type,
+                    CacheControl=cache_control
                 )
-                
-                # Clean up temp file
-                os.unlink(temp_path)
-                
-                logger.info(f"Successfully uploaded code for task {task_id}")
-                return f"https://{self.bucket}.sfo3.digitaloceanspaces.com/{key}"
-                
-            except Exception as e:
-                logger.error(f"Error in upload operation for task {task_id}: {str(e)}", exc_info=True)
-                return None
-            finally:
-                # Ensure temp file is removed
-                if temp_path and os.path.exists(temp_path):
-                    os.unlink(temp_path)
-                    logger.info(f"Cleaned up temp file for task {task_id}")
-                
+            uploaded_bytes.inc(len(data), kind=kind)
+            return f"https://{self.bucket}.sfo3.digitaloceanspaces.com/{key}"
         except Exception as e:
-            logger.error(f"Unexpected error during code upload for task {task_id}: {str(e)}")
+            logger.error(f"Failed to upload {filename} for task {task_id}: {str(e)}")
             return None
+
+    async def upload_code(self, code: str, task_id: str) -> Optional[str]:
+        """Upload a code string to DigitalOcean Spaces."""
+        return await self.upload_bytes(code.encode(), task_id, "code.py", "text/plain", kind="code")
+
+    async def upload_manifest(self, manifest: dict, task_id: str) -> Optional[str]:
+        """Upload the task's metadata (prompt, code, render log, ...) as one JSON object.
+
+        Rewritten as the task progresses, so it isn't cached like the videos.
+        """
+        return await self.upload_bytes(json.dumps(manifest, default=str).encode(), task_id, "manifest.json",
+                                       "application/json", kind="manifest", cache_control="no-cache")
     
     async def get_code_url(self, task_id: str) -> Optional[str]:
         """Get the URL for code stored in Spaces."""
         try:
             key = f"videos/{task_id}/code.py"
-            self.client.head_object(Bucket=self.bucket, Key=key)
+            await self._run(self.client.head_object, Bucket=self.bucket, Key=key)
             return f"https://{self.bucket}.sfo3.digitaloceanspaces.com/{key}"
         except ClientError:
-            return None
\ No newline at end of file
+            return None
+
+
+class LocalStorage:
+    """Keeps videos and code in a local directory instead of Spaces.
+
+    Same interface as SpacesStorage. URLs are relative to the app, which
+    serves ``root`` at ``base_url``; meant for development and load tests.
+    """
+
+    def __init__(self, root: Path, base_url: str = "/videos", compress: bool = True,
+                 encoding_profile: str = "auto"):
+        self.root = root
+        self.base_url = base_url
+        self.compress = compress
+        self.encoding_profile = encoding_profile
+        root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, task_id: str, filename: str) -> Path:
+        return self.root / task_id / filename
+
+    async def compress_video(self, input_path: Path, encode_args: list[str]) -> Optional[Path]:
+        return await compress_for_upload(input_path, encode_args)
+
+    async def upload_video(self, video_path: Path, task_id: str, filename: str = "animation.mp4",
+                           quality_flag: Optional[str] = None) -> Optional[str]:
+        """Copy a video into the storage directory, compressing it first like SpacesStorage does."""
+        compressed_path = None
+        try:
+            if self.compress:
+                profile, encode_args = await encoding_args(video_path, quality_flag, self.encoding_profile)
+                with compression_seconds.time(), tracer.span("compress", profile=profile):
+                    compressed_path = await self.compress_video(video_path, encode_args)
+            upload_path = compressed_path or video_path
+            file_size = upload_path.stat().st_size
+            destination = self._path(task_id, filename)
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            with upload_seconds.time(kind="video"), tracer.span("upload", kind="video", bytes=file_size):
+                await asyncio.to_thread(shutil.copyfile, upload_path, destination)
+            uploaded_bytes.inc(file_size, kind="video")
+            return f"{self.base_url}/{task_id}/{filename}"
+        except OSError as e:
+            logger.error(f"Failed to store video for task {task_id}: {e}")
+            return None
+        finally:
+            if compressed_path and compressed_path.exists():
+                compressed_path.unlink()
+
+    async def upload_bytes(self, data: bytes, task_id: str, filename: str, content_type: str,
+                           kind: str, cache_control: str = "max-age=31536000") -> Optional[str]:
+        try:
+            destination = self._path(task_id, filename)
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            with upload_seconds.time(kind=kind), tracer.span("upload", kind=kind, bytes=len(data)):
+                destination.write_bytes(data)
+            uploaded_bytes.inc(len(data), kind=kind)
+            return f"{self.base_url}/{task_id}/{filename}"
+        except OSError as e:
+            logger.error(f"Failed to store {filename} for task {task_id}: {e}")
+            return None
+
+    async def upload_code(self, code: str, task_id: str) -> Optional[str]:
+        return await self.upload_bytes(code.encode(), task_id, "code.py", "text/plain", kind="code")
+
+    async def upload_manifest(self, manifest: dict, task_id: str) -> Optional[str]:
+        return await self.upload_bytes(json.dumps(manifest, default=str).encode(), task_id, "manifest.json",
+                                       "application/json", kind="manifest")
+
+    async def get_video_url(self, task_id: str) -> Optional[str]:
+        path = self._path(task_id, "animation.mp4")
+        return f"{self.base_url}/{task_id}/animation.mp4" if path.exists() else None
+
+    async def get_code_url(self, task_id: str) -> Optional[str]:
+        path = self._path(task_id, "code.py")
+        return f"{self.base_url}/{task_id}/code.py" if path.exists() else None
+
+    async def cleanup_old_videos(self, max_age_hours: int = 24):
+        """Remove task directories older than specified hours."""
+        cutoff = time.time() - max_age_hours * 3600
+        for task_dir in self.root.iterdir():
+            if task_dir.is_dir() and task_dir.stat().st_mtime < cutoff:
+                shutil.rmtree(task_dir, ignore_errors=True)
+
+
+def storage_from_env(local_root: Path):
+    """Build the storage selected by STORAGE_BACKEND: "spaces" (default) or "filesystem" under local_root."""
+    backend = os.getenv("STORAGE_BACKEND", "spaces")
+    if backend == "spaces":
+        return SpacesStorage(
+            io_threads=int(os.getenv("SPACES_IO_THREADS", "8")),
+            multipart_threshold_bytes=int(os.getenv("SPACES_MULTIPART_THRESHOLD_MB", "8")) * 1024 ** 2,
+            multipart_chunk_bytes=int(os.getenv("SPACES_MULTIPART_CHUNK_MB", "8")) * 1024 ** 2,
+            multipart_concurrency=int(os.getenv("SPACES_MULTIPART_CONCURRENCY", "4")),
+            stream_uploads=os.getenv("SPACES_STREAM_UPLOADS", "false").lower() in ("1", "true", "yes"),
+            encoding_profile=encoding_profile_from_env(),
+        )
+    if backend == "filesystem":
+        compress = os.getenv("LOCAL_STORAGE_COMPRESS", "true").lower() in ("1", "true", "yes")
+        return LocalStorage(local_root, compress=compress, encoding_profile=encoding_profile_from_env())
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from renderer import RenderResult
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Candidate:
+    index: int
+    options: dict
+    code: Optional[str] = None
+    # pending, won, llm_failed, invalid, render_failed or cancelled
+    outcome: str = "pending"
+    error: Optional[str] = None
+    render_result: Optional[RenderResult] = None
+    llm_time: Optional[float] = None
+    render_time: Optional[float] = None
+    started_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class SpeculativeConfig:
+    """How many candidate programs to request per task and how many of them may render at once."""
+    candidates: int = 3
+    max_parallel_renders: int = 2
+    temperatures: tuple[float, ...] = (0.2, 0.5, 0.8)
+
+    def candidate_options(self) -> list[dict]:
+        """Ollama options for each candidate: spread temperatures, distinct seeds."""
+        return [
+            {"temperature": self.temperatures[i % len(self.temperatures)], "seed": random.randrange(2 ** 31)}
+            for i in range(self.candidates)
+        ]
+
+
+async def race_candidates(
+    config: SpeculativeConfig,
+    generate: Callable[[Candidate], Awaitable[str]],
+    validate: Callable[[str], Optional[str]],
+    render: Callable[[Candidate], Awaitable[RenderResult]],
+) -> tuple[Optional[Candidate], list[Candidate]]:
+    """Generate, validate and render candidates concurrently; the first clean render wins.
+
+    ``validate`` returns an error message or None; a render with returncode
+    0 counts as success. Once a candidate wins, the others are cancelled
+    wherever they are (LLM call, render queue or manim). At most
+    ``max_parallel_renders`` candidates render at the same time.
+    """
+    candidates = [Candidate(index=i, options=options) for i, options in enumerate(config.candidate_options())]
+    render_slots = asyncio.Semaphore(max(1, config.max_parallel_renders))
+    winner: Optional[Candidate] = None
+    won = asyncio.Event()
+
+    async def run(candidate: Candidate):
+        nonlocal winner
+        try:
+            candidate.code = await generate(candidate)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            candidate.outcome, candidate.error = "llm_failed", f"{type(e).__name__}: {e}"
+            return
+        finally:
+            candidate.llm_time = time.time() - candidate.started_at
+
+        error = validate(candidate.code)
+        if error is not None:
+            candidate.outcome, candidate.error = "invalid", error
+            return
+
+        async with render_slots:
+            if won.is_set():
+                candidate.outcome = "cancelled"
+                return
+            render_start = time.time()
+            try:
+                candidate.render_result = await render(candidate)
+            finally:
+                candidate.render_time = time.time() - render_start
+
+        if candidate.render_result.returncode != 0:
+            candidate.outcome, candidate.error = "render_failed", candidate.render_result.stderr
+            return
+        if winner is None:
+            winner = candidate
+            candidate.outcome = "won"
+            won.set()
+        else:
+            candidate.outcome = "cancelled"
+
+    tasks = [asyncio.create_task(run(candidate)) for candidate in candidates]
+    all_done = asyncio.create_task(asyncio.wait(tasks))
+    won_wait = asyncio.create_task(won.wait())
+    try:
+        await asyncio.wait([all_done, won_wait], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # Runs on cancellation of the whole task too, so no candidate outlives it
+        won_wait.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        all_done.cancel()
+
+    for candidate in candidates:
+        if candidate.outcome == "pending":
+            candidate.outcome = "cancelled"
+    if winner is not None:
+        logger.info(f"Candidate {winner.index} won ({winner.options}); "
+                    + ", ".join(f"{c.index}: {c.outcome}" for c in candidates if c is not winner))
+    return winner, candidates
+
+
+def speculative_config_from_env() -> Optional[SpeculativeConfig]:
+    """Build the speculative generation settings, or None when SPECULATIVE_CANDIDATES is 1 or less."""
+    candidates = int(os.getenv("SPECULATIVE_CANDIDATES", "1"))
+    if candidates <= 1:
+        return None
+    return SpeculativeConfig(
+        candidates=candidates,
+        max_parallel_renders=int(os.getenv("SPECULATIVE_MAX_PARALLEL_RENDERS", "2")),
+        temperatures=tuple(float(t) for t in os.getenv("SPECULATIVE_TEMPERATURES", "0.2,0.5,0.8").split(",")),
+    )
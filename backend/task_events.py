@@ -0,0 +1,45 @@
+import asyncio
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TaskEventBus:
+    """In-process fan-out of task updates to status stream subscribers.
+
+    Each subscriber gets its own queue of task snapshots. Only updates made by
+    this process are published; subscribers fall back to re-reading the task
+    store periodically to pick up changes made by other workers.
+    """
+
+    def __init__(self, max_queued: int = 100):
+        self.max_queued = max_queued
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queued)
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(task_id)
+        if not subscribers:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[task_id]
+
+    def publish(self, task_id: str, task: Optional[dict]):
+        if task is None:
+            return
+        for queue in self._subscribers.get(task_id, ()):
+            if queue.full():
+                # Snapshots supersede each other, so dropping the oldest is safe
+                queue.get_nowait()
+            queue.put_nowait(task)
+
+    def subscriber_count(self, task_id: Optional[str] = None) -> int:
+        if task_id is not None:
+            return len(self._subscribers.get(task_id, ()))
+        return sum(len(s) for s in self._subscribers.values())
@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _status_value(status) -> str:
+    # TaskStatus is a str Enum; store its value rather than "TaskStatus.X"
+    return str(getattr(status, "value", status))
+
+
+def _matches(data: dict, expect: Optional[dict]) -> bool:
+    if not expect:
+        return True
+    return all(_status_value(data.get(k)) == _status_value(v) for k, v in expect.items())
+
+
+class TaskStore:
+    """Interface for storing generation task state.
+
+    Task data is a plain JSON-serialisable dict with at least a "status" key.
+    Implementations must be safe to call from the event loop (operations are
+    short and synchronous).
+    """
+
+    def create(self, task_id: str, data: dict) -> None:
+        raise NotImplementedError
+
+    def get(self, task_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def update(self, task_id: str, fields: dict, expect: Optional[dict] = None) -> Optional[dict]:
+        """Merge fields into a task and return the updated task.
+
+        Returns None if the task is missing, or if ``expect`` is given and any
+        of its keys don't match the stored task (compare-and-set).
+        """
+        raise NotImplementedError
+
+    def delete(self, task_id: str) -> None:
+        raise NotImplementedError
+
+    def list_by_status(self, statuses: list[str]) -> list[tuple[str, dict]]:
+        raise NotImplementedError
+
+    def evict_expired(self) -> int:
+        """Remove tasks not updated within the TTL. Returns the number removed."""
+        raise NotImplementedError
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+
+class MemoryTaskStore(TaskStore):
+    """Process-local store. Only suitable for a single uvicorn worker."""
+
+    def __init__(self, ttl_seconds: float = 24 * 3600):
+        self.ttl_seconds = ttl_seconds
+        self._tasks: dict[str, dict] = {}
+        self._updated_at: dict[str, float] = {}
+
+    def create(self, task_id: str, data: dict) -> None:
+        self._tasks[task_id] = dict(data)
+        self._updated_at[task_id] = time.time()
+
+    def get(self, task_id: str) -> Optional[dict]:
+        task = self._tasks.get(task_id)
+        return dict(task) if task is not None else None
+
+    def update(self, task_id: str, fields: dict, expect: Optional[dict] = None) -> Optional[dict]:
+        if task_id not in self._tasks:
+            return None
+        if not _matches(self._tasks[task_id], expect):
+            return None
+        self._tasks[task_id].update(fields)
+        self._updated_at[task_id] = time.time()
+        return dict(self._tasks[task_id])
+
+    def delete(self, task_id: str) -> None:
+        self._tasks.pop(task_id, None)
+        self._updated_at.pop(task_id, None)
+
+    def list_by_status(self, statuses: list[str]) -> list[tuple[str, dict]]:
+        wanted = {_status_value(s) for s in statuses}
+        return [(task_id, dict(task)) for task_id, task in self._tasks.items()
+                if _status_value(task.get("status")) in wanted]
+
+    def evict_expired(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        expired = [task_id for task_id, updated in self._updated_at.items() if updated < cutoff]
+        for task_id in expired:
+            self.delete(task_id)
+        return len(expired)
+
+
+class SQLiteTaskStore(TaskStore):
+    """Task store backed by an SQLite file, shared by all workers on the host.
+
+    The database runs in WAL mode so status reads from one worker don't block
+    writes from the worker running the task.
+    """
+
+    def __init__(self, db_path: Path, ttl_seconds: float = 24 * 3600):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_updated_at ON tasks (updated_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; update() opens its own transaction
+            conn = sqlite3.connect(str(self.db_path), timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, task_id: str, data: dict) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO tasks (task_id, status, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (task_id, _status_value(data.get("status")), json.dumps(data), now, now)
+        )
+        conn.commit()
+
+    def get(self, task_id: str) -> Optional[dict]:
+        row = self._conn().execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, task_id: str, fields: dict, expect: Optional[dict] = None) -> Optional[dict]:
+        conn = self._conn()
+        # BEGIN IMMEDIATE takes the write lock up front so concurrent
+        # read-modify-write updates from other workers can't interleave
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+            data = json.loads(row[0])
+            if not _matches(data, expect):
+                conn.rollback()
+                return None
+            data.update(fields)
+            conn.execute(
+                "UPDATE tasks SET status = ?, data = ?, updated_at = ? WHERE task_id = ?",
+                (_status_value(data.get("status")), json.dumps(data), time.time(), task_id)
+            )
+            conn.commit()
+            return data
+        except Exception:
+            conn.rollback()
+            raise
+
+    def delete(self, task_id: str) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+        conn.commit()
+
+    def list_by_status(self, statuses: list[str]) -> list[tuple[str, dict]]:
+        placeholders = ",".join("?" for _ in statuses)
+        rows = self._conn().execute(
+            f"SELECT task_id, data FROM tasks WHERE status IN ({placeholders})",
+            [_status_value(s) for s in statuses]
+        ).fetchall()
+        return [(task_id, json.loads(data)) for task_id, data in rows]
+
+    def evict_expired(self) -> int:
+        conn = self._conn()
+        cursor = conn.execute("DELETE FROM tasks WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+        conn.commit()
+        return cursor.rowcount
+
+
+def task_store_from_env() -> TaskStore:
+    """Build the task store selected by TASK_STORE ("sqlite" or "memory")."""
+    ttl_seconds = float(os.getenv("TASK_TTL_HOURS", "24")) * 3600
+    backend = os.getenv("TASK_STORE", "sqlite")
+    if backend == "memory":
+        return MemoryTaskStore(ttl_seconds=ttl_seconds)
+    if backend == "sqlite":
+        db_path = Path(os.getenv("TASK_DB_PATH", "./task_data/tasks.db"))
+        logger.info(f"Using SQLite task store at {db_path}")
+        return SQLiteTaskStore(db_path, ttl_seconds=ttl_seconds)
+    raise ValueError(f"Unknown TASK_STORE: {backend}")
@@ -0,0 +1,37 @@
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Backend modules import each other by bare name, as they do in the container
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture(scope="session")
+def backend(tmp_path_factory):
+    """The FastAPI app module, imported from a scratch working directory.
+
+    backend.py creates media/, temp/ and training_data/ under the working
+    directory when it is imported. Tests using it are skipped where its
+    storage and video dependencies (boto3, moviepy) aren't installed.
+    """
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("backend"))
+    os.environ.setdefault("SYSTEM_PROMPT_PATH", str(BACKEND_DIR / "system_prompt.txt"))
+    os.environ.setdefault("TASK_STORE", "memory")
+    os.environ.setdefault("STORAGE_BACKEND", "filesystem")
+    try:
+        for dependency in ("boto3", "moviepy"):
+            pytest.importorskip(dependency)
+        # Loaded by path: from the repo root "backend" is the package around it
+        spec = importlib.util.spec_from_file_location("backend_app", BACKEND_DIR / "backend.py")
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+        yield module
+    finally:
+        os.chdir(cwd)
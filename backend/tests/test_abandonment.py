@@ -0,0 +1,127 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def task(backend):
+    """A running task last polled ``age`` seconds ago, removed again afterwards."""
+    created = []
+
+    def create(age=0.0, **fields):
+        task_id = str(uuid.uuid4())
+        backend.task_store.create(task_id, {"status": backend.TaskStatus.PROCESSING, "prompt": "draw a circle",
+                                            "options": {}, "last_seen": time.time() - age, **fields})
+        created.append(task_id)
+        return task_id
+
+    yield create
+    for task_id in created:
+        backend.task_followers.pop(task_id, None)
+        backend.pipeline_tasks.pop(task_id, None)
+
+
+def test_render_qualities(backend, monkeypatch):
+    assert backend.render_qualities({"quality": "high"}) == (None, "-qh")
+    monkeypatch.setattr(backend, "PROGRESSIVE_RENDER", True)
+    assert backend.render_qualities({"quality": "high"}) == ("-ql", "-qh")
+    assert backend.render_qualities({"quality": "low"}) == (None, "-ql")
+
+
+def test_final_pass_runs_while_the_preview_is_watched(backend, task, monkeypatch):
+    monkeypatch.setattr(backend, "PREVIEW_ABANDON_SECONDS", 60)
+    assert backend.final_pass_skip_reason(task(age=10), since=time.time() - 300) is None
+
+
+def test_final_pass_skipped_once_nobody_polls(backend, task, monkeypatch):
+    monkeypatch.setattr(backend, "PREVIEW_ABANDON_SECONDS", 60)
+    task_id = task(age=90)
+    assert backend.final_pass_skip_reason(task_id, since=time.time() - 300) == "viewer_left"
+    # A task that only just started isn't abandoned yet, whenever it was last polled
+    assert backend.final_pass_skip_reason(task_id, since=time.time()) is None
+
+
+def test_final_pass_skipped_after_negative_feedback(backend, task):
+    assert backend.final_pass_skip_reason(task(user_feedback=False), since=time.time()) == "negative_feedback"
+    assert backend.final_pass_skip_reason(task(user_feedback=True), since=time.time()) is None
+
+
+def test_coalesced_requests_keep_the_final_pass_alive(backend, task, monkeypatch):
+    monkeypatch.setattr(backend, "PREVIEW_ABANDON_SECONDS", 60)
+    leader_id, follower_id = task(age=90), task(age=5)
+    backend.task_followers[leader_id] = {follower_id}
+    assert backend.final_pass_skip_reason(leader_id, since=time.time() - 300) is None
+    backend.task_store.update(follower_id, {"user_feedback": False})
+    assert backend.final_pass_skip_reason(leader_id, since=time.time() - 300) == "negative_feedback"
+
+
+def test_unless_abandoned_cancels_the_final_pass(backend, task, monkeypatch):
+    monkeypatch.setattr(backend, "PREVIEW_CHECK_INTERVAL", 0.01)
+    task_id = task()
+    cancelled = asyncio.Event()
+
+    async def final_pass():
+        try:
+            await asyncio.sleep(10)
+        finally:
+            cancelled.set()
+
+    async def scenario():
+        job = asyncio.ensure_future(backend.unless_abandoned(task_id, time.time(), final_pass()))
+        await asyncio.sleep(0.05)
+        backend.task_store.update(task_id, {"user_feedback": False})
+        return await job, cancelled.is_set()
+
+    assert asyncio.run(scenario()) == ((None, "negative_feedback"), True)
+    assert asyncio.run(backend.unless_abandoned(task_id, time.time(), asyncio.sleep(0, "video"))) == ("video", None)
+
+
+def test_cancel_reason(backend, task, monkeypatch):
+    monkeypatch.setattr(backend, "TASK_ABANDON_SECONDS", 120)
+    assert backend.cancel_reason(task(age=60)) is None
+    assert backend.cancel_reason(task(age=180)) == "abandoned"
+    assert backend.cancel_reason(task(age=0, cancel_requested="client")) == "client"
+    monkeypatch.setattr(backend, "TASK_ABANDON_SECONDS", 0)
+    assert backend.cancel_reason(task(age=3600)) is None
+
+
+def test_watched_follower_keeps_an_unpolled_leader(backend, task, monkeypatch):
+    monkeypatch.setattr(backend, "TASK_ABANDON_SECONDS", 120)
+    leader_id = task(age=180)
+    backend.task_followers[leader_id] = {task(age=10)}
+    assert backend.cancel_reason(leader_id) is None
+
+
+def test_reaper_cancels_only_abandoned_pipelines(backend, task, monkeypatch):
+    monkeypatch.setattr(backend, "TASK_ABANDON_SECONDS", 120)
+    monkeypatch.setattr(backend, "REAP_INTERVAL", 0.01)
+    monkeypatch.setattr(backend, "llm_cache", None)
+    monkeypatch.setattr(backend.data_collector, "log_attempt", lambda **fields: asyncio.sleep(0))
+
+    async def generate_code(*args):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(backend, "generate_code", generate_code)
+    abandoned, watched = task(age=180), task(age=10)
+
+    async def scenario():
+        for task_id in (abandoned, watched):
+            backend.pipeline_tasks[task_id] = asyncio.create_task(
+                backend.generate_animation(task_id, f"prompt {task_id}", {}))
+        reaper = asyncio.create_task(backend.reap_abandoned_tasks())
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if abandoned not in backend.pipeline_tasks:
+                break
+        reaper.cancel()
+        still_running = watched in backend.pipeline_tasks
+        await backend.cancel_pipeline(watched, "test finished")
+        return still_running
+
+    assert asyncio.run(scenario()) is True
+    reaped = backend.task_store.get(abandoned)
+    assert reaped["status"] == backend.TaskStatus.CANCELLED
+    assert reaped["error"] == "Task cancelled (abandoned)"
+    assert backend.task_store.get(watched)["status"] == backend.TaskStatus.CANCELLED
@@ -0,0 +1,77 @@
+import time
+
+from code_repair import RepairBudget, manim_exception_name, repair_budget_from_env, summarize_manim_error
+
+CODE = "from manim import *\n\nclass A(Scene):\n    def construct(self):\n        circle = Cirle()\n        self.play(Create(circle))"
+
+PLAIN_TRACEBACK = """Manim Community v0.19.0
+
+Traceback (most recent call last):
+  File "/usr/lib/python3/site-packages/manim/cli/render/commands.py", line 120, in render
+    scene.render()
+  File "/tmp/tmpabc/scene.py", line 5, in construct
+    circle = Cirle()
+NameError: name 'Cirle' is not defined
+"""
+
+RICH_TRACEBACK = """\x1b[31m╭─────────────── Traceback (most recent call last) ───────────────╮\x1b[0m
+\x1b[31m│\x1b[0m /usr/lib/python3/site-packages/manim/scene/scene.py:229 in render  \x1b[31m│\x1b[0m
+\x1b[31m│\x1b[0m /tmp/tmpabc/scene.py:5 in construct                                \x1b[31m│\x1b[0m
+\x1b[31m│\x1b[0m ❱ 5 │   │   circle = Cirle()                                          \x1b[31m│\x1b[0m
+\x1b[31m╰──────────────────────────────────────────────────────────────────╯\x1b[0m
+\x1b[1mNameError: \x1b[0mname 'Cirle' is not defined
+"""
+
+
+def test_summary_keeps_the_exception_and_failing_scene_line():
+    assert summarize_manim_error(PLAIN_TRACEBACK, CODE) == \
+        "NameError: name 'Cirle' is not defined\nat line 5: circle = Cirle()"
+
+
+def test_rich_traceback_boxes_and_colours_are_stripped():
+    assert summarize_manim_error(RICH_TRACEBACK, CODE) == \
+        "NameError: name 'Cirle' is not defined\nat line 5: circle = Cirle()"
+
+
+def test_innermost_scene_frame_is_used():
+    stderr = PLAIN_TRACEBACK.replace(
+        '    circle = Cirle()\n',
+        '    circle = Cirle()\n  File "/tmp/tmpabc/scene.py", line 6, in construct\n    self.play(Create(circle))\n'
+    )
+    assert summarize_manim_error(stderr, CODE).endswith("at line 6: self.play(Create(circle))")
+
+
+def test_line_outside_the_code_is_left_out():
+    stderr = PLAIN_TRACEBACK.replace("line 5", "line 40")
+    assert summarize_manim_error(stderr, CODE) == "NameError: name 'Cirle' is not defined"
+
+
+def test_without_an_exception_the_last_lines_are_kept():
+    stderr = "\n".join(f"output line {n}" for n in range(20)) + "\n\n"
+    summary = summarize_manim_error(stderr, CODE)
+    assert summary.splitlines() == [f"output line {n}" for n in range(12, 20)]
+
+
+def test_summary_is_truncated():
+    stderr = "ValueError: " + "x" * 2000
+    assert len(summarize_manim_error(stderr, CODE, max_chars=100)) == 100
+
+
+def test_exception_name():
+    assert manim_exception_name(PLAIN_TRACEBACK) == "NameError"
+    assert manim_exception_name(RICH_TRACEBACK) == "NameError"
+    assert manim_exception_name("manim.utils.tex.LatexError: bad\n") == "LatexError"
+    assert manim_exception_name("all good\n") is None
+
+
+def test_budget_counts_attempts_and_deadline():
+    budget = RepairBudget(max_attempts=3, deadline_seconds=60)
+    now = time.time()
+    assert budget.allows(1, now) and budget.allows(2, now)
+    assert not budget.allows(3, now)
+    assert not budget.allows(1, now - 61)
+
+
+def test_budget_disabled_without_retries(monkeypatch):
+    monkeypatch.setenv("REPAIR_MAX_ATTEMPTS", "1")
+    assert repair_budget_from_env() is None
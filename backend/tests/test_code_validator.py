@@ -0,0 +1,100 @@
+import ast
+import asyncio
+import json
+
+import code_validator
+from code_validator import CodeValidator, ManimSymbolIndex, renderable_scenes
+
+
+def scene_names(code: str) -> list[str]:
+    return [node.name for node in renderable_scenes(ast.parse(code))]
+
+
+def test_helper_base_scene_is_not_renderable():
+    code = (
+        "from manim import *\n"
+        "class Base(Scene):\n    pass\n"
+        "class Main(Base):\n    def construct(self):\n        pass\n"
+    )
+    assert scene_names(code) == ["Main"]
+
+
+def test_renderable_scenes_keep_definition_order():
+    code = "class Zeta(Scene):\n    pass\nclass Alpha(ThreeDScene):\n    pass\nclass Helper:\n    pass\n"
+    assert scene_names(code) == ["Zeta", "Alpha"]
+
+
+VALID = (
+    "from manim import *\n"
+    "class Main(Scene):\n"
+    "    def construct(self):\n"
+    "        circle = Circle()\n"
+    "        self.play(Create(circle))\n"
+)
+
+
+def loaded_index(tmp_path) -> ManimSymbolIndex:
+    index = ManimSymbolIndex(tmp_path / "symbols.json")
+    index._apply({"manim_version": "0.18.0", "names": ["Circle", "Create", "Scene", "ThreeDScene", "UP"],
+                  "scenes": ["Scene", "ThreeDScene"]})
+    return index
+
+
+def test_valid_code_passes(tmp_path):
+    assert CodeValidator().validate(VALID) is None
+    assert CodeValidator(loaded_index(tmp_path)).validate(VALID) is None
+
+
+def test_syntax_error_reports_the_line():
+    issue = CodeValidator().validate("from manim import *\nclass Main(Scene:\n    pass\n")
+    assert issue.kind == "syntax"
+    assert issue.line == 2
+
+
+def test_manimlib_import_is_legacy():
+    issue = CodeValidator().validate("from manimlib import *\nclass Main(Scene):\n    pass\n")
+    assert issue.kind == "legacy_api"
+
+
+def test_scene_count():
+    assert CodeValidator().validate("from manim import *\nx = 1\n").kind == "no_scene"
+    issue = CodeValidator().validate("from manim import *\nclass A(Scene):\n    pass\nclass B(Scene):\n    pass\n")
+    assert issue.kind == "multiple_scenes"
+    assert issue.names == ["A", "B"]
+    assert issue.line == 4
+    # A helper base plus the scene built on it is one scene
+    helper = "from manim import *\nclass Base(Scene):\n    pass\nclass Main(Base):\n    pass\n"
+    assert CodeValidator().validate(helper) is None
+
+
+def test_unknown_and_legacy_names(tmp_path):
+    validator = CodeValidator(loaded_index(tmp_path))
+    issue = validator.validate(VALID.replace("Circle()", "Sqaure()"))
+    assert issue.kind == "unknown_name"
+    assert issue.names == ["Sqaure"]
+    issue = validator.validate(VALID.replace("Create(", "ShowCreation("))
+    assert issue.kind == "legacy_api"
+    assert "ShowCreation -> Create" in issue.message
+    issue = validator.validate("from manim import Circle, Blob\nclass Main(Scene):\n    pass\n")
+    assert issue.kind == "unknown_name"
+    assert issue.names == ["Blob"]
+
+
+def test_star_import_from_elsewhere_skips_name_checks(tmp_path):
+    code = "from helpers import *\n" + VALID.replace("Circle()", "Sqaure()")
+    assert CodeValidator(loaded_index(tmp_path)).validate(code) is None
+
+
+def test_name_checks_need_a_loaded_index(tmp_path):
+    index = ManimSymbolIndex(tmp_path / "symbols.json")
+    assert CodeValidator(index).validate(VALID.replace("Circle()", "Sqaure()")) is None
+
+
+def test_symbol_index_loads_from_cache_for_the_installed_version(tmp_path, monkeypatch):
+    cache = tmp_path / "symbols.json"
+    cache.write_text(json.dumps({"manim_version": "0.18.0", "names": ["Circle"], "scenes": ["Scene"]}))
+    monkeypatch.setattr(code_validator, "installed_manim_version", lambda: "0.18.0")
+    index = ManimSymbolIndex(cache)
+    asyncio.run(index.load())
+    assert index.loaded
+    assert index.names == frozenset({"Circle"})
@@ -0,0 +1,56 @@
+import pytest
+
+from encoding import PROFILES, ClipStats, choose_profile, encoding_profile_from_env
+
+
+def clip(width=1920, height=1080, fps=30.0, duration=10.0, size_bytes=5_000_000) -> ClipStats:
+    return ClipStats(width=width, height=height, fps=fps, duration=duration, size_bytes=size_bytes)
+
+
+def option(args: list[str], name: str):
+    return args[args.index(name) + 1] if name in args else None
+
+
+def test_auto_picks_the_profile_for_the_quality():
+    assert choose_profile("-ql").name == "preview"
+    assert choose_profile("-qh").name == "standard"
+    assert choose_profile("-qk").name == "archive"
+    assert choose_profile(None).name == "standard"
+    assert choose_profile("-ql", "legacy").name == "legacy"
+
+
+def test_every_profile_tunes_for_animation():
+    for name in ("preview", "standard", "archive"):
+        profile = PROFILES[name]
+        assert option(profile.ffmpeg_args(clip(size_bytes=500_000)), "-tune") == "animation"
+        assert option(profile.ffmpeg_args(clip(size_bytes=50_000_000)), "-tune") == "animation"
+        assert option(profile.ffmpeg_args(), "-tune") == "animation"
+    assert "-tune" not in PROFILES["legacy"].ffmpeg_args(clip())
+
+
+def test_keyframe_interval_is_capped_by_the_clip_length():
+    standard = PROFILES["standard"]
+    assert option(standard.ffmpeg_args(clip(duration=10)), "-g") == "120"
+    assert option(standard.ffmpeg_args(clip(duration=2)), "-g") == "60"
+    assert "-g" not in standard.ffmpeg_args()
+
+
+def test_scaling_needs_stats_and_a_taller_source():
+    preview = PROFILES["preview"]
+    assert option(preview.ffmpeg_args(clip(height=1080)), "-vf") == "scale=-2:480"
+    assert "-vf" not in preview.ffmpeg_args(clip(width=854, height=480))
+    assert "-vf" not in preview.ffmpeg_args()
+
+
+def test_heavy_clips_use_a_faster_preset():
+    archive = PROFILES["archive"]
+    assert option(archive.ffmpeg_args(clip()), "-preset") == "slow"
+    assert option(archive.ffmpeg_args(clip(fps=60, duration=70)), "-preset") == "medium"
+
+
+def test_unknown_profile_from_env_is_rejected(monkeypatch):
+    monkeypatch.setenv("ENCODING_PROFILE", "fastest")
+    with pytest.raises(ValueError, match="ENCODING_PROFILE"):
+        encoding_profile_from_env()
+    monkeypatch.setenv("ENCODING_PROFILE", "archive")
+    assert encoding_profile_from_env() == "archive"
@@ -0,0 +1,75 @@
+import time
+
+from llm_cache import LLMResponseCache, MinHasher, normalize_prompt, shingles
+
+SYSTEM = "system prompt"
+MODEL = "mistral"
+
+
+def test_normalize_prompt():
+    assert normalize_prompt("  Draw a CIRCLE,  please! ") == "draw a circle please"
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = LLMResponseCache()
+    cache.put("Draw a circle", SYSTEM, MODEL, "code")
+    key, code = cache.get("draw a circle!", SYSTEM, MODEL)
+    assert code == "code"
+    assert cache.stats()["hits"] == 1
+
+
+def test_entries_are_scoped_to_system_prompt_and_model():
+    cache = LLMResponseCache()
+    cache.put("draw a circle", SYSTEM, MODEL, "code")
+    assert cache.get("draw a circle", "other prompt", MODEL) is None
+    assert cache.get("draw a circle", SYSTEM, "llama") is None
+
+
+def test_lru_eviction():
+    cache = LLMResponseCache(max_entries=2)
+    cache.put("one", SYSTEM, MODEL, "1")
+    cache.put("two", SYSTEM, MODEL, "2")
+    cache.get("one", SYSTEM, MODEL)
+    cache.put("three", SYSTEM, MODEL, "3")
+    assert cache.get("two", SYSTEM, MODEL) is None
+    assert cache.get("one", SYSTEM, MODEL)[1] == "1"
+    assert cache.get("three", SYSTEM, MODEL)[1] == "3"
+
+
+def test_expired_entries_miss(monkeypatch):
+    cache = LLMResponseCache(ttl_seconds=60)
+    cache.put("draw a circle", SYSTEM, MODEL, "code")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert cache.get("draw a circle", SYSTEM, MODEL) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_minhash_similarity_tracks_jaccard():
+    hasher = MinHasher(num_perm=128)
+    a = shingles(normalize_prompt("draw a blue circle that turns into a red square"))
+    b = shingles(normalize_prompt("draw a blue circle that turns into a green square"))
+    c = shingles(normalize_prompt("plot the derivative of sine"))
+    assert MinHasher.similarity(hasher.signature(a), hasher.signature(a)) == 1.0
+    similar = MinHasher.similarity(hasher.signature(a), hasher.signature(b))
+    assert abs(similar - len(a & b) / len(a | b)) < 0.2
+    assert MinHasher.similarity(hasher.signature(a), hasher.signature(c)) < 0.2
+
+
+def test_near_duplicate_hit_returns_the_matched_key():
+    cache = LLMResponseCache(near_duplicates=True, near_duplicate_threshold=0.5)
+    cache.put("draw a blue circle that turns into a red square", SYSTEM, MODEL, "code")
+    exact_key, _ = cache.get("draw a blue circle that turns into a red square", SYSTEM, MODEL)
+    key, code = cache.get("please draw a blue circle that turns into a red square", SYSTEM, MODEL)
+    assert code == "code"
+    assert key == exact_key
+    assert cache.stats()["near_duplicate_hits"] == 1
+
+
+def test_invalidating_a_near_duplicate_hit_removes_the_served_entry():
+    cache = LLMResponseCache(near_duplicates=True, near_duplicate_threshold=0.5)
+    cache.put("draw a blue circle that turns into a red square", SYSTEM, MODEL, "bad code")
+    key, _ = cache.get("please draw a blue circle that turns into a red square", SYSTEM, MODEL)
+    cache.invalidate(key)
+    assert cache.get("please draw a blue circle that turns into a red square", SYSTEM, MODEL) is None
+    assert cache.get("draw a blue circle that turns into a red square", SYSTEM, MODEL) is None
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from metrics import MetricsRegistry
+
+
+def test_counter_renders_per_label_set():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests served", ("status",))
+    requests.inc(status="ok")
+    requests.inc(2, status="ok")
+    requests.inc(status='bad "quote"')
+    text = registry.render()
+    assert "# HELP requests_total Requests served\n# TYPE requests_total counter\n" in text
+    assert 'requests_total{status="ok"} 3\n' in text
+    assert 'requests_total{status="bad \\"quote\\""} 1\n' in text
+
+
+def test_unlabelled_counter_starts_at_zero():
+    registry = MetricsRegistry()
+    registry.counter("errors_total", "Errors")
+    assert "errors_total 0\n" in registry.render()
+
+
+def test_wrong_labels_are_rejected():
+    counter = MetricsRegistry().counter("jobs_total", "Jobs", ("kind",))
+    with pytest.raises(ValueError):
+        counter.inc(stage="render")
+
+
+def test_duplicate_names_are_rejected():
+    registry = MetricsRegistry()
+    registry.counter("jobs_total", "Jobs")
+    with pytest.raises(ValueError):
+        registry.histogram("jobs_total", "Jobs")
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", ("stage",), buckets=(1, 5))
+    for value in (0.5, 2, 2, 10):
+        latency.observe(value, stage="render")
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{stage="render",le="1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="render",le="5"} 3' in lines
+    assert 'latency_seconds_bucket{stage="render",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{stage="render"} 14.5' in lines
+    assert 'latency_seconds_count{stage="render"} 4' in lines
+
+
+def test_histogram_time_observes_when_the_block_raises():
+    registry = MetricsRegistry()
+    latency = registry.histogram("step_seconds", "Step time")
+    with pytest.raises(RuntimeError):
+        with latency.time():
+            raise RuntimeError("failed step")
+    assert "step_seconds_count 1" in registry.render().splitlines()
+
+
+def test_gauge_reads_at_render_time():
+    registry = MetricsRegistry()
+    depth = {"value": None}
+    registry.gauge("queue_depth", "Queued jobs", lambda: depth["value"])
+    registry.gauge("workers", "Workers by state", lambda: {("busy",): 2, ("idle",): 0}, ("state",))
+    assert not [line for line in registry.render().splitlines() if line.startswith("queue_depth")]
+    depth["value"] = 3
+    text = registry.render()
+    assert "queue_depth 3\n" in text
+    assert 'workers{state="busy"} 2\n' in text
+    assert 'workers{state="idle"} 0\n' in text
+
+
+def test_counter_value():
+    counter = MetricsRegistry().counter("jobs_total", "Jobs", ("kind",))
+    counter.inc(kind="render")
+    counter.inc(kind="render")
+    assert counter.value(kind="render") == 2
+    assert counter.value(kind="llm") == 0
+
+
+def test_coalesced_requests_are_exported(backend):
+    leader_id = "leader-task"
+    backend.task_store.create(leader_id, {"status": backend.TaskStatus.PROCESSING, "prompt": "draw a circle"})
+    backend.inflight_leaders[backend.coalesce_key("draw a circle", {})] = leader_id
+    before = backend.coalesced_tasks.value()
+    try:
+        request = backend.Request({"type": "http", "headers": [], "client": ("127.0.0.1", 1)})
+        status = asyncio.run(backend.create_animation(
+            backend.AnimationRequest(prompt="Draw a circle!", options={}), request))
+    finally:
+        backend.inflight_leaders.clear()
+        backend.task_followers.clear()
+    assert status.coalesced_with == leader_id
+    assert backend.coalesced_tasks.value() == before + 1
+    assert f"manim_coalesced_tasks_total {int(before) + 1}\n" in backend.registry.render()
+    assert asyncio.run(backend.get_queue_stats())["coalesced"]["tasks"] == before + 1
@@ -0,0 +1,60 @@
+import asyncio
+
+import httpx
+import pytest
+
+from ollama_client import OllamaClient, OllamaUnavailableError
+
+
+def make_client(responses, threshold=3):
+    """Client whose /api/version probe answers from ``responses`` in order."""
+    def handler(request):
+        status = responses.pop(0)
+        if status is None:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(status, json={"version": "0.5.0"})
+
+    client = OllamaClient("http://ollama.test", health_failure_threshold=threshold)
+    client._client = httpx.AsyncClient(base_url=client.host, transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_single_failed_probe_does_not_mark_down():
+    async def scenario():
+        client = make_client([200, None, 200])
+        assert await client.check_health() is True
+        await client.check_health()
+        after_failure = (client.healthy, client.consecutive_health_failures)
+        client._ensure_available()
+        await client.check_health()
+        return after_failure, client.consecutive_health_failures
+
+    after_failure, failures = asyncio.run(scenario())
+    assert after_failure == (True, 1)
+    assert failures == 0
+
+
+def test_consecutive_failures_mark_down_until_a_probe_succeeds():
+    async def scenario():
+        client = make_client([None, None, None, 200])
+        states = []
+        for _ in range(3):
+            await client.check_health()
+            states.append(client.healthy)
+        with pytest.raises(OllamaUnavailableError):
+            client._ensure_available()
+        await client.check_health()
+        client._ensure_available()
+        return states, client.healthy
+
+    states, healthy = asyncio.run(scenario())
+    assert states == [None, None, False]
+    assert healthy is True
+
+
+def test_successful_request_resets_failure_count():
+    client = OllamaClient("http://ollama.test")
+    client.consecutive_health_failures = 2
+    client._acquire()
+    client._release(failed=False)
+    assert client.consecutive_health_failures == 0
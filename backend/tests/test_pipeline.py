@@ -0,0 +1,159 @@
+import asyncio
+import time
+import uuid
+from pathlib import Path
+
+import pytest
+
+from code_repair import RepairBudget
+from llm_cache import LLMResponseCache
+from speculative import SpeculativeConfig
+
+SCENE = "from manim import *\n\nclass A(Scene):\n    def construct(self):\n        self.play(Create(Circle()))"
+BROKEN_SCENE = SCENE.replace("Circle()", "Cirle()")
+
+
+def create_task(backend, prompt, options=None):
+    task_id = str(uuid.uuid4())
+    backend.task_store.create(task_id, {"status": backend.TaskStatus.PENDING, "prompt": prompt,
+                                        "options": options or {}})
+    return task_id
+
+
+def run_task(backend, prompt, options=None):
+    """Create a task and run its generation pipeline to the end."""
+    task_id = create_task(backend, prompt, options)
+    asyncio.run(backend.generate_animation(task_id, prompt, options or {}))
+    return backend.task_store.get(task_id)
+
+
+@pytest.fixture
+def logged(backend, monkeypatch):
+    """Attempts logged for training, by record id."""
+    records = {}
+
+    async def log_attempt(id, **fields):
+        records[id] = fields
+
+    monkeypatch.setattr(backend.data_collector, "log_attempt", log_attempt)
+    return records
+
+
+@pytest.fixture
+def renders(backend, monkeypatch):
+    """Replaces manim: code containing Cirle() fails like manim would, anything else renders in ``delay``."""
+    state = {"delay": 0.0, "codes": []}
+
+    async def render_pass(self, quality_flag, output_file, filename, prerendered):
+        state["codes"].append(self.code)
+        if "Cirle()" in self.code:
+            self.stdout, self.stderr = "", "NameError: name 'Cirle' is not defined"
+            raise backend.ManimRenderError("Manim error", self.stderr)
+        await asyncio.sleep(state["delay"])
+        return f"https://videos/{self.task_id}/{filename}"
+
+    monkeypatch.setattr(backend.AttemptRender, "render_pass", render_pass)
+    monkeypatch.setattr(backend, "render_cache", None)
+    monkeypatch.setattr(backend, "code_validator", None)
+    return state
+
+
+@pytest.fixture
+def placeholder(backend):
+    path = Path("static/placeholder.mp4")
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(b"video")
+    yield path
+    path.unlink()
+
+
+def test_fallback_prompt_with_quotes_serves_the_placeholder(backend, placeholder):
+    # The Ollama client isn't started, so generation falls back to the template,
+    # whose Text("...") call doesn't parse with a quote in the prompt
+    task = run_task(backend, 'Write "hello" on the screen')
+    assert task["used_fallback"] is True
+    assert task["status"] == backend.TaskStatus.COMPLETED
+    assert task["video_url"].endswith("/static/placeholder.mp4")
+
+
+def test_failure_before_code_is_generated_is_logged(backend, logged, monkeypatch):
+    async def generate_code(*args):
+        raise RuntimeError("system prompt unreadable")
+
+    monkeypatch.setattr(backend, "generate_code", generate_code)
+    monkeypatch.setattr(backend, "llm_cache", LLMResponseCache())
+    task_id = create_task(backend, "draw a circle")
+    asyncio.run(backend.generate_animation(task_id, "draw a circle", {}))
+    task = backend.task_store.get(task_id)
+    assert task["status"] == backend.TaskStatus.FAILED
+    assert task["error"] == "system prompt unreadable"
+    assert logged[task_id]["code"] == ""
+    assert logged[task_id]["task_data"]["error"] == "system prompt unreadable"
+
+
+def test_cached_completion_that_fails_is_invalidated(backend, logged, renders, monkeypatch):
+    cache = LLMResponseCache()
+    monkeypatch.setattr(backend, "llm_cache", cache)
+    monkeypatch.setattr(backend, "repair_budget", None)
+    with open(backend.SYSTEM_PROMPT_PATH) as f:
+        cache.put("draw a circle", f.read(), backend.ollama_client.model, BROKEN_SCENE)
+    task = run_task(backend, "draw a circle")
+    assert task["llm_cache_hit"] is True
+    assert task["status"] == backend.TaskStatus.FAILED
+    assert renders["codes"] == [BROKEN_SCENE]
+    assert cache.stats()["entries"] == 0
+
+
+def test_attempt_logs_record_the_configured_model(backend, logged, renders, placeholder, monkeypatch):
+    monkeypatch.setattr(backend.ollama_client, "model", "qwen2.5-coder:7b")
+    run_task(backend, "placeholder please")
+    monkeypatch.setattr(backend, "llm_cache", None)
+    monkeypatch.setattr(backend, "repair_budget", None)
+
+    async def generate_code(task_id, prompt, *args):
+        return backend.Generation(code=BROKEN_SCENE, llm_time=0.0)
+
+    monkeypatch.setattr(backend, "generate_code", generate_code)
+    run_task(backend, "failing render")
+    models = {record["generation_metadata"]["llm_config"]["model"] for record in logged.values()}
+    assert len(logged) == 2
+    assert models == {"qwen2.5-coder:7b"}
+
+
+def test_repair_deadline_bounds_the_repaired_render(backend, logged, renders, monkeypatch):
+    monkeypatch.setattr(backend, "llm_cache", None)
+    monkeypatch.setattr(backend, "repair_budget", RepairBudget(max_attempts=3, deadline_seconds=0.5))
+
+    async def request_repaired_code(*args, **kwargs):
+        return SCENE
+
+    monkeypatch.setattr(backend, "request_repaired_code", request_repaired_code)
+    renders["delay"] = 30.0
+    task_id = create_task(backend, "draw a circle")
+    generation = backend.Generation(code=BROKEN_SCENE, llm_time=0.0)
+    started = time.time()
+
+    async def scenario():
+        with pytest.raises(backend.ManimRenderError, match="repair deadline"):
+            await backend.render_with_repairs(task_id, "draw a circle", "system", {}, generation, Path("."),
+                                              None, started, lambda code, tokens: None)
+        await asyncio.gather(generation.upload, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert time.time() - started < 5
+    assert generation.attempt == 2
+    assert renders["codes"][-1] == SCENE
+
+
+def test_speculative_race_without_code_falls_back_to_the_template(backend, monkeypatch, tmp_path):
+    async def complete_manim_code(*args, **kwargs):
+        raise ConnectionError("Ollama went away")
+
+    monkeypatch.setattr(backend, "complete_manim_code", complete_manim_code)
+    monkeypatch.setattr(backend, "llm_cache", None)
+    monkeypatch.setattr(backend, "speculative_config", SpeculativeConfig(candidates=3))
+    task_id = create_task(backend, "draw a circle")
+    generation = asyncio.run(backend.generate_code(task_id, "draw a circle", "system", {}, tmp_path,
+                                                   tmp_path / "animation.mp4", lambda code, tokens: None))
+    assert generation.used_fallback is True
+    assert generation.code == backend.generate_manim_code("draw a circle")
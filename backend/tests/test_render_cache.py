@@ -0,0 +1,94 @@
+import time
+
+from render_cache import RenderCache
+
+SCENE = '''from manim import *
+
+class A(Scene):
+    def construct(self):
+        circle = Circle()
+        self.play(Create(circle))
+'''
+
+
+def make_cache(tmp_path, **kwargs):
+    return RenderCache(tmp_path / "render_cache.db", manim_version="0.19.0", **kwargs)
+
+
+def test_key_ignores_comments_whitespace_and_docstrings(tmp_path):
+    cache = make_cache(tmp_path)
+    reformatted = '''from manim import *
+
+
+class A(Scene):
+    """Draws a circle."""
+
+    def construct(self):
+        # the circle
+        circle = Circle()  # unit radius
+        self.play(Create(circle))
+'''
+    assert cache.key(reformatted, "-qh") == cache.key(SCENE, "-qh")
+
+
+def test_key_changes_with_code_quality_and_manim_version(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.key(SCENE, "-qh")
+    assert cache.key(SCENE.replace("Circle()", "Square()"), "-qh") != key
+    assert cache.key(SCENE.replace("Create(", "FadeIn("), "-qh") != key
+    assert cache.key(SCENE, "-ql") != key
+    assert RenderCache(tmp_path / "other.db", manim_version="0.18.1").key(SCENE, "-qh") != key
+
+
+def test_unparseable_code_still_gets_a_key(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.key("class A(:\n", "-qh") == cache.key("  class A(:  ", "-qh")
+
+
+def test_hit_and_miss(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.key(SCENE, "-qh")
+    assert cache.get(key) is None
+    cache.put(key, "https://cdn/a.mp4", 100)
+    assert cache.get(key) == "https://cdn/a.mp4"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+    assert (stats["entries"], stats["bytes"]) == (1, 100)
+
+
+def test_entries_survive_reopening(tmp_path):
+    make_cache(tmp_path).put("key", "https://cdn/a.mp4", 100)
+    assert make_cache(tmp_path).get("key") == "https://cdn/a.mp4"
+
+
+def test_evicts_least_recently_used_by_entry_count(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.put("one", "https://cdn/1.mp4", 1)
+    time.sleep(0.01)
+    cache.put("two", "https://cdn/2.mp4", 1)
+    time.sleep(0.01)
+    cache.get("one")
+    time.sleep(0.01)
+    cache.put("three", "https://cdn/3.mp4", 1)
+    assert cache.get("two") is None
+    assert cache.get("one") == "https://cdn/1.mp4"
+    assert cache.get("three") == "https://cdn/3.mp4"
+
+
+def test_evicts_by_total_size(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=250)
+    cache.put("one", "https://cdn/1.mp4", 100)
+    time.sleep(0.01)
+    cache.put("two", "https://cdn/2.mp4", 100)
+    time.sleep(0.01)
+    cache.put("three", "https://cdn/3.mp4", 100)
+    assert cache.get("one") is None
+    assert cache.stats()["bytes"] == 200
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = make_cache(tmp_path, max_age_seconds=60)
+    cache.put("key", "https://cdn/a.mp4", 100)
+    cache._conn().execute("UPDATE render_cache SET created_at = ?", (time.time() - 120,))
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
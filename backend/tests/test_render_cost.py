@@ -0,0 +1,54 @@
+from render_cost import BASE_COST, QUALITY_COST, TEX_COST, estimate_render_cost
+
+SIMPLE = (
+    "from manim import *\n"
+    "class Main(Scene):\n"
+    "    def construct(self):\n"
+    "        self.play(Create(Circle()), run_time=2)\n"
+    "        self.wait()\n"
+)
+
+
+def test_play_and_wait_add_up():
+    estimate = estimate_render_cost(SIMPLE)
+    assert estimate.play_calls == 1
+    assert estimate.wait_calls == 1
+    assert estimate.animation_seconds == 3.0
+    assert estimate.cost == BASE_COST + 3.0
+    assert estimate.to_dict()["animation_seconds"] == 3.0
+
+
+def test_quality_scales_the_animation_cost():
+    low = estimate_render_cost(SIMPLE, "-ql")
+    high = estimate_render_cost(SIMPLE, "-qh")
+    assert high.cost == BASE_COST + 3.0 * QUALITY_COST["-qh"]
+    assert high.cost > low.cost
+
+
+def test_loops_multiply_their_body():
+    code = (
+        "class Main(Scene):\n"
+        "    def construct(self):\n"
+        "        for i in range(5):\n"
+        "            self.play(FadeIn(MathTex('x')), run_time=0.5)\n"
+        "        for c in [RED, BLUE]:\n"
+        "            self.wait(1)\n"
+    )
+    estimate = estimate_render_cost(code)
+    assert estimate.play_calls == 5
+    assert estimate.tex_count == 5
+    assert estimate.animation_seconds == 4.5
+    assert estimate.cost == BASE_COST + 4.5 + 5 * TEX_COST
+
+
+def test_three_d_surfaces_make_frames_heavier():
+    flat = estimate_render_cost(SIMPLE)
+    code = SIMPLE.replace("(Scene)", "(ThreeDScene)").replace("Circle()", "Surface(f, resolution=(64, 64))")
+    estimate = estimate_render_cost(code)
+    assert estimate.three_d
+    assert estimate.surface_patches == 64 * 64
+    assert estimate.cost > flat.cost * 3
+
+
+def test_unparseable_code_has_no_estimate():
+    assert estimate_render_cost("class Main(Scene:\n") is None
@@ -0,0 +1,212 @@
+import asyncio
+
+import pytest
+
+from render_queue import QueueFullError, RenderQueue
+
+
+def test_admit_rejects_past_max_pending():
+    queue = RenderQueue(num_workers=1, max_pending=2)
+    queue.admit("a")
+    queue.admit("b")
+    with pytest.raises(QueueFullError):
+        queue.admit("c")
+    queue.release("a")
+    queue.admit("c")
+    queue.admit("d", force=True)
+    assert queue.stats()["admitted"] == 3
+
+
+def test_submit_requires_start():
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await RenderQueue().submit("a", lambda: asyncio.sleep(0))
+
+    asyncio.run(scenario())
+
+
+def test_fifo_runs_jobs_in_arrival_order():
+    async def scenario():
+        queue = RenderQueue(num_workers=1, policy="fifo")
+        await queue.start()
+        order = []
+
+        def job(name):
+            async def run():
+                order.append(name)
+                await asyncio.sleep(0.01)
+                return name
+            return run
+
+        results = await asyncio.gather(*(queue.submit(name, job(name)) for name in "abc"))
+        await queue.stop()
+        return order, results
+
+    order, results = asyncio.run(scenario())
+    assert order == ["a", "b", "c"]
+    assert results == ["a", "b", "c"]
+
+
+def test_job_exception_is_raised_to_the_caller():
+    async def scenario():
+        queue = RenderQueue(num_workers=1)
+        await queue.start()
+
+        async def fail():
+            raise ValueError("boom")
+
+        try:
+            with pytest.raises(ValueError, match="boom"):
+                await queue.submit("a", fail)
+            # The worker survives the failure
+            assert await queue.submit("b", lambda: asyncio.sleep(0, result="ok")) == "ok"
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def test_position_and_queue_info():
+    async def scenario():
+        queue = RenderQueue(num_workers=1, policy="fifo")
+        await queue.start()
+        release = asyncio.Event()
+        first = asyncio.create_task(queue.submit("a", release.wait))
+        second = asyncio.create_task(queue.submit("b", release.wait))
+        await asyncio.sleep(0.01)
+        positions = queue.position("a"), queue.position("b"), queue.position("missing")
+        info = queue.queue_info("b")
+        release.set()
+        await asyncio.gather(first, second)
+        await queue.stop()
+        return positions, info
+
+    positions, info = asyncio.run(scenario())
+    assert positions == (0, 1, None)
+    assert info["queue_position"] == 1
+    assert info["queue_depth"] == 1
+
+
+def test_cancelling_the_caller_cancels_the_running_job():
+    async def scenario():
+        queue = RenderQueue(num_workers=1)
+        await queue.start()
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def render():
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(queue.submit("a", render))
+        await started.wait()
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        # The worker is free for the next job straight away
+        result = await asyncio.wait_for(queue.submit("b", lambda: asyncio.sleep(0, result="next")), 1)
+        await queue.stop()
+        return result
+
+    assert asyncio.run(scenario()) == "next"
+
+
+def test_cancelling_a_waiting_caller_drops_its_job():
+    async def scenario():
+        queue = RenderQueue(num_workers=1)
+        await queue.start()
+        release = asyncio.Event()
+        ran = []
+
+        async def record():
+            ran.append("b")
+
+        first = asyncio.create_task(queue.submit("a", release.wait))
+        second = asyncio.create_task(queue.submit("b", record))
+        await asyncio.sleep(0.01)
+        second.cancel()
+        await asyncio.sleep(0)
+        depth = queue.stats()["queued"]
+        release.set()
+        await first
+        await asyncio.sleep(0.01)
+        await queue.stop()
+        return depth, ran
+
+    depth, ran = asyncio.run(scenario())
+    assert depth == 0
+    assert ran == []
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError, match="scheduling policy"):
+        RenderQueue(policy="lifo")
+
+
+async def run_behind_blocker(queue: RenderQueue, jobs: list[tuple[str, float, str]], pause: float = 0.0) -> list[str]:
+    """Queue (name, cost, flow) jobs while a blocker holds the only worker, then return the run order."""
+    await queue.start()
+    release = asyncio.Event()
+    order = []
+
+    def job(name):
+        async def run():
+            order.append(name)
+        return run
+
+    blocker = asyncio.create_task(queue.submit("blocker", release.wait, cost=1.0, flow="blocker"))
+    await asyncio.sleep(0.01)
+    waiting = []
+    for name, cost, flow in jobs:
+        waiting.append(asyncio.create_task(queue.submit(name, job(name), cost=cost, flow=flow)))
+        await asyncio.sleep(pause)
+    await asyncio.sleep(0.01)
+    release.set()
+    await asyncio.gather(blocker, *waiting)
+    await queue.stop()
+    return order
+
+
+def test_sjf_runs_the_cheapest_job_first():
+    queue = RenderQueue(num_workers=1, policy="sjf", aging=0.0)
+    order = asyncio.run(run_behind_blocker(queue, [("heavy", 50.0, "a"), ("light", 2.0, "b"), ("medium", 10.0, "c")]))
+    assert order == ["light", "medium", "heavy"]
+
+
+def test_sjf_aging_lets_a_heavy_job_run_eventually():
+    queue = RenderQueue(num_workers=1, policy="sjf", aging=1000.0)
+    order = asyncio.run(run_behind_blocker(queue, [("heavy", 20.0, "a"), ("light", 1.0, "b")], pause=0.05))
+    assert order == ["heavy", "light"]
+
+
+def test_wfq_interleaves_flows():
+    queue = RenderQueue(num_workers=1, policy="wfq")
+    jobs = [("a1", 1.0, "a"), ("a2", 1.0, "a"), ("a3", 1.0, "a"), ("b1", 1.0, "b")]
+    order = asyncio.run(run_behind_blocker(queue, jobs))
+    # b arrived last but doesn't wait behind all of a's backlog
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_estimated_wait_uses_the_cost_of_jobs_ahead():
+    async def scenario():
+        queue = RenderQueue(num_workers=2, policy="sjf", aging=0.0)
+        await queue.start()
+        release = asyncio.Event()
+        running = [asyncio.create_task(queue.submit(f"busy{i}", release.wait, cost=1.0)) for i in range(2)]
+        await asyncio.sleep(0.01)
+        waiting = [asyncio.create_task(queue.submit(name, release.wait, cost=cost))
+                   for name, cost in (("x", 4.0), ("y", 6.0), ("z", 30.0))]
+        await asyncio.sleep(0.01)
+        queue._seconds_per_cost = 0.5
+        info = queue.queue_info("z")
+        release.set()
+        await asyncio.gather(*running, *waiting)
+        await queue.stop()
+        return info
+
+    info = asyncio.run(scenario())
+    assert info["queue_position"] == 3
+    # (4 + 6) cost units ahead at 0.5s each, spread over two workers
+    assert info["estimated_wait_time"] == 2.5
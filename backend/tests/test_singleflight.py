@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight("test")
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(3)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert results == [("result", False), ("result", True), ("result", True)]
+    assert flight.stats() == {"in_flight": 0, "executions": 1, "coalesced": 2}
+
+
+def test_different_keys_and_later_calls_run_again():
+    async def scenario():
+        flight = SingleFlight("test")
+        await asyncio.gather(flight.do("a", lambda: asyncio.sleep(0)), flight.do("b", lambda: asyncio.sleep(0)))
+        await flight.do("a", lambda: asyncio.sleep(0))
+        return flight.stats()
+
+    assert asyncio.run(scenario())["executions"] == 3
+
+
+def test_exceptions_are_shared():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        return await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_work_continues_until_every_caller_is_cancelled():
+    async def scenario():
+        flight = SingleFlight("test")
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def work():
+            started.set()
+            try:
+                await asyncio.sleep(0.05)
+                return "done"
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        leader = asyncio.create_task(flight.do("key", work))
+        follower = asyncio.create_task(flight.do("key", work))
+        await started.wait()
+        leader.cancel()
+        assert await follower == ("done", True)
+        assert not cancelled.is_set()
+
+        started.clear()
+        first = asyncio.create_task(flight.do("other", work))
+        await started.wait()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,111 @@
+import asyncio
+
+from renderer import RenderResult
+from speculative import SpeculativeConfig, race_candidates
+
+OK = RenderResult(returncode=0, stdout="", stderr="")
+FAILED = RenderResult(returncode=1, stdout="", stderr="NameError: name 'Cirle' is not defined")
+
+
+def race(candidates, generate, validate, render, max_parallel_renders=3):
+    config = SpeculativeConfig(candidates=candidates, max_parallel_renders=max_parallel_renders)
+    return asyncio.run(race_candidates(config, generate, validate, render))
+
+
+def test_first_clean_render_wins_and_the_rest_are_cancelled():
+    cancelled = []
+
+    async def generate(candidate):
+        return f"code {candidate.index}"
+
+    async def render(candidate):
+        try:
+            await asyncio.sleep({0: 0.05, 1: 0.01, 2: 10}[candidate.index])
+        except asyncio.CancelledError:
+            cancelled.append(candidate.index)
+            raise
+        return OK
+
+    winner, candidates = race(3, generate, lambda code: None, render)
+    assert winner.index == 1
+    assert winner.code == "code 1"
+    assert winner.render_result is OK
+    assert [c.outcome for c in candidates] == ["cancelled", "won", "cancelled"]
+    assert sorted(cancelled) == [0, 2]
+
+
+def test_invalid_and_failed_candidates_lose_to_a_later_clean_one():
+    async def generate(candidate):
+        await asyncio.sleep(0.01 * candidate.index)
+        return f"code {candidate.index}"
+
+    async def render(candidate):
+        return FAILED if candidate.index == 1 else OK
+
+    winner, candidates = race(3, generate, lambda code: "unknown name" if code == "code 0" else None, render)
+    assert winner.index == 2
+    assert [(c.outcome, c.error) for c in candidates] == [
+        ("invalid", "unknown name"), ("render_failed", FAILED.stderr), ("won", None)
+    ]
+
+
+def test_candidates_still_generating_are_cancelled():
+    cancelled = []
+
+    async def generate(candidate):
+        if candidate.index == 0:
+            return "code 0"
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(candidate.index)
+            raise
+
+    async def render(candidate):
+        return OK
+
+    winner, candidates = race(3, generate, lambda code: None, render)
+    assert winner.index == 0
+    assert sorted(cancelled) == [1, 2]
+    assert [c.outcome for c in candidates[1:]] == ["cancelled", "cancelled"]
+    assert all(c.code is None for c in candidates[1:])
+
+
+def test_no_winner_when_every_candidate_fails():
+    async def generate(candidate):
+        if candidate.index == 0:
+            raise ConnectionError("Ollama went away")
+        return f"code {candidate.index}"
+
+    async def render(candidate):
+        return FAILED
+
+    winner, candidates = race(3, generate, lambda code: "syntax error" if code == "code 1" else None, render)
+    assert winner is None
+    assert [c.outcome for c in candidates] == ["llm_failed", "invalid", "render_failed"]
+    assert candidates[0].error == "ConnectionError: Ollama went away"
+
+
+def test_parallel_renders_are_limited():
+    running = 0
+    peak = 0
+
+    async def generate(candidate):
+        return f"code {candidate.index}"
+
+    async def render(candidate):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return FAILED
+
+    winner, _ = race(4, generate, lambda code: None, render, max_parallel_renders=2)
+    assert winner is None
+    assert peak == 2
+
+
+def test_candidates_get_spread_temperatures():
+    options = SpeculativeConfig(candidates=4, temperatures=(0.2, 0.8)).candidate_options()
+    assert [o["temperature"] for o in options] == [0.2, 0.8, 0.2, 0.8]
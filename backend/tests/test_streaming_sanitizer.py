@@ -0,0 +1,47 @@
+import pytest
+
+CODE = "from manim import *\n\nclass A(Scene):\n    def construct(self):\n        self.play(Create(Circle()))"
+
+
+def feed_all(backend, fragments):
+    sanitizer = backend.StreamingCodeSanitizer()
+    for fragment in fragments:
+        sanitizer.feed(fragment)
+    return sanitizer
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_fences_split_across_fragments(backend, size):
+    response = f"```python\n{CODE}\n```\nThis draws a circle."
+    sanitizer = feed_all(backend, [response[i:i + size] for i in range(0, len(response), size)])
+    assert sanitizer.complete
+    assert sanitizer.code == CODE
+    assert sanitizer.code == backend.sanitize_manim_code(f"```python\n{CODE}\n```")
+
+
+def test_leading_prose_is_stripped(backend):
+    sanitizer = feed_all(backend, ["Here is the animation you asked for:\n\n``", "`python\n", CODE, "\n``", "`"])
+    assert sanitizer.complete
+    assert sanitizer.code == CODE
+
+
+def test_partial_code_hides_an_unfinished_closing_fence(backend):
+    sanitizer = feed_all(backend, ["Sure!\n```python\n", CODE, "\n``"])
+    assert not sanitizer.complete
+    assert sanitizer.code == CODE
+
+
+def test_language_tag_split_across_fragments(backend):
+    sanitizer = feed_all(backend, ["```py", "thon", "\nfrom manim import *\n"])
+    assert sanitizer.code == "from manim import *"
+
+
+def test_fragments_after_the_block_are_ignored(backend):
+    sanitizer = feed_all(backend, [f"```python\n{CODE}\n```", "\n```python\nprint('more')\n```"])
+    assert sanitizer.code == CODE
+
+
+def test_unfenced_response_is_treated_as_code(backend):
+    sanitizer = feed_all(backend, [CODE[:20], CODE[20:]])
+    assert not sanitizer.complete
+    assert sanitizer.code == CODE
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from task_store import MemoryTaskStore, SQLiteTaskStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryTaskStore(ttl_seconds=60)
+    return SQLiteTaskStore(tmp_path / "tasks.db", ttl_seconds=60)
+
+
+def test_create_get_update_delete(store):
+    store.create("t1", {"status": "pending", "prompt": "circle"})
+    assert store.get("t1") == {"status": "pending", "prompt": "circle"}
+    assert store.update("t1", {"status": "processing"}) == {"status": "processing", "prompt": "circle"}
+    assert "t1" in store
+    store.delete("t1")
+    assert store.get("t1") is None
+    assert "t1" not in store
+
+
+def test_update_missing_task_returns_none(store):
+    assert store.update("missing", {"status": "failed"}) is None
+
+
+def test_get_returns_a_copy(store):
+    store.create("t1", {"status": "pending"})
+    store.get("t1")["status"] = "changed"
+    assert store.get("t1")["status"] == "pending"
+
+
+def test_compare_and_set(store):
+    store.create("t1", {"status": "processing", "owner": "a"})
+    assert store.update("t1", {"owner": "b"}, expect={"owner": "c"}) is None
+    assert store.get("t1")["owner"] == "a"
+    assert store.update("t1", {"owner": "b"}, expect={"owner": "a", "status": "processing"})["owner"] == "b"
+    # A second claim with the old owner loses
+    assert store.update("t1", {"owner": "c"}, expect={"owner": "a"}) is None
+
+
+def test_list_by_status(store):
+    store.create("t1", {"status": "pending"})
+    store.create("t2", {"status": "processing"})
+    store.create("t3", {"status": "completed"})
+    listed = sorted(task_id for task_id, _ in store.list_by_status(["pending", "processing"]))
+    assert listed == ["t1", "t2"]
+
+
+def test_evict_expired(store, monkeypatch):
+    store.create("old", {"status": "completed"})
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    store.create("new", {"status": "pending"})
+    assert store.evict_expired() == 1
+    assert store.get("old") is None
+    assert store.get("new") is not None
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    SQLiteTaskStore(tmp_path / "tasks.db").create("t1", {"status": "pending"})
+    assert SQLiteTaskStore(tmp_path / "tasks.db").get("t1") == {"status": "pending"}
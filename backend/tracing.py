@@ -0,0 +1,217 @@
+import asyncio
+import contextvars
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_span_ids = itertools.count(1)
+
+
+@dataclass
+class Span:
+    trace_id: str
+    name: str
+    parent_id: Optional[int]
+    # Which asyncio task the span ran in; concurrent spans are drawn on separate lanes
+    lane: int
+    start: float = field(default_factory=time.time)
+    end: Optional[float] = None
+    attributes: dict = field(default_factory=dict)
+    status: str = "ok"
+    span_id: int = field(default_factory=lambda: next(_span_ids))
+    # Set on root spans opened with start_trace, to restore the context on end_trace
+    token: Optional[contextvars.Token] = field(default=None, repr=False)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def chrome_event(self, now: float) -> dict:
+        end = self.end if self.end is not None else now
+        args = {**self.attributes, "status": self.status, "span_id": self.span_id, "parent_id": self.parent_id}
+        if self.end is None:
+            args["in_progress"] = True
+        return {
+            "name": self.name,
+            "cat": "pipeline",
+            "ph": "X",
+            "ts": round(self.start * 1e6),
+            "dur": round((end - self.start) * 1e6),
+            "pid": 1,
+            "tid": self.lane,
+            "args": args,
+        }
+
+
+@dataclass
+class _Trace:
+    spans: list[Span] = field(default_factory=list)
+    # asyncio task -> lane number, in order of first appearance
+    lanes: dict[int, int] = field(default_factory=dict)
+    lane_names: dict[int, str] = field(default_factory=dict)
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Records nested spans per task and exports them as Chrome trace JSON.
+
+    The current span lives in a context variable, so spans opened in
+    functions a task awaits, and in asyncio tasks it starts, nest under it
+    without being passed around. Outside a trace, ``span`` does nothing. The
+    files load in chrome://tracing, Perfetto or speedscope.
+    """
+
+    def __init__(self, export_dir: Optional[Path] = None, max_traces: int = 200):
+        self.export_dir = export_dir
+        self.max_traces = max_traces
+        self._traces: OrderedDict[str, _Trace] = OrderedDict()
+        self._lock = threading.Lock()
+        if export_dir is not None:
+            export_dir.mkdir(parents=True, exist_ok=True)
+
+    def _lane(self, trace: _Trace) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = id(task) if task is not None else threading.get_ident()
+        if key not in trace.lanes:
+            trace.lanes[key] = len(trace.lanes) + 1
+            trace.lane_names[trace.lanes[key]] = task.get_name() if task is not None else "thread"
+        return trace.lanes[key]
+
+    def _open(self, trace_id: str, name: str, parent: Optional[Span], attributes: dict) -> Span:
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None:
+                trace = self._traces[trace_id] = _Trace()
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            span = Span(trace_id=trace_id, name=name, parent_id=parent.span_id if parent else None,
+                        lane=self._lane(trace), attributes=attributes)
+            trace.spans.append(span)
+        return span
+
+    def start_trace(self, trace_id: str, name: str, **attributes) -> Span:
+        """Open the root span of a trace and make it current for the calling task.
+
+        Pair with ``end_trace``; for code that can't wrap its body in ``with``.
+        """
+        span = self._open(trace_id, name, None, attributes)
+        span.token = _current_span.set(span)
+        return span
+
+    def end_trace(self, span: Span, status: Optional[str] = None):
+        """Close a root span opened by start_trace and write the trace file."""
+        if span.token is not None:
+            try:
+                _current_span.reset(span.token)
+            except ValueError:
+                # Reset from a different context (e.g. a cancelled task's cleanup)
+                _current_span.set(None)
+        span.end = time.time()
+        if status is not None:
+            span.status = status
+        self.export(span.trace_id)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """Time the with-block as a child of the current span; yields None outside a trace."""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+        span = self._open(parent.trace_id, name, parent, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.status = "cancelled"
+            raise
+        except BaseException as e:
+            span.status = "error"
+            span.attributes.setdefault("error", f"{type(e).__name__}: {e}"[:500])
+            raise
+        finally:
+            span.end = time.time()
+            _current_span.reset(token)
+
+    def record(self, name: str, start: float, end: float, **attributes):
+        """Add an already finished span (e.g. time spent waiting) under the current span."""
+        parent = _current_span.get()
+        if parent is None:
+            return
+        span = self._open(parent.trace_id, name, parent, attributes)
+        span.start, span.end = start, end
+
+    def chrome_trace(self, trace_id: str) -> Optional[dict]:
+        """The trace in Chrome trace event format, from memory or the exported file."""
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is not None:
+                now = time.time()
+                events = [span.chrome_event(now) for span in trace.spans]
+                lane_names = dict(trace.lane_names)
+        if trace is None:
+            path = self._path(trace_id)
+            if path is None or not path.exists():
+                return None
+            return json.loads(path.read_text())
+        metadata = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": f"task {trace_id}"}}]
+        metadata += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": lane, "args": {"name": lane_name}}
+                     for lane, lane_name in lane_names.items()]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms", "otherData": {"trace_id": trace_id}}
+
+    def _path(self, trace_id: str) -> Optional[Path]:
+        if self.export_dir is None or "/" in trace_id or trace_id.startswith("."):
+            return None
+        return self.export_dir / f"{trace_id}.json"
+
+    def export(self, trace_id: str):
+        path = self._path(trace_id)
+        trace = self.chrome_trace(trace_id)
+        if path is None or trace is None:
+            return
+        try:
+            path.write_text(json.dumps(trace, default=str))
+        except OSError as e:
+            logger.warning(f"Failed to write trace {path}: {e}")
+
+    def evict_files(self, max_age_seconds: float) -> int:
+        """Delete exported traces older than max_age_seconds. Returns the number removed."""
+        if self.export_dir is None:
+            return 0
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for path in self.export_dir.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+def tracer_from_env() -> Tracer:
+    """Build the tracer; TRACE_DIR='' keeps traces in memory only."""
+    export_dir = os.getenv("TRACE_DIR", "./traces")
+    return Tracer(
+        export_dir=Path(export_dir) if export_dir else None,
+        max_traces=int(os.getenv("TRACE_MAX_IN_MEMORY", "200")),
+    )
+
+
+# Shared by every module that records spans; served by GET /tasks/{task_id}/trace
+tracer = tracer_from_env()
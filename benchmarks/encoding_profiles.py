@@ -0,0 +1,192 @@
+"""Encode time vs size vs quality of the upload encoding profiles.
+
+    python benchmarks/encoding_profiles.py --qualities -ql,-qh              # renders the corpus first
+    python benchmarks/encoding_profiles.py --videos backend/media/videos/*/animation.mp4
+
+Re-encodes each video with every profile in backend/encoding.py (or
+--profiles), the way the backend does before uploading, and reports per
+source quality and profile: CPU and wall time, speed relative to the clip's
+length, output size against the source, and SSIM/PSNR against the source.
+The recommended profile is the smallest output whose mean SSIM is at least
+--min-ssim within --cpu-budget CPU seconds per second of video. Without
+--videos the scene corpus of benchmarks/render.py is rendered at each of
+--qualities.
+"""
+import argparse
+import asyncio
+import json
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from render import ROOT, load_corpus, render_once  # noqa: E402
+
+sys.path.insert(0, str(ROOT / "backend"))
+
+from encoding import PROFILES, ClipStats, probe_clip  # noqa: E402
+from renderer import RenderLimits  # noqa: E402
+
+SSIM_RE = re.compile(r"SSIM .*All:([\d.]+)")
+PSNR_RE = re.compile(r"PSNR .*average:([\d.]+|inf)")
+
+
+@dataclass
+class Encode:
+    video: str
+    quality: str
+    profile: str
+    duration: float
+    source_bytes: int
+    output_bytes: Optional[int] = None
+    wall_seconds: Optional[float] = None
+    cpu_seconds: Optional[float] = None
+    ssim: Optional[float] = None
+    psnr: Optional[float] = None
+    error: Optional[str] = None
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure_quality(encoded: Path, source: Path, stats: ClipStats) -> tuple[Optional[float], Optional[float]]:
+    """SSIM and PSNR of encoded against source, scaled back to the source resolution."""
+    graph = (f"[0:v]scale={stats.width}:{stats.height},split[e1][e2];[1:v]split[s1][s2];"
+             f"[e1][s1]ssim;[e2][s2]psnr")
+    result = subprocess.run(["ffmpeg", "-v", "info", "-i", str(encoded), "-i", str(source),
+                             "-lavfi", graph, "-f", "null", "-"], capture_output=True, text=True)
+    ssim, psnr = SSIM_RE.search(result.stderr), PSNR_RE.search(result.stderr)
+    return (float(ssim.group(1)) if ssim else None,
+            float(psnr.group(1)) if psnr and psnr.group(1) != "inf" else None)
+
+
+def encode(video: Path, quality: str, profile_name: str, stats: ClipStats, workdir: Path) -> Encode:
+    result = Encode(str(video), quality, profile_name, stats.duration, video.stat().st_size)
+    output = workdir / f"{video.stem}-{profile_name}.mp4"
+    command = ["ffmpeg", "-v", "error", "-i", str(video), *PROFILES[profile_name].ffmpeg_args(stats), "-y",
+               str(output)]
+    cpu_before, start = children_cpu(), time.time()
+    process = subprocess.run(command, capture_output=True, text=True)
+    result.wall_seconds = round(time.time() - start, 3)
+    result.cpu_seconds = round(children_cpu() - cpu_before, 3)
+    if process.returncode != 0 or not output.exists():
+        result.error = (process.stderr.strip().splitlines() or ["no output"])[-1][:300]
+        return result
+    result.output_bytes = output.stat().st_size
+    result.ssim, result.psnr = measure_quality(output, video, stats)
+    output.unlink()
+    return result
+
+
+async def render_corpus(qualities: list[str], training_samples: int, workdir: Path) -> list[tuple[Path, str]]:
+    """Render the benchmark corpus at each quality; (video, quality) for every scene that rendered."""
+    scenes, _ = load_corpus(training_samples)
+    limits = RenderLimits(timeout_seconds=600, cpu_seconds=0, memory_bytes=0, output_bytes=0)
+    videos = []
+    for quality in qualities:
+        for scene in scenes:
+            run_dir = workdir / f"{len(videos)}"
+            run_dir.mkdir()
+            print(f"Rendering {scene.id} at {quality}", flush=True)
+            rendered = await render_once(scene, quality, limits, run_dir)
+            output = next(run_dir.glob("*/out.mp4"), None)
+            if rendered.status == "ok" and output is not None:
+                videos.append((output, quality))
+    return videos
+
+
+def summarize(encodes: list[Encode]) -> list[dict]:
+    rows = []
+    for quality, profile in dict.fromkeys((e.quality, e.profile) for e in encodes):
+        done = [e for e in encodes if e.quality == quality and e.profile == profile and e.error is None]
+        if not done:
+            continue
+        seconds_of_video = sum(e.duration for e in done) or 1e-9
+        ssims = [e.ssim for e in done if e.ssim is not None]
+        psnrs = [e.psnr for e in done if e.psnr is not None]
+        rows.append({
+            "quality": quality,
+            "profile": profile,
+            "clips": len(done),
+            "cpu_seconds": round(sum(e.cpu_seconds for e in done), 2),
+            "wall_seconds": round(sum(e.wall_seconds for e in done), 2),
+            # CPU seconds spent per second of video
+            "cpu_per_video_second": round(sum(e.cpu_seconds for e in done) / seconds_of_video, 3),
+            "size_ratio": round(sum(e.output_bytes for e in done) / sum(e.source_bytes for e in done), 3),
+            "mean_ssim": round(statistics.mean(ssims), 4) if ssims else None,
+            "min_ssim": round(min(ssims), 4) if ssims else None,
+            "mean_psnr": round(statistics.mean(psnrs), 2) if psnrs else None,
+        })
+    return rows
+
+
+def recommend(rows: list[dict], min_ssim: float, cpu_budget: float) -> dict[str, Optional[str]]:
+    """Per source quality, the profile with the smallest output that meets the quality floor and CPU budget."""
+    choices = {}
+    for quality in dict.fromkeys(row["quality"] for row in rows):
+        eligible = [row for row in rows if row["quality"] == quality
+                    and (row["mean_ssim"] or 0) >= min_ssim and row["cpu_per_video_second"] <= cpu_budget]
+        choices[quality] = min(eligible, key=lambda row: row["size_ratio"])["profile"] if eligible else None
+    return choices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=Path, nargs="*", help="Existing videos instead of rendering the corpus")
+    parser.add_argument("--qualities", default="-ql,-qh", help="Quality flags to render the corpus at")
+    parser.add_argument("--training-samples", type=int, default=10)
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Comma-separated profiles to compare")
+    parser.add_argument("--min-ssim", type=float, default=0.98)
+    parser.add_argument("--cpu-budget", type=float, default=1.0, help="CPU seconds per second of video")
+    parser.add_argument("--output", type=Path, help="Write every encode and the summary as JSON")
+    args = parser.parse_args()
+    profiles = args.profiles.split(",")
+    unknown = [name for name in profiles if name not in PROFILES]
+    if unknown:
+        parser.error(f"Unknown profiles: {', '.join(unknown)}")
+
+    encodes = []
+    with tempfile.TemporaryDirectory(prefix="manim-encode-bench-") as workdir:
+        if args.videos:
+            videos = [(path, "-") for path in args.videos]
+        else:
+            videos = asyncio.run(render_corpus(args.qualities.split(","), args.training_samples, Path(workdir)))
+        for video, quality in videos:
+            stats = asyncio.run(probe_clip(video))
+            if stats is None:
+                print(f"Skipping {video}: could not probe it")
+                continue
+            for profile in profiles:
+                result = encode(video, quality, profile, stats, Path(workdir))
+                print(f"{video.name} {quality} {profile}: " + (result.error or
+                      f"{result.cpu_seconds:.2f}s CPU, {result.output_bytes / result.source_bytes:.2f}x size, "
+                      f"SSIM {result.ssim}"), flush=True)
+                encodes.append(result)
+
+    rows = summarize(encodes)
+    print(f"\n{'quality':>7} {'profile':>10} {'clips':>5} {'cpu s':>8} {'cpu/vid s':>9} {'size':>6} "
+          f"{'ssim':>7} {'min':>7} {'psnr':>6}")
+    for row in rows:
+        print(f"{row['quality']:>7} {row['profile']:>10} {row['clips']:5d} {row['cpu_seconds']:8.2f} "
+              f"{row['cpu_per_video_second']:9.3f} {row['size_ratio']:6.3f} {row['mean_ssim'] or 0:7.4f} "
+              f"{row['min_ssim'] or 0:7.4f} {row['mean_psnr'] or 0:6.2f}")
+    choices = recommend(rows, args.min_ssim, args.cpu_budget)
+    for quality, profile in choices.items():
+        print(f"Cheapest profile for {quality}: {profile or 'none within the SSIM floor and CPU budget'}")
+    if args.output:
+        args.output.write_text(json.dumps({"encodes": [asdict(e) for e in encodes], "summary": rows,
+                                           "recommended": choices}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""Render benchmark over a fixed scene corpus, compared against a baseline.
+
+    python benchmarks/render.py --save-baseline          # on the reference setup
+    python benchmarks/render.py                          # after a manim/ffmpeg/config change
+
+Renders every scene in scenes/*.py, in-context-learning/eola-chapter3-clean.py
+and a fixed sample of generated code from the training data with the
+backend's renderer (manim CLI under render_sandbox.py) at a pinned quality,
+and records wall time, CPU time, peak RSS, frames per second and output size
+per scene. Files written for manimgl (``manimlib``/``manim_imports_ext``) are
+skipped. Results are compared with --baseline; exits with 1 when a scene got
+slower, bigger or hungrier than the thresholds allow, or stopped rendering.
+"""
+import argparse
+import ast
+import asyncio
+import hashlib
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+from renderer import RenderLimits, run_manim  # noqa: E402
+
+SCENE_FILES = sorted((ROOT / "scenes").glob("*.py")) + [ROOT / "in-context-learning" / "eola-chapter3-clean.py"]
+TRAINING_DIR = ROOT / "backend" / "training_data"
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "render_baseline.json"
+MANIMGL_IMPORTS = ("manimlib", "manim_imports_ext")
+
+
+@dataclass
+class BenchScene:
+    # Stable across runs: file:Scene, or training:<attempt id>:Scene
+    id: str
+    code: str
+    scene_name: str
+
+
+@dataclass
+class SceneResult:
+    id: str
+    status: str
+    wall_seconds: Optional[float] = None
+    cpu_seconds: Optional[float] = None
+    max_rss_bytes: Optional[int] = None
+    frames: Optional[int] = None
+    fps: Optional[float] = None
+    output_bytes: Optional[int] = None
+    error: Optional[str] = None
+
+
+def scene_classes(code: str) -> list[str]:
+    """Names of the classes in code that look renderable: a *Scene base and a construct method."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+    names = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        bases = [base.id if isinstance(base, ast.Name) else getattr(base, "attr", "") for base in node.bases]
+        has_construct = any(isinstance(item, ast.FunctionDef) and item.name == "construct" for item in node.body)
+        if has_construct and any(base.endswith("Scene") for base in bases):
+            names.append(node.name)
+    return names
+
+
+def uses_manimgl(code: str) -> bool:
+    return any(f"from {module} import" in code or f"import {module}" in code for module in MANIMGL_IMPORTS)
+
+
+def training_sample(count: int) -> list[tuple[str, str]]:
+    """(attempt id, code) of successfully rendered training attempts, a fixed sample by id hash."""
+    attempts = {}
+    for path in sorted(TRAINING_DIR.glob("generation_attempts_*.jsonl")):
+        with open(path) as f:
+            for line in f:
+                try:
+                    attempt = json.loads(line)
+                except ValueError:
+                    continue
+                if attempt.get("generated_code") and attempt.get("execution_outcome", {}).get("status") == "completed":
+                    attempts[attempt["id"]] = attempt["generated_code"]
+    # Hashing the ids keeps the sample the same as new attempts are logged, apart from additions
+    chosen = sorted(attempts, key=lambda attempt_id: hashlib.sha256(attempt_id.encode()).hexdigest())[:count]
+    return [(attempt_id, attempts[attempt_id]) for attempt_id in sorted(chosen)]
+
+
+def load_corpus(training_count: int) -> tuple[list[BenchScene], list[str]]:
+    """The scenes to render and the ids of files that were skipped."""
+    scenes, skipped, seen = [], [], set()
+    sources = [(str(path.relative_to(ROOT)), path.read_text()) for path in SCENE_FILES if path.exists()]
+    sources += [(f"training:{attempt_id}", code) for attempt_id, code in training_sample(training_count)]
+    for source, code in sources:
+        digest = hashlib.sha256(code.encode()).hexdigest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        if uses_manimgl(code):
+            skipped.append(f"{source} (manimgl)")
+            continue
+        names = scene_classes(code)
+        if not names:
+            skipped.append(f"{source} (no scene)")
+        scenes += [BenchScene(f"{source}:{name}", code, name) for name in names]
+    return scenes, skipped
+
+
+def probe_frames(video: Path) -> Optional[int]:
+    try:
+        output = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=nb_frames",
+             "-of", "default=noprint_wrappers=1:nokey=1", str(video)],
+            capture_output=True, text=True, timeout=30,
+        ).stdout.strip()
+        return int(output)
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+
+async def render_once(scene: BenchScene, quality: str, limits: RenderLimits, workdir: Path) -> SceneResult:
+    run_dir = Path(tempfile.mkdtemp(dir=workdir))
+    code_file = run_dir / "scene.py"
+    code_file.write_text(scene.code)
+    output_file = run_dir / "out.mp4"
+    result = await run_manim(code_file, quality, run_dir / "media", output_file, limits=limits,
+                             scene_name=scene.scene_name)
+    usage = result.resource_usage or {}
+    if result.returncode != 0 or not output_file.exists():
+        error = result.failure_reason or (result.stderr.strip().splitlines() or ["no output"])[-1]
+        return SceneResult(scene.id, "failed", error=error[:300])
+    frames = probe_frames(output_file)
+    wall = usage.get("wall_seconds")
+    return SceneResult(
+        scene.id, "ok",
+        wall_seconds=wall,
+        cpu_seconds=round(usage.get("cpu_user_seconds", 0) + usage.get("cpu_system_seconds", 0), 3),
+        max_rss_bytes=usage.get("max_rss_bytes"),
+        frames=frames,
+        fps=round(frames / wall, 2) if frames and wall else None,
+        output_bytes=output_file.stat().st_size,
+    )
+
+
+def combine(runs: list[SceneResult]) -> SceneResult:
+    """Median times over repeats; the first failure wins."""
+    failed = next((run for run in runs if run.status != "ok"), None)
+    if failed is not None:
+        return failed
+    median = lambda values: round(statistics.median(values), 3) if all(v is not None for v in values) else None
+    wall = median([run.wall_seconds for run in runs])
+    return SceneResult(
+        runs[0].id, "ok",
+        wall_seconds=wall,
+        cpu_seconds=median([run.cpu_seconds for run in runs]),
+        max_rss_bytes=max(run.max_rss_bytes or 0 for run in runs) or None,
+        frames=runs[0].frames,
+        fps=round(runs[0].frames / wall, 2) if runs[0].frames and wall else None,
+        output_bytes=runs[0].output_bytes,
+    )
+
+
+def version(command: list[str]) -> Optional[str]:
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, timeout=60).stdout
+        return output.strip().splitlines()[0] if output.strip() else None
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+
+def environment(quality: str) -> dict:
+    return {
+        "quality": quality,
+        "manim": version(["manim", "--version"]),
+        "ffmpeg": version(["ffmpeg", "-version"]),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], args) -> list[str]:
+    """Regressions of results against baseline, one line each."""
+    regressions = []
+    checks = [
+        ("wall_seconds", args.max_slowdown, args.min_delta_seconds),
+        ("cpu_seconds", args.max_slowdown, args.min_delta_seconds),
+        ("max_rss_bytes", args.max_rss_growth, 0),
+        ("output_bytes", args.max_size_growth, 0),
+    ]
+    for scene_id, before in baseline.items():
+        after = results.get(scene_id)
+        if after is None or before["status"] != "ok":
+            continue
+        if after["status"] != "ok":
+            regressions.append(f"{scene_id}: rendered in the baseline, now {after['status']}: {after.get('error')}")
+            continue
+        for metric, threshold, min_delta in checks:
+            old, new = before.get(metric), after.get(metric)
+            if not old or new is None:
+                continue
+            if new > old * (1 + threshold) and new - old > min_delta:
+                regressions.append(f"{scene_id}: {metric} {old:g} -> {new:g} (+{(new / old - 1) * 100:.0f}%, "
+                                   f"limit {threshold * 100:.0f}%)")
+    return regressions
+
+
+def print_table(results: list[SceneResult], baseline: dict[str, dict]):
+    print(f"\n{'scene':60} {'wall':>7} {'cpu':>7} {'rss MB':>7} {'fps':>7} {'KB':>8}  vs baseline")
+    for result in results:
+        if result.status != "ok":
+            print(f"{result.id[:60]:60} {result.status}: {result.error}")
+            continue
+        before = baseline.get(result.id, {})
+        change = ""
+        if before.get("wall_seconds") and result.wall_seconds:
+            change = f"{(result.wall_seconds / before['wall_seconds'] - 1) * 100:+.0f}% wall"
+        rss = f"{result.max_rss_bytes / 1024 ** 2:7.0f}" if result.max_rss_bytes else "      -"
+        fps = f"{result.fps:7.1f}" if result.fps else "      -"
+        print(f"{result.id[:60]:60} {result.wall_seconds or 0:7.2f} {result.cpu_seconds or 0:7.2f} {rss} {fps} "
+              f"{result.output_bytes / 1024:8.0f}  {change}")
+
+
+async def run(args, scenes: list[BenchScene]) -> list[SceneResult]:
+    limits = RenderLimits(timeout_seconds=args.timeout, cpu_seconds=0, memory_bytes=0, output_bytes=0)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="manim-bench-") as workdir:
+        for i, scene in enumerate(scenes, 1):
+            print(f"[{i}/{len(scenes)}] {scene.id}", flush=True)
+            runs = []
+            for _ in range(args.repeat):
+                runs.append(await render_once(scene, args.quality, limits, Path(workdir)))
+                if runs[-1].status != "ok":
+                    break
+            results.append(combine(runs))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quality", default="-ql", help="manim quality flag every scene is rendered at")
+    parser.add_argument("--repeat", type=int, default=3, help="Renders per scene; times are the median")
+    parser.add_argument("--training-samples", type=int, default=10, help="Generated programs from the training data")
+    parser.add_argument("--filter", help="Only scenes whose id contains this")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds before a render is stopped")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--output", type=Path, help="Write this run's results as JSON")
+    parser.add_argument("--max-slowdown", type=float, default=0.15, help="Allowed wall/CPU time growth")
+    parser.add_argument("--max-rss-growth", type=float, default=0.25, help="Allowed peak RSS growth")
+    parser.add_argument("--max-size-growth", type=float, default=0.10, help="Allowed output size growth")
+    parser.add_argument("--min-delta-seconds", type=float, default=0.5,
+                        help="Time differences below this are noise, whatever the ratio")
+    args = parser.parse_args()
+
+    scenes, skipped = load_corpus(args.training_samples)
+    if args.filter:
+        scenes = [scene for scene in scenes if args.filter in scene.id]
+    for source in skipped:
+        print(f"Skipping {source}")
+
+    env = environment(args.quality)
+    results = asyncio.run(run(args, scenes))
+    report = {"environment": env, "scenes": {result.id: asdict(result) for result in results}}
+
+    baseline = {}
+    if args.baseline.exists() and not args.save_baseline:
+        stored = json.loads(args.baseline.read_text())
+        baseline = stored["scenes"]
+        differences = {key: (stored["environment"].get(key), value) for key, value in env.items()
+                       if stored["environment"].get(key) != value}
+        for key, (old, new) in differences.items():
+            print(f"Warning: baseline {key} was {old!r}, now {new!r}")
+
+    print_table(results, baseline)
+    ok = [result for result in results if result.status == "ok"]
+    print(f"\n{len(ok)}/{len(results)} scenes rendered, {sum(r.wall_seconds or 0 for r in ok):.1f}s total wall time")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.save_baseline:
+        if args.filter and args.baseline.exists():
+            # A filtered run only replaces its own scenes
+            report["scenes"] = {**json.loads(args.baseline.read_text())["scenes"], **report["scenes"]}
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    regressions = compare(report["scenes"], baseline, args)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,18 @@ import FeedbackButtons from '@/components/FeedbackButtons';
 
 type GenerationStep = 'idle' | 'generating-code' | 'rendering-video' | 'completed';
 
+interface TaskStatus {
+  task_id: string;
+  status: 'pending' | 'processing' | 'completed' | 'failed' | 'cancelled';
+  stage?: string | null;
+  code?: string | null;
+  partial_code?: string | null;
+  video_url?: string | null;
+  preview_url?: string | null;
+  stream_url?: string | null;
+  error?: string | null;
+}
+
 export function ManimInterface() {
   const [userPrompt, setUserPrompt] = useState('');
   const [isLoading, setIsLoading] = useState(false);
@@ -55,11 +67,95 @@ export function ManimInterface() {
     }
   };
 
+  // Stop the backend work if the page is closed mid-generation
+  useEffect(() => {
+    if (!isLoading || !currentGenerationId) return;
+    const cancelOnLeave = () => {
+      fetch(`${apiBase}/tasks/${currentGenerationId}`, { method: 'DELETE', keepalive: true });
+    };
+    window.addEventListener('pagehide', cancelOnLeave);
+    return () => window.removeEventListener('pagehide', cancelOnLeave);
+  }, [isLoading, currentGenerationId, apiBase]);
+
+  const handleCancel = async () => {
+    if (!currentGenerationId) return;
+    try {
+      await fetch(`${apiBase}/tasks/${currentGenerationId}`, { method: 'DELETE' });
+    } catch (err) {
+      console.error('Failed to cancel generation:', err);
+    }
+  };
+
   const handleFeedback = (isPositive: boolean) => {
     console.log(`Feedback received: ${isPositive ? 'positive' : 'negative'} for generation ${currentGenerationId}`);
   };
 
-  const pollStatus = async (taskId: string) => {
+  const applyStatus = (status: TaskStatus) => {
+    if (status.preview_url && !status.video_url) {
+      // Play the low-quality preview while the requested quality renders
+      setVideoUrl(status.preview_url.startsWith('http') ? status.preview_url : `${apiBase}${status.preview_url}`);
+    } else if (status.stream_url && !status.video_url
+        && document.createElement('video').canPlayType('application/vnd.apple.mpegurl')) {
+      // Browsers with native HLS (Safari) can start on the segments published so far
+      setVideoUrl(status.stream_url.startsWith('http') ? status.stream_url : `${apiBase}${status.stream_url}`);
+    }
+    if (status.code) {
+      setGeneratedCode(status.code);
+      setCurrentStep('rendering-video');
+    } else if (status.partial_code) {
+      // Show the code as the model writes it
+      setGeneratedCode(status.partial_code);
+    }
+  };
+
+  // Resolve with the final status, using the SSE stream and falling back to polling if it fails
+  const waitForCompletion = (taskId: string) => new Promise<TaskStatus>((resolve, reject) => {
+    const isFinished = (status: TaskStatus) =>
+      status.status === 'completed' || status.status === 'failed' || status.status === 'cancelled';
+
+    const pollUntilDone = async () => {
+      try {
+        while (true) {
+          await new Promise(r => setTimeout(r, 1000));
+          const status = await pollStatus(taskId);
+          if (isFinished(status)) {
+            resolve(status);
+            return;
+          }
+        }
+      } catch (err) {
+        reject(err);
+      }
+    };
+
+    if (typeof EventSource === 'undefined') {
+      pollUntilDone();
+      return;
+    }
+
+    const source = new EventSource(`${apiBase}/status/${taskId}/stream`);
+    let finished = false;
+    const handleEvent = (event: MessageEvent) => {
+      const status = JSON.parse(event.data);
+      console.log('Stream update:', status);
+      applyStatus(status);
+      if (isFinished(status)) {
+        finished = true;
+        source.close();
+        resolve(status);
+      }
+    };
+    source.addEventListener('status', handleEvent as EventListener);
+    source.addEventListener('done', handleEvent as EventListener);
+    source.onerror = () => {
+      if (finished) return;
+      console.warn('Status stream failed, falling back to polling');
+      source.close();
+      pollUntilDone();
+    };
+  });
+
+  const pollStatus = async (taskId: string): Promise<TaskStatus> => {
     console.log(`Polling status for task ${taskId}`);
     const response = await fetch(`${apiBase}/status/${taskId}`);
     if (!response.ok) throw new Error('Failed to get generation status');
@@ -68,10 +164,7 @@ export function ManimInterface() {
     
     // FIX: Always update the code if it exists in the response
     // This ensures we always display the latest code
-    if (status.code) {
-      setGeneratedCode(status.code);
-      setCurrentStep('rendering-video');
-    }
+    applyStatus(status);
     
     return status;
   };
@@ -112,25 +205,24 @@ export function ManimInterface() {
       
       setCurrentGenerationId(task_id);
 
-      while (true) {
-        await new Promise(resolve => setTimeout(resolve, 1000));
-        const status = await pollStatus(task_id);
-        console.log('Poll response:', status);
-        
-        if (status.status === 'completed' && status.video_url) {
-          // Fix: Handle both relative and absolute URLs for videos
-          let fullVideoUrl = status.video_url;
-          if (!status.video_url.startsWith('http')) {
-            fullVideoUrl = `${apiBase}${status.video_url}`;
-          }
-          console.log('Video URL from status:', status.video_url);
-          console.log('Full video URL constructed:', fullVideoUrl);
-          setVideoUrl(fullVideoUrl);
-          setCurrentStep('completed');
-          break;
-        } else if (status.status === 'failed') {
-          throw new Error(status.error || 'Generation failed');
+      const status = await waitForCompletion(task_id);
+      console.log('Final status:', status);
+
+      if (status.status === 'completed' && status.video_url) {
+        // Fix: Handle both relative and absolute URLs for videos
+        let fullVideoUrl = status.video_url;
+        if (!status.video_url.startsWith('http')) {
+          fullVideoUrl = `${apiBase}${status.video_url}`;
         }
+        console.log('Video URL from status:', status.video_url);
+        console.log('Full video URL constructed:', fullVideoUrl);
+        setVideoUrl(fullVideoUrl);
+        setCurrentStep('completed');
+      } else if (status.status === 'cancelled') {
+        setVideoUrl('');
+        setCurrentStep('idle');
+      } else {
+        throw new Error(status.error || 'Generation failed');
       }
     } catch (err) {
       console.error('Error details:', err);
@@ -191,6 +283,14 @@ export function ManimInterface() {
                 style={{ width: `${getProgressPercentage(currentStep)}%` }}
               />
             </div>
+            <button
+              type="button"
+              onClick={handleCancel}
+              disabled={!currentGenerationId}
+              className="text-sm text-gray-600 hover:text-red-600 disabled:text-gray-300"
+            >
+              Cancel
+            </button>
           </div>
         )}
 
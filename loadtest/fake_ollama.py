@@ -0,0 +1,145 @@
+"""Stand-in for the Ollama API, for load testing without a model.
+
+    python loadtest/fake_ollama.py --port 11435 --latency 2 --tokens-per-second 40 \
+        --completions backend/training_data/generation_attempts_202501.jsonl
+
+Serves /api/version and /api/generate (streaming and not). Completions are
+replayed from training JSONL files (``generated_code`` for the matching
+``user_query``) or, for unknown prompts and repair requests, a canned scene.
+Latency is a lognormal time to first token around --latency, then tokens
+at --tokens-per-second.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+from pathlib import Path
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CANNED_SCENE = '''from manim import *
+
+class LoadTestScene(Scene):
+    def construct(self):
+        circle = Circle(radius={radius})
+        square = Square()
+        self.play(Create(circle))
+        self.play(Transform(circle, square))
+        self.wait()
+'''
+
+_REQUEST_RE = re.compile(r"User request: (.*?)\n\n", re.S)
+# Added by run.py so identical prompts aren't coalesced into one task
+_VARIANT_RE = re.compile(r"\s*\(variant \d+\)$")
+
+
+def load_completions(paths: list[Path]) -> dict[str, str]:
+    """Map normalized user queries to the code that was generated for them."""
+    completions = {}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    attempt = json.loads(line)
+                except ValueError:
+                    continue
+                query, code = attempt.get("user_query"), attempt.get("generated_code")
+                if query and code and attempt.get("execution_outcome", {}).get("status") == "completed":
+                    completions[" ".join(query.lower().split())] = code
+    return completions
+
+
+class FakeOllama:
+    def __init__(self, completions: dict[str, str], latency: float = 1.0, jitter: float = 0.5,
+                 tokens_per_second: float = 50.0, failure_rate: float = 0.0, model: str = "mistral"):
+        self.completions = completions
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.model = model
+        self.requests = 0
+
+    def answer(self, prompt: str) -> str:
+        match = _REQUEST_RE.search(prompt)
+        code = None
+        # Repair prompts get the canned scene, which always renders
+        if match and "Fix the error" not in prompt:
+            query = _VARIANT_RE.sub("", match.group(1))
+            code = self.completions.get(" ".join(query.lower().split()))
+        if code is None:
+            # A different radius per request, so renders aren't shared either
+            code = CANNED_SCENE.format(radius=1 + self.requests % 1000 / 1000)
+        return f"```python\n{code}```\nThis code creates the requested animation."
+
+    def first_token_delay(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        return random.lognormvariate(0, self.jitter) * self.latency if self.jitter else self.latency
+
+    def tokens(self, text: str) -> list[str]:
+        # Roughly four characters per token, like the real tokenizer
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def failed(self) -> Optional[JSONResponse]:
+        if self.failure_rate and random.random() < self.failure_rate:
+            return JSONResponse({"error": "injected failure"}, status_code=500)
+        return None
+
+    def app(self) -> FastAPI:
+        app = FastAPI(title="Fake Ollama")
+
+        @app.get("/api/version")
+        async def version():
+            return {"version": "0.0.0-loadtest"}
+
+        @app.post("/api/generate")
+        async def generate(request: Request):
+            body = await request.json()
+            self.requests += 1
+            await asyncio.sleep(self.first_token_delay())
+            failure = self.failed()
+            if failure is not None:
+                return failure
+            tokens = self.tokens(self.answer(body.get("prompt", "")))
+            token_delay = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+
+            if not body.get("stream", True):
+                await asyncio.sleep(token_delay * len(tokens))
+                return {"model": self.model, "response": "".join(tokens), "done": True}
+
+            async def stream():
+                for token in tokens:
+                    yield json.dumps({"model": self.model, "response": token, "done": False}) + "\n"
+                    await asyncio.sleep(token_delay)
+                yield json.dumps({"model": self.model, "response": "", "done": True}) + "\n"
+
+            return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=1.0, help="Median seconds to the first token")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Sigma of the lognormal latency")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--completions", type=Path, nargs="*", default=[],
+                        help="Training JSONL files to replay generated code from")
+    args = parser.parse_args()
+
+    fake = FakeOllama(load_completions(args.completions), latency=args.latency, jitter=args.jitter,
+                      tokens_per_second=args.tokens_per_second, failure_rate=args.failure_rate)
+    print(f"Fake Ollama on {args.host}:{args.port} with {len(fake.completions)} replayable completions")
+    uvicorn.run(fake.app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
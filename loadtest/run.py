@@ -0,0 +1,357 @@
+"""Offline load test: the backend against a fake Ollama and local storage.
+
+    python loadtest/run.py --pattern step --rates 0.1,0.2,0.5,1 --step-seconds 120 \
+        --prompts backend/training_data/*.jsonl --output report.json
+
+Starts loadtest/fake_ollama.py and the FastAPI app (with
+STORAGE_BACKEND=filesystem, so nothing reaches Spaces; renders use the
+local manim), sends /generate requests with the chosen arrival pattern,
+polls each task to completion and reads its trace for per-stage timings.
+Use --target to drive a backend that is already running instead.
+
+Patterns: ``poisson`` at --rate for --duration seconds; ``step`` runs a
+poisson phase per rate in --rates to find the saturation point; ``replay``
+reproduces the gaps between the ``timestamp``s of the prompt files, sped
+up by --speedup; ``burst`` sends --burst requests at once.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = ROOT / "backend"
+
+# Span names from the backend's traces that make up a task's stages
+STAGES = ("llm", "validate", "queue_wait", "render", "compress", "upload")
+# Fields that hold the user's request in the JSONL files we know about
+PROMPT_FIELDS = ("prompt", "user_query", "body", "title")
+
+DEFAULT_PROMPTS = [
+    "Show a circle turning into a square",
+    "Visualize the Pythagorean theorem",
+    "Animate a sine wave being drawn",
+    "Show the area under a parabola as a Riemann sum",
+    "Plot y = x^2 and its tangent line at x = 1",
+    "Show a vector being rotated by a 2x2 matrix",
+]
+
+
+@dataclass
+class Prompt:
+    text: str
+    timestamp: Optional[float] = None
+
+
+@dataclass
+class Result:
+    phase: str
+    prompt: str
+    sent_at: float
+    status: str = "pending"
+    # End to end, from POST /generate to the final status
+    latency: Optional[float] = None
+    stages: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def load_prompts(paths: list[Path]) -> list[Prompt]:
+    """Prompts from JSONL files (any of PROMPT_FIELDS) or text files (one per line)."""
+    prompts = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if path.suffix != ".jsonl":
+                    prompts.append(Prompt(line))
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                text = next((record[key] for key in PROMPT_FIELDS if isinstance(record.get(key), str)), None)
+                if not text:
+                    continue
+                timestamp = None
+                if record.get("timestamp"):
+                    try:
+                        timestamp = datetime.strptime(record["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+                    except ValueError:
+                        pass
+                prompts.append(Prompt(text, timestamp))
+    return prompts or [Prompt(text) for text in DEFAULT_PROMPTS]
+
+
+def percentile(values: list[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def stage_durations(trace: dict) -> dict[str, float]:
+    """Seconds spent in each stage, summed over the spans of a task's trace."""
+    durations: dict[str, float] = {}
+    for event in trace.get("traceEvents", []):
+        if event.get("ph") == "X" and event["name"] in STAGES:
+            durations[event["name"]] = durations.get(event["name"], 0.0) + event["dur"] / 1e6
+    return durations
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_until_up(url: str, processes: list[subprocess.Popen], timeout: float = 60):
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.time() < deadline:
+            if any(process.poll() is not None for process in processes):
+                raise RuntimeError("A load test service exited during startup")
+            try:
+                await client.get(url, timeout=2)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_services(args, workdir: Path) -> tuple[str, list[subprocess.Popen]]:
+    """Start the fake Ollama and the backend. Returns the backend URL and the processes."""
+    ollama_port, backend_port = free_port(), free_port()
+    completions = [str(p) for p in args.prompts if p.suffix == ".jsonl"]
+    ollama = subprocess.Popen(
+        [sys.executable, str(Path(__file__).parent / "fake_ollama.py"), "--port", str(ollama_port),
+         "--latency", str(args.llm_latency), "--tokens-per-second", str(args.tokens_per_second),
+         "--failure-rate", str(args.llm_failure_rate), "--completions", *completions],
+    )
+    env = {
+        **os.environ,
+        "OLLAMA_HOST": f"http://127.0.0.1:{ollama_port}",
+        "STORAGE_BACKEND": "filesystem",
+        "TASK_STORE": "memory",
+        "SYSTEM_PROMPT_PATH": str(BACKEND_DIR / "system_prompt.txt"),
+        "TRACE_DIR": str(workdir / "traces"),
+        # Load tests measure throughput, so every request should do the full work
+        "RENDER_CACHE": os.getenv("RENDER_CACHE", "false"),
+        "LLM_CACHE": os.getenv("LLM_CACHE", "false"),
+        "TASK_ABANDON_SECONDS": "0",
+    }
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend:app", "--app-dir", str(BACKEND_DIR),
+         "--host", "127.0.0.1", "--port", str(backend_port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    return f"http://127.0.0.1:{backend_port}", [ollama, backend]
+
+
+async def run_request(client: httpx.AsyncClient, prompt: str, phase: str, args) -> Result:
+    result = Result(phase=phase, prompt=prompt, sent_at=time.time())
+    try:
+        response = await client.post("/generate", json={
+            "prompt": prompt, "options": {"quality": args.quality, "resolution": "720p"},
+        })
+        if response.status_code == 503:
+            result.status = "rejected"
+            return result
+        response.raise_for_status()
+        task_id = response.json()["task_id"]
+
+        deadline = result.sent_at + args.request_timeout
+        while time.time() < deadline:
+            await asyncio.sleep(args.poll_interval)
+            status = (await client.get(f"/status/{task_id}")).json()
+            if status["status"] in ("completed", "failed", "cancelled"):
+                result.status = status["status"]
+                result.error = status.get("error")
+                break
+        else:
+            result.status = "timeout"
+            await client.delete(f"/tasks/{task_id}")
+        result.latency = time.time() - result.sent_at
+
+        trace = await client.get(f"/tasks/{task_id}/trace")
+        if trace.status_code == 200:
+            result.stages = stage_durations(trace.json())
+    except httpx.HTTPError as e:
+        result.status = "error"
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+def schedule(args, prompts: list[Prompt]) -> list[tuple[float, str, str]]:
+    """(seconds from start, phase name, prompt) for every request to send."""
+    rng = random.Random(args.seed)
+    pick = lambda: rng.choice(prompts).text
+    plan = []
+    if args.pattern == "burst":
+        return [(0.0, f"burst x{args.burst}", pick()) for _ in range(args.burst)]
+    if args.pattern == "replay":
+        timed = sorted((p for p in prompts if p.timestamp is not None), key=lambda p: p.timestamp)
+        if not timed:
+            raise SystemExit("--pattern replay needs prompt files with timestamps (e.g. training JSONL)")
+        start = timed[0].timestamp
+        return [((p.timestamp - start) / args.speedup, "replay", p.text) for p in timed[:args.max_requests]]
+
+    rates = [float(r) for r in args.rates.split(",")] if args.pattern == "step" else [args.rate]
+    phase_seconds = args.step_seconds if args.pattern == "step" else args.duration
+    for i, rate in enumerate(rates):
+        phase_start, t = i * phase_seconds, 0.0
+        while True:
+            t += rng.expovariate(rate)
+            if t >= phase_seconds:
+                break
+            plan.append((phase_start + t, f"{rate:g}/s", pick()))
+    return plan[:args.max_requests]
+
+
+def summarize(results: list[Result], phase_seconds: dict[str, float]) -> list[dict]:
+    phases = []
+    for phase in dict.fromkeys(r.phase for r in results):
+        batch = [r for r in results if r.phase == phase]
+        done = [r for r in batch if r.status == "completed"]
+        latencies = [r.latency for r in done]
+        seconds = phase_seconds.get(phase) or max(1e-9, max(r.sent_at for r in batch) - min(r.sent_at for r in batch))
+        summary = {
+            "phase": phase,
+            "sent": len(batch),
+            "offered_rate": round(len(batch) / seconds, 3),
+            "completed": len(done),
+            "failed": sum(r.status == "failed" for r in batch),
+            "rejected": sum(r.status == "rejected" for r in batch),
+            "timeouts": sum(r.status in ("timeout", "error") for r in batch),
+            # Completions over the span from the phase's first request to its last completion
+            "throughput": round(len(done) / max(1e-9, max(r.sent_at + r.latency for r in done)
+                                                - min(r.sent_at for r in batch)), 3) if done else 0.0,
+            "latency": {f"p{p}": percentile(latencies, p) for p in (50, 95, 99)},
+            "stages": {
+                stage: {f"p{p}": percentile([r.stages[stage] for r in done if stage in r.stages], p)
+                        for p in (50, 95, 99)}
+                for stage in STAGES
+            },
+        }
+        phases.append(summary)
+    return phases
+
+
+def saturation_point(phases: list[dict]) -> Optional[str]:
+    """First phase where the backend stopped keeping up: rejections, timeouts,
+    throughput under 90% of the offered rate, or p95 latency over twice the first phase's."""
+    baseline = phases[0]["latency"]["p95"] if phases else None
+    for phase in phases:
+        p95 = phase["latency"]["p95"]
+        if (phase["rejected"] or phase["timeouts"]
+                or phase["throughput"] < 0.9 * phase["offered_rate"]
+                or (baseline and p95 and p95 > 2 * baseline)):
+            return phase["phase"]
+    return None
+
+
+def fmt(value: Optional[float]) -> str:
+    return f"{value:7.2f}" if value is not None else "      -"
+
+
+def print_report(phases: list[dict], saturated: Optional[str]):
+    print(f"\n{'phase':>10} {'sent':>5} {'offered':>8} {'thruput':>8} {'ok':>4} {'fail':>4} {'rej':>4} {'t/o':>4}"
+          f"  {'p50':>7} {'p95':>7} {'p99':>7}")
+    for phase in phases:
+        latency = phase["latency"]
+        print(f"{phase['phase']:>10} {phase['sent']:5d} {phase['offered_rate']:8.3f} {phase['throughput']:8.3f} "
+              f"{phase['completed']:4d} {phase['failed']:4d} {phase['rejected']:4d} {phase['timeouts']:4d}  "
+              f"{fmt(latency['p50'])} {fmt(latency['p95'])} {fmt(latency['p99'])}")
+        for stage, stats in phase["stages"].items():
+            if stats["p50"] is not None:
+                print(f"{'':>10} {stage:>30}  {fmt(stats['p50'])} {fmt(stats['p95'])} {fmt(stats['p99'])}")
+    print(f"\nSaturation point: {saturated or 'not reached'}")
+
+
+async def drive(args, base_url: str, plan: list[tuple[float, str, str]]) -> list[Result]:
+    limits = httpx.Limits(max_connections=200, max_keepalive_connections=50)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+        start = time.time()
+        pending = []
+        for offset, phase, prompt in plan:
+            await asyncio.sleep(max(0.0, start + offset - time.time()))
+            pending.append(asyncio.create_task(run_request(client, prompt, phase, args)))
+        return await asyncio.gather(*pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="URL of a running backend; by default one is started with the fakes")
+    parser.add_argument("--prompts", type=Path, nargs="*", default=[], help="JSONL or text files of prompts")
+    parser.add_argument("--pattern", choices=("poisson", "step", "replay", "burst"), default="poisson")
+    parser.add_argument("--rate", type=float, default=0.2, help="Requests per second (poisson)")
+    parser.add_argument("--duration", type=float, default=120, help="Seconds to send for (poisson)")
+    parser.add_argument("--rates", default="0.05,0.1,0.2,0.5,1", help="Comma-separated rates (step)")
+    parser.add_argument("--step-seconds", type=float, default=120, help="Seconds per rate (step)")
+    parser.add_argument("--speedup", type=float, default=60, help="Time compression for replay")
+    parser.add_argument("--burst", type=int, default=20, help="Requests sent at once (burst)")
+    parser.add_argument("--max-requests", type=int, default=1000)
+    parser.add_argument("--allow-duplicates", action="store_true",
+                        help="Send repeated prompts as-is, so the backend may coalesce them")
+    parser.add_argument("--quality", default="low", choices=("low", "high"))
+    parser.add_argument("--request-timeout", type=float, default=900)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="Fake Ollama median seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    plan = schedule(args, load_prompts(args.prompts))
+    if not args.allow_duplicates:
+        plan = [(offset, phase, f"{prompt} (variant {i})") for i, (offset, phase, prompt) in enumerate(plan)]
+    print(f"Sending {len(plan)} requests over {plan[-1][0] if plan else 0:.0f}s ({args.pattern})")
+
+    processes = []
+    with tempfile.TemporaryDirectory(prefix="manim-loadtest-") as workdir:
+        try:
+            base_url = args.target
+            if base_url is None:
+                base_url, processes = start_services(args, Path(workdir))
+            asyncio.run(wait_until_up(f"{base_url}/health", processes))
+            results = asyncio.run(drive(args, base_url, plan))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+    phase_seconds = {}
+    if args.pattern in ("poisson", "step"):
+        for rate in (args.rates.split(",") if args.pattern == "step" else [str(args.rate)]):
+            phase_seconds[f"{float(rate):g}/s"] = args.step_seconds if args.pattern == "step" else args.duration
+    phases = summarize(results, phase_seconds)
+    # A burst or a replay has no steady offered rate to compare against
+    saturated = saturation_point(phases) if phase_seconds else None
+    print_report(phases, saturated)
+    if args.output:
+        args.output.write_text(json.dumps({
+            "args": {k: str(v) for k, v in vars(args).items()},
+            "phases": phases,
+            "saturation_point": saturated,
+            "requests": [r.__dict__ for r in results],
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()